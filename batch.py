@@ -0,0 +1,147 @@
+'''
+Batch runner: evaluates many scripts on a pool of worker processes, one per core unless told otherwise.
+
+    python batch.py scripts/           every file in the directory, in name order
+    python batch.py programs.jsonl     one program per line: {"id": ..., "source": "..."} or just "..."
+
+Each worker builds the parser once, when it starts (from the cached LALR tables), and keeps it, so a script
+costs one parse and one evaluation in whichever worker picks it up. Anything the evaluation prints is
+discarded. Results are written to stdout as JSON lines, in input order, or with --unordered as each script
+finishes:
+
+    {"id": "3", "value": 7, "error": null, "parse_ms": 0.21, "eval_ms": 0.05, "cached": false}
+
+value is an int, bool or string (an array is a list), and null when error says why the script failed.
+cached says the AST came from the on-disk cache (see astcache.py), so a second run over the same scripts
+skips parsing them.
+A summary goes to stderr. run_batch() is the same thing for callers that want Result objects.
+'''
+import os
+import sys
+import json
+import time
+import argparse
+import multiprocessing
+from contextlib import redirect_stdout
+from dataclasses import dataclass, asdict
+from functools import partial
+from pathlib import Path
+from typing import Any, Iterable, Iterator, List
+from lark.exceptions import LarkError
+from parser import get_ast_parser, front_end
+from astcache import ast_cache
+from interp import EvalError, Value, evaluate, blame, where
+from arrays import Array
+
+@dataclass
+class Result():
+    id: str
+    value: Any = None  # as JSON: int, bool, str or a list of them
+    error: str | None = None
+    parse_ms: float = 0.0
+    eval_ms: float = 0.0
+    cached: bool = False
+
+def as_json(v: Value) -> Any:
+    match v:
+        case bool() | int() | str():
+            return v
+        case Array(values):
+            return values.tolist()
+        case memoryview():
+            return v.tobytes().decode(errors="replace")
+        case _:
+            return str(v)
+
+def scripts(path: Path) -> List[tuple[str, str]]:
+    '''(id, source) pairs: a directory's files named by file name, a JSONL file's lines by "id" or line number.'''
+    if path.is_dir():
+        return [(f.name, f.read_text()) for f in sorted(path.iterdir()) if f.is_file()]
+    found = []
+    with open(path) as f:
+        for n, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            item = json.loads(line)
+            if isinstance(item, str):
+                found.append((str(n), item))
+            else:
+                found.append((str(item.get("id", n)), item["source"]))
+    return found
+
+def start_worker() -> None:
+    sys.stdout = open(os.devnull, "w")  # results travel back through the pool, not the worker's stdout
+    get_ast_parser()  # already built when forked from run_batch(); this is for pools started some other way
+
+def run_script(script: tuple[str, str], backend: str = "tree", typed: bool = False, level: int = 0) -> Result:
+    id, source = script
+    result = Result(id)
+    start = time.perf_counter()
+    hits = ast_cache.stats.hits
+    try:
+        ast, _ = front_end(source, level)
+        result.cached = ast_cache.stats.hits > hits
+    except LarkError as err:
+        result.error = f"parse error: {err}"
+        return result
+    except EvalError as err:  # the optimizer found a certain error, e.g. a literal division by zero
+        result.error = str(err)
+        return result
+    except Exception as err:  # e.g. RecursionError from a script nested too deeply: only this script fails
+        result.error = f"{type(err).__name__}: {err}"
+        return result
+    finally:
+        result.parse_ms = round((time.perf_counter() - start) * 1e3, 3)
+    start = time.perf_counter()
+    try:
+        result.value = as_json(evaluate(ast, backend, typed=typed))
+    except EvalError as err:
+        span = blame(err)
+        result.error = f"{err} (at {where(source, span)})" if span else str(err)
+    except Exception as err:  # one broken script must not take the batch down
+        result.error = f"{type(err).__name__}: {err}"
+    result.eval_ms = round((time.perf_counter() - start) * 1e3, 3)
+    return result
+
+def run_batch(batch: Iterable[tuple[str, str]], jobs: int | None = None, ordered: bool = True,
+              backend: str = "tree", typed: bool = False) -> Iterator[Result]:
+    '''Results for (id, source) scripts, evaluated on jobs worker processes (one per core by default).'''
+    batch = list(batch)
+    jobs = jobs or os.cpu_count() or 1
+    task = partial(run_script, backend=backend, typed=typed)
+    get_ast_parser()  # before forking, so the workers start with it built
+    if jobs == 1:  # no pool to start and feed
+        with open(os.devnull, "w") as devnull:
+            for script in batch:
+                with redirect_stdout(devnull):
+                    result = task(script)
+                yield result
+        return
+    chunk = max(1, min(64, len(batch) // (jobs * 8)))  # big enough to amortize the pipe, small enough to balance
+    # forked, so workers start with everything this process has imported
+    with multiprocessing.get_context("fork").Pool(jobs, initializer=start_worker) as pool:
+        results = pool.imap(task, batch, chunk) if ordered else pool.imap_unordered(task, batch, chunk)
+        yield from results
+
+def main(argv: List[str] | None = None) -> int:
+    args = argparse.ArgumentParser(description="Evaluate a directory or JSONL file of scripts on a process pool.")
+    args.add_argument("path", type=Path)
+    args.add_argument("--jobs", "-j", type=int, default=None, help="worker processes (default: one per core)")
+    args.add_argument("--backend", default="tree", choices=["tree", "compiled", "vm"])
+    args.add_argument("--typed", action="store_true", help="type-check every script before running it")
+    args.add_argument("--unordered", action="store_true", help="print results as they finish")
+    opts = args.parse_args(argv)
+    start = time.perf_counter()
+    count = errors = cached = 0
+    for result in run_batch(scripts(opts.path), opts.jobs, not opts.unordered, opts.backend, opts.typed):
+        print(json.dumps(asdict(result)), flush=opts.unordered)
+        count += 1
+        errors += result.error is not None
+        cached += result.cached
+    elapsed = time.perf_counter() - start
+    print(f"{count} scripts, {errors} failed, {cached} cached, {elapsed:.2f}s ({count / elapsed:.0f}/s) "
+          f"on {opts.jobs or os.cpu_count()} workers", file=sys.stderr)
+    return 1 if errors else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
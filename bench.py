@@ -0,0 +1,692 @@
+'''
+Benchmarks for the interpreter. Run all of them with `python bench.py`, or some with `python bench.py backends ...`.
+'''
+import sys
+from typing import Any, List
+import timeit
+import subprocess
+import statistics
+from pathlib import Path
+from dataclasses import fields, is_dataclass, make_dataclass
+from interp import Add, Sub, Lit, Name, Mul, Eq, Lt, Or, Not, And, If, Letfun, App, Expr, eval, resolve, emptyFrame
+from compiler import compile
+import vm
+
+#PROGRAMS
+def scaled_arith6(n: int) -> Expr:
+    '''letfun square(x) = x * x in square(1) + square(2) + ... + square(n) end'''
+    body = App(Name("square"), Lit(1))
+    for i in range(2, n + 1):
+        body = Add(body, App(Name("square"), Lit(i)))
+    return Letfun("square", Name("x"), Mul(Name("x"), Name("x")), body)
+
+def scaled_bool3(n: int) -> Expr:
+    '''letfun isEven(n) = n == 0 || !(n == 1) in isEven(2) && isEven(3) && ... && isEven(n + 1) end'''
+    fun = Or(Eq(Name("n"), Lit(0)), Not(Eq(Name("n"), Lit(1))))
+    body = App(Name("isEven"), Lit(2))
+    for i in range(3, n + 2):
+        body = And(body, App(Name("isEven"), Lit(i)))
+    return Letfun("isEven", Name("n"), fun, body)
+
+def countdown(n: int) -> Expr:
+    '''letfun loop(n) = if n == 0 then 0 else loop(n - 1) in loop(n) end'''
+    body = If(Eq(Name("n"), Lit(0)), Lit(0), App(Name("loop"), Sub(Name("n"), Lit(1))))
+    return Letfun("loop", Name("n"), body, App(Name("loop"), Lit(n)))
+
+def fib(n: int) -> Expr:
+    '''letfun fib(n) = if n < 2 then n else fib(n - 1) + fib(n - 2) in fib(n) end'''
+    call = lambda k: App(Name("fib"), Sub(Name("n"), Lit(k)))
+    body = If(Lt(Name("n"), Lit(2)), Name("n"), Add(call(1), call(2)))
+    return Letfun("fib", Name("n"), body, App(Name("fib"), Lit(n)))
+
+def balanced_source(n: int, terms: List[str], start: int = 0) -> str:
+    '''A source program of n terms joined by + and *, nested as a balanced tree so the parser's recursion stays shallow.'''
+    if n == 1:
+        return terms[start * 7919 % len(terms)].replace("#", str(start % 100))
+    half = n // 2
+    op = "+" if start % 2 else "*"
+    return f"({balanced_source(half, terms, start)} {op} {balanced_source(n - half, terms, start + half)})"
+
+#BENCHMARKS
+def report(label: str, seconds: float, runs: int, baseline: float | None = None) -> None:
+    line = f"  {label:<12} {seconds / runs * 1e3:9.3f} ms/run"
+    if baseline is not None:
+        line += f"  ({baseline / seconds:.1f}x)"
+    print(line)
+
+def bench_backends(n: int = 300, runs: int = 200) -> None:
+    '''Tree walker against the closure compiler and the bytecode VM on scaled-up test_arith6/test_bool3 programs.'''
+    for name, make in (("arith6", scaled_arith6), ("bool3", scaled_bool3)):
+        prog = resolve(make(n))
+        assert eval(prog) == compile(prog)(emptyFrame)
+        print(f"{name} x{n}:")
+        tree = timeit.timeit(lambda: eval(prog), number=runs)
+        report("tree", tree, runs)
+        code = compile(prog)
+        compiled = timeit.timeit(lambda: code(emptyFrame), number=runs)
+        report("compiled", compiled, runs, tree)
+        report("compile", timeit.timeit(lambda: compile(prog), number=runs), runs)
+        bytecode = vm.compile(make(n))
+        report("vm", timeit.timeit(lambda: vm.execute(bytecode), number=runs), runs, tree)
+
+def bench_tailcalls(n: int = 1_000_000) -> None:
+    '''A tail-recursive countdown; every backend runs it in constant Python stack.'''
+    print(f"countdown from {n}:")
+    prog = countdown(n)
+    resolved = resolve(prog)
+    code = compile(resolved)
+    bytecode = vm.compile(prog)
+    tree = timeit.timeit(lambda: eval(resolved), number=1)
+    report("tree", tree, 1)
+    report("compiled", timeit.timeit(lambda: code(emptyFrame), number=1), 1, tree)
+    report("vm", timeit.timeit(lambda: vm.execute(bytecode), number=1), 1, tree)
+
+def bench_startup(runs: int = 10) -> None:
+    '''Cold import-to-first-result latency of a fresh process, with and without the cached grammar tables.'''
+    import parser
+    here = Path(__file__).parent
+    cache = parser.grammar_cache(parser.GRAMMAR.read_text())
+
+    def once(code: str) -> float:
+        start = timeit.default_timer()
+        subprocess.run([sys.executable, "-c", code], cwd=here, check=True, capture_output=True)
+        return timeit.default_timer() - start
+
+    def median_ms(code: str, cold: bool) -> float:
+        times = []
+        for _ in range(runs):
+            if cold:
+                cache.unlink(missing_ok=True)
+            times.append(once(code))
+        return statistics.median(times) * 1e3
+
+    first = "import parser; parser.parse_and_run('1 + 2')"
+    print("startup (median of fresh processes):")
+    print(f"  {'python':<12} {median_ms('pass', False):9.1f} ms")
+    print(f"  {'import':<12} {median_ms('import parser, interp', False):9.1f} ms")
+    print(f"  {'uncached':<12} {median_ms(first, True):9.1f} ms")
+    print(f"  {'cached':<12} {median_ms(first, False):9.1f} ms")
+
+def footprint(root: Any) -> tuple[int, int, int]:
+    '''(tree positions, distinct objects, bytes) of an AST, counting each shared object once.'''
+    positions, seen, size = 0, set(), 0
+    todo = [root]
+    while todo:
+        node = todo.pop()
+        positions += 1
+        new = id(node) not in seen
+        if new:
+            seen.add(id(node))
+            size += sys.getsizeof(node)
+            if hasattr(node, "__dict__"):
+                size += sys.getsizeof(node.__dict__)
+        for f in fields(node):
+            v = getattr(node, f.name)
+            if is_dataclass(v):
+                todo.append(v)
+            elif new and isinstance(v, (list, tuple)):
+                size += sys.getsizeof(v)
+    return positions, len(seen), size
+
+def unslotted(root: Any) -> Any:
+    '''Rebuilds an AST out of plain, __dict__-based dataclasses with list fields, the way nodes used to be.'''
+    plain = {}
+    def convert(v):
+        if isinstance(v, tuple):
+            return list(v)
+        if not is_dataclass(v):
+            return v
+        cls = type(v)
+        if cls not in plain:
+            plain[cls] = make_dataclass(cls.__name__, [f.name for f in fields(cls)])
+        return plain[cls](*(convert(getattr(v, f.name)) for f in fields(v)))
+    return convert(root)
+
+def bench_memory(n: int = 20000) -> None:
+    '''Bytes per AST node for a large generated program: plain dataclasses, slotted nodes, and hash-consed nodes.'''
+    from parser import get_parser, ToExpr
+    terms = ["x", "(x + #)", "f(#)", "(x * 2 - #)", "(COM ls -la)", "(y < #)", "#", "f(x + y)"]
+    source = f"letfun f(x) = x * x in let x = 3 in let y = 4 in {balanced_source(n, terms)} end end end"
+    tree = get_parser().parse(source)
+    print(f"memory, {len(source)} bytes of source:")
+    for label, ast in (("plain", unslotted(ToExpr().transform(tree))),
+                       ("slotted", ToExpr().transform(tree)),
+                       ("hashcons", ToExpr(hashcons=True).transform(tree))):
+        positions, objects, size = footprint(ast)
+        print(f"  {label:<12} {objects:8} objects {size / 1024:9.1f} KiB {size / positions:7.1f} bytes/node")
+
+def bench_spawns() -> None:
+    '''Counts processes started per program: operands are evaluated once, and CSE shares identical commands.'''
+    from parser import get_parser, ToExpr
+    from interp import prepare
+    from pipeline import spawn_stats
+    cases = [
+        ("(COM echo hi) == (COM echo hi)", False, 2),
+        ("(COM echo hi) == (COM echo hi)", True, 1),
+        ("((COM echo a) == (COM echo b)) == ((COM echo a) == (COM echo b))", False, 4),
+        ("((COM echo a) == (COM echo b)) == ((COM echo a) == (COM echo b))", True, 2),
+        ("letfun f(x) = (COM echo hi) == (COM echo hi) in f(1) == f(2) end", True, 2),
+    ]
+    from builtin_commands import command_builtins
+    print("process spawns:")
+    command_builtins.enabled = False  # echo would not start a process at all
+    try:
+        for source, cse, expected in cases:
+            prog = prepare(ToExpr().transform(get_parser().parse(source)), cse)
+            before = spawn_stats.spawned
+            eval(prog)
+            spawned = spawn_stats.spawned - before
+            print(f"  {spawned} (expected {expected}) {'cse' if cse else '   '} {source}")  # checked by test_pipeline
+    finally:
+        command_builtins.enabled = True
+
+def bench_memo(n: int = 22) -> None:
+    '''Naive doubly recursive fib, plain and with pure letfun calls memoized.'''
+    from interp import prepare
+    from memo import evaluation
+    print(f"fib({n}):")
+    plain, memoized = prepare(fib(n)), prepare(fib(n), memo=True)
+    assert memoized.body.pure
+    tree = timeit.timeit(lambda: eval(plain), number=1)
+    report("tree", tree, 1)
+    with evaluation() as stats:
+        report("tree+memo", timeit.timeit(lambda: eval(memoized), number=1), 1, tree)
+    print(f"  {stats}")
+    compiled = compile(plain)
+    report("compiled", timeit.timeit(lambda: compiled(emptyFrame), number=1), 1, tree)
+    compiled = compile(memoized)
+    with evaluation():
+        report("comp+memo", timeit.timeit(lambda: compiled(emptyFrame), number=1), 1, tree)
+    assert eval(plain) == compiled(emptyFrame)
+
+def bench_cmdcache(runs: int = 50) -> None:
+    '''The same read-only command run repeatedly, uncached and through the command cache; editing its input invalidates it.'''
+    import os
+    import tempfile
+    from interp import Command
+    from cmdcache import command_cache
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "config")
+        Path(path).write_text("a=1\n")
+        prog = resolve(Command("cat", (), (path,)))
+        plain = timeit.timeit(lambda: eval(prog), number=runs)
+        command_cache.clear()
+        command_cache.enabled = True
+        try:
+            cached = timeit.timeit(lambda: eval(prog), number=runs)
+            Path(path).write_text("a=2\n")
+            changed = eval(prog)
+        finally:
+            command_cache.enabled = False
+    print(f"cat x{runs}:")
+    report("uncached", plain, runs)
+    report("cached", cached, runs, plain)
+    print(f"  {command_cache.stats}")
+    assert changed == "a=2" and command_cache.stats.misses == 2
+
+def bench_parallel(runs: int = 5) -> None:
+    '''Independent commands as operands, evaluated one after another and concurrently on the worker pool.'''
+    from contextlib import redirect_stdout
+    from interp import Command, prepare
+    from workers import worker_pool
+    nap = Command("sleep", (), ("0.1",))
+    ast = Eq(Eq(nap, nap), Eq(nap, nap))
+    plain, forked = prepare(ast), prepare(ast, parallel=True)
+    print(f"{ast}:")
+    with redirect_stdout(None):
+        assert eval(plain) == eval(forked)
+        sequential = timeit.timeit(lambda: eval(plain), number=runs)
+        concurrent = timeit.timeit(lambda: eval(forked), number=runs)
+        worker_pool.sequential = True
+        try:
+            forced = timeit.timeit(lambda: eval(forked), number=runs)
+        finally:
+            worker_pool.sequential = False
+    report("sequential", sequential, runs)
+    report("concurrent", concurrent, runs, sequential)
+    report("forced seq", forced, runs, sequential)
+
+def bench_async(scripts: int = 16, max_children: int = 8) -> None:
+    '''Many command scripts on one event loop with aeval, against running them one by one with eval.'''
+    import asyncio
+    from contextlib import redirect_stdout
+    from interp import Command
+    from asynceval import aeval
+    from pipeline import child_limit
+    nap = Command("sleep", (), ("0.05",))
+    prog = resolve(Eq(nap, nap))
+    child_limit.max_children = max_children
+
+    async def all_at_once() -> None:
+        await asyncio.gather(*(aeval(prog) for _ in range(scripts)))
+
+    with redirect_stdout(None):
+        blocking = timeit.timeit(lambda: [eval(prog) for _ in range(scripts)], number=1)
+        loop = timeit.timeit(lambda: asyncio.run(all_at_once()), number=1)
+    print(f"{scripts} scripts of two 50ms commands, at most {max_children} children:")
+    report("eval", blocking, 1)
+    report("aeval", loop, 1, blocking)
+
+def bench_jobs(n: int = 32, max_running: int = 8) -> None:
+    '''Many short background jobs through the job table, with a cap on how many run at once; none is left a zombie.'''
+    import os
+    from pipeline import Stage
+    from jobs import job_table
+    job_table.max_running = max_running
+    start = timeit.default_timer()
+    started = [job_table.submit([Stage(["sleep", "0.05"])]) for _ in range(n)]
+    for job in started:
+        job_table.wait(job.id)
+    elapsed = timeit.default_timer() - start
+    print(f"{n} jobs of 50ms, at most {max_running} at once:")
+    report("all done", elapsed, 1)
+    print(f"  {elapsed / 0.05 / (n / max_running):.2f}x the ideal wall time, "
+          f"{sum(job.cpu for job in started) * 1e3 / n:.2f} ms cpu per job")
+    zombies = subprocess.run(["ps", "-o", "stat=", "--ppid", str(os.getpid())], capture_output=True, text=True).stdout
+    assert "Z" not in zombies
+
+def bench_spawnrate(n: int = 500) -> None:
+    '''Spawns per second: through /bin/sh as Bg/RedirectErrorOut used to, Popen on an argv, and spawn().'''
+    from spawn import spawn, PIPE
+    argv = ["cat", "/dev/null"]  # not a shell builtin, so sh has to exec it too
+
+    def shell():
+        subprocess.run(" ".join(argv), shell=True, capture_output=True)
+
+    def popen():
+        subprocess.run(argv, capture_output=True)
+
+    def direct():
+        spawn(argv, stdout=PIPE, stderr=PIPE).communicate()
+
+    print(f"{n} x cat /dev/null:")
+    base = timeit.timeit(shell, number=n)
+    for label, f in (("sh -c", shell), ("Popen argv", popen), ("spawn", direct)):
+        seconds = base if f is shell else timeit.timeit(f, number=n)
+        report(label, seconds, n, base)
+        print(f"  {'':<12} {n / seconds:9.0f} spawns/s")
+
+def bench_builtins(runs: int = 200) -> None:
+    '''A few pipelines run by the in-process builtins against the real binaries (test_builtin_commands checks they agree).'''
+    import os
+    import tempfile
+    from contextlib import redirect_stdout
+    from pipeline import Stage, run_pipeline
+    from builtin_commands import command_builtins, run_stages
+    S = Stage
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as tmp:
+        os.chdir(tmp)
+        try:
+            Path("big").write_text("".join(f"line {i} of many words\n" for i in range(500)))  # under max_input
+            for stages in ([S(["echo", "hi"])], [S(["grep", "-c", "words"], stdin="big")],
+                           [S(["cat", "big"]), S(["grep", "-n", "9"]), S(["wc", "-l"])]):
+                assert run_stages(stages) is not None
+                print(f"{' | '.join(map(str, stages))} x{runs}:")
+                with redirect_stdout(None):
+                    command_builtins.enabled = False
+                    real = timeit.timeit(lambda: run_pipeline(stages), number=runs)
+                    command_builtins.enabled = True
+                    ours = timeit.timeit(lambda: run_stages(stages), number=runs)
+                report("processes", real, runs)
+                report("builtins", ours, runs, real)
+        finally:
+            command_builtins.enabled = True
+            os.chdir(cwd)
+
+def bench_redirect(lines: int = 2_000_000) -> None:
+    '''A large output redirected to a file and appended to it, against capturing it as a value, with peak RSS for each.'''
+    import os
+    import resource
+    import tempfile
+    from contextlib import redirect_stdout
+    from interp import Command, RedirectOut, Append, Filename, EvalError
+    from pipeline import capture_policy
+
+    def peak() -> float:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024  # MB; only ever grows, so capture goes last
+
+    seq = Command("seq", (), (str(lines),))
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "out")
+        base = peak()
+        with redirect_stdout(None):
+            redirect = timeit.timeit(lambda: eval(resolve(RedirectOut(seq, Filename(path)))), number=1)
+            appended = timeit.timeit(lambda: eval(resolve(Append(seq, Filename(path)))), number=1)
+            size = os.path.getsize(path)
+            streamed = peak()
+            captured = timeit.timeit(lambda: eval(resolve(seq)), number=1)
+            held = peak()
+            capture_policy.max_bytes = 1 << 20
+            try:
+                eval(resolve(seq))
+                capped = "not enforced"
+            except EvalError as err:
+                capped = str(err)
+            finally:
+                capture_policy.max_bytes = None
+            capture_policy.binary = True
+            try:
+                exact = eval(resolve(Command("printf", (), ("a \n\n",))))
+            finally:
+                capture_policy.binary = False
+    print(f"seq {lines} ({size // 2 / 1e6:.1f} MB), written then appended:")
+    report("> file", redirect, 1)
+    report(">> file", appended, 1)
+    report("as a value", captured, 1, redirect)
+    print(f"  peak rss grew {streamed - base:.1f} MB redirecting, {held - streamed:.1f} MB more capturing")
+    print(f"  capped at 1 MB: {capped}")
+    print(f"  binary capture of printf 'a \\n\\n': {bytes(exact)!r}")
+    assert size == 2 * len("".join(f"{i}\n" for i in range(1, lines + 1)))
+    assert capped.endswith("more than 1048576 bytes") and bytes(exact) == b"a \n\n"
+
+def bench_bigfile(size: int | None = None) -> None:
+    '''
+    COM wc -l < big, with big larger than physical memory by default: wc reads the descriptor it is given, and
+    our memory doesn't grow. Also the wc builtin forced onto the mmap'd file, which is why max_input keeps big
+    inputs away from it, and reading the whole file, as < used to, when that fits comfortably.
+    '''
+    import os
+    import resource
+    import tempfile
+    from contextlib import redirect_stdout
+    from interp import Command, RedirectIn, Filename
+    from builtin_commands import command_builtins
+    ram = os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES")
+    size = size or int(ram * 1.1)
+    line = b"x" * 63 + b"\n"
+    block = line * (1 << 14)  # 1 MB
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "big")
+        with open(path, "wb") as f:
+            for _ in range(size // len(block)):
+                f.write(block)
+        size = os.path.getsize(path)
+        expected = str(size // len(line))
+        prog = resolve(RedirectIn(Command("wc", ("-l",)), Filename(path)))  # an ID can't hold a path
+        print(f"wc -l < big ({size / 1e9:.2f} GB, {ram / 1e9:.2f} GB of RAM):")
+
+        def rss() -> float:
+            return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+        def timed() -> tuple[float, str]:
+            start = timeit.default_timer()
+            with redirect_stdout(None):
+                result = eval(prog)
+            return timeit.default_timer() - start, result
+
+        before = rss()
+        fd, real = timed()
+        grown = rss() - before
+        report("wc, fd stdin", fd, 1)
+        print(f"  {'':<12} {size / fd / 1e9:9.2f} GB/s, our peak rss grew {grown:.1f} MB")
+        limit, command_builtins.max_input = command_builtins.max_input, size
+        try:
+            scan, mapped = timed()
+        finally:
+            command_builtins.max_input = limit
+        report("builtin, mmap", scan, 1, fd)
+        print(f"  {'':<12} {size / scan / 1e9:9.2f} GB/s")
+        if size < ram // 4:
+            start = timeit.default_timer()
+            with open(path, "r") as f:
+                f.read()
+            report("read()", timeit.default_timer() - start, 1, fd)
+        else:
+            print("  read()        skipped, the file would not fit in memory")
+        assert real == mapped == expected, (real, mapped, expected)
+
+def bench_streams(n: int = 200_000) -> None:
+    '''take on an endless producer, which has to stop it, and fold over a large output, against capturing it whole.'''
+    import os
+    import resource
+    from contextlib import redirect_stdout
+    from parser import get_parser, ToExpr
+    from compiler import compile
+
+    def prog(source: str):
+        return resolve(ToExpr().transform(get_parser().parse(source)))
+
+    def rss() -> float:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+    endless = prog("take(10, lines(COM yes))")
+    total = prog(f"letfun add(acc) = letfun g(x) = acc + x in g end in fold(add, 0, lines(COM seq {n})) end")
+    whole = prog(f"COM seq {n}")
+    with redirect_stdout(None):
+        took = timeit.timeit(lambda: list(eval(endless)), number=10)
+        before = rss()
+        start = timeit.default_timer()
+        result = eval(total)
+        folded = timeit.default_timer() - start
+        streamed = rss() - before
+        start = timeit.default_timer()
+        assert compile(total)(emptyFrame) == result
+        compiled = timeit.default_timer() - start
+        start = timeit.default_timer()
+        eval(whole)
+        captured = timeit.default_timer() - start
+        held = rss() - before
+    children = subprocess.run(["ps", "-o", "stat=,comm=", "--ppid", str(os.getpid())], capture_output=True, text=True).stdout
+    print("take(10, lines(COM yes)):")
+    report("take", took, 10)
+    print(f"  children left: {children.count(chr(10)) - 1} (the ps above)")
+    print(f"fold(add, 0, lines(COM seq {n})) = {result}:")
+    report("fold, tree", folded, 1)
+    report("compiled", compiled, 1, folded)
+    report("capture", captured, 1)
+    print(f"  peak rss grew {streamed:.1f} MB folding, {held:.1f} MB once the whole output was captured")
+    assert result == n * (n + 1) // 2 and "yes" not in children
+
+def bench_arrays(n: int = 100_000) -> None:
+    '''Sum of the squares of 1..n: one NumPy call per operator on an array, against a scalar recursion.'''
+    from contextlib import redirect_stdout
+    from parser import get_parser, ToExpr
+    from interp import Let, ArrayLit, Sum
+
+    def prog(source: str):
+        return resolve(ToExpr().transform(get_parser().parse(source)))
+
+    scalar = prog(f"letfun go(i) = letfun step(acc) = if {n} < i then acc else go(i + 1)(acc + i * i) in step end "
+                  f"in go(1)(0) end")
+    parsed = prog(f"let x = array(COM seq {n}) in sum(x * x) end")
+    literal = resolve(Let("x", ArrayLit(tuple(range(1, n + 1))), Sum(Mul(Name("x"), Name("x")))))
+    expected = n * (n + 1) * (2 * n + 1) // 6
+    print(f"sum of squares of 1..{n}:")
+    start = timeit.default_timer()
+    assert eval(scalar) == expected
+    tree = timeit.default_timer() - start
+    report("scalar, tree", tree, 1)
+    code = compile(scalar)
+    start = timeit.default_timer()
+    assert code(emptyFrame) == expected
+    report("compiled", timeit.default_timer() - start, 1, tree)
+    with redirect_stdout(None):
+        assert eval(parsed) == expected
+        from_seq = timeit.timeit(lambda: eval(parsed), number=10)
+    report("array(seq)", from_seq, 10, tree * 10)
+    code = compile(literal)
+    assert code(emptyFrame) == expected
+    report("literal", timeit.timeit(lambda: code(emptyFrame), number=100), 100, tree * 100)
+
+def bench_typed(n: int = 300, runs: int = 200) -> None:
+    '''Compiled code of well-typed arithmetic programs, with the runtime type checks and without them.'''
+    from typecheck import check
+    for name, prog, times in ((f"arith6 x{n}", scaled_arith6(n), runs), (f"bool3 x{n}", scaled_bool3(n), runs),
+                              ("fib(20)", fib(20), 3), ("countdown(100000)", countdown(100_000), 3)):
+        prog = resolve(prog)
+        types = check(prog)
+        checked, unchecked = compile(prog), compile(prog, types=types)
+        assert eval(prog) == checked(emptyFrame) == unchecked(emptyFrame)
+        print(f"{name}:")
+        baseline = timeit.timeit(lambda: checked(emptyFrame), number=times)
+        report("checked", baseline, times)
+        report("unchecked", timeit.timeit(lambda: unchecked(emptyFrame), number=times), times, baseline)
+        report("check()", timeit.timeit(lambda: check(prog), number=times), times)
+
+def bench_batch(scripts: int = 1000, size: int = 60) -> None:
+    '''batch.run_batch throughput on pure-expression scripts, by number of worker processes.'''
+    import os
+    from batch import run_batch
+    from astcache import ast_cache
+    terms = ["x", "(x + #)", "f(#)", "(x * 2 - #)", "#", "f(x + 1)", "(x / (# + 1))"]
+    batch = [(str(i), f"letfun f(x) = x * x in let x = {i % 97} in {balanced_source(size, terms, i)} end end")
+             for i in range(scripts)]
+    cores = os.cpu_count() or 1
+    print(f"{scripts} scripts of {size} terms, {cores} cores:")
+    expected = None
+    baseline = 0.0
+    enabled = ast_cache.enabled
+    for jobs in sorted({1, 2, 4, cores}):
+        ast_cache.enabled = False  # every run parses everything, or the first would warm the cache for the rest
+        start = timeit.default_timer()
+        try:
+            results = list(run_batch(batch, jobs))
+        finally:
+            ast_cache.enabled = enabled
+        elapsed = timeit.default_timer() - start
+        assert all(r.error is None for r in results)
+        values = [r.value for r in results]
+        assert expected is None or values == expected
+        expected = values
+        baseline = baseline or elapsed
+        print(f"  {jobs:>2} workers  {scripts / elapsed:8.0f} scripts/s  ({baseline / elapsed:.2f}x)")
+
+def bench_astcache(scripts: int = 50, size: int = 400) -> None:
+    '''parser.front_end on large scripts: parsing every time against loading the AST from the on-disk cache.'''
+    import tempfile
+    import astcache
+    import parser
+    terms = ["x", "(x + #)", "f(#)", "(x * 2 - #)", "#", "f(x + 1)", "(x / (# + 1))"]
+    batch = [f"letfun f(x) = x * x in let x = {i % 97} in {balanced_source(size, terms, i)} end end"
+             for i in range(scripts)]
+    saved = parser.ast_cache
+    with tempfile.TemporaryDirectory() as tmp:
+        cache = parser.ast_cache = astcache.AstCache(Path(tmp))
+        try:
+            print(f"{scripts} scripts of {size} terms ({sum(map(len, batch)) // scripts} bytes each):")
+            for level in (0, 2):
+                cache.enabled = False
+                start = timeit.default_timer()
+                parsed = [parser.front_end(src, level)[0] for src in batch]
+                baseline = timeit.default_timer() - start
+                report(f"parse -O{level}", baseline, scripts)
+                cache.enabled = True
+                for src in batch:
+                    parser.front_end(src, level)  # cold: a miss and a write
+                start = timeit.default_timer()
+                loaded = [parser.front_end(src, level)[0] for src in batch]
+                report(f"cached -O{level}", timeit.default_timer() - start, scripts, baseline)
+                assert loaded == parsed
+            held = sum(f.stat().st_size for f in Path(tmp).glob("*.ast"))
+            print(f"  {held // len(list(Path(tmp).glob('*.ast')))} bytes per entry; {cache.stats}")
+        finally:
+            parser.ast_cache = saved
+
+def bench_parse(megabytes: float = 2.0) -> None:
+    '''A large generated script: parse tree then ToExpr (two passes) against ToExpr run inline by the LALR parser.'''
+    import gc
+    import tracemalloc
+    from parser import get_parser, get_ast_parser, ToExpr
+    terms = ["x", "(x + #)", "f(#)", "(x * 2 - #)", "#", "f(x + 1)", "(x / (# + 1))", "(COM ls -la)"]
+    source = f"letfun f(x) = x * x in let x = 3 in {balanced_source(int(megabytes * 1e6 / 13), terms)} end end"
+    get_parser(), get_ast_parser()
+    print(f"parse, {len(source) / 1e6:.1f} MB of source:")
+    baseline = 0.0
+    for label, parse in (("two-pass", lambda: ToExpr().transform(get_parser().parse(source))),
+                         ("inline", lambda: get_ast_parser().parse(source))):
+        gc.collect()
+        start = timeit.default_timer()
+        ast = parse()
+        seconds = timeit.default_timer() - start
+        del ast
+        gc.collect()
+        tracemalloc.start()  # a second run, since tracing slows allocation down
+        ast = parse()
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        del ast
+        baseline = baseline or seconds
+        print(f"  {label:<12} {len(source) / seconds / 1e3:9.0f} KB/s  ({baseline / seconds:.2f}x)  "
+              f"peak {peak / 2**20:7.1f} MiB")
+
+def bench_daemon(runs: int = 20, requests: int = 200) -> None:
+    '''Script latency: a fresh interpreter process, the client against a daemon, and requests under concurrent load.'''
+    import os
+    import time
+    import tempfile
+    import threading
+    import client
+    here = Path(__file__).parent
+    script = "let x = 6 in x * 7 end"
+
+    def median_ms(argv: List[str]) -> float:
+        times = []
+        for _ in range(runs):
+            start = timeit.default_timer()
+            subprocess.run(argv, cwd=here, check=True, capture_output=True)
+            times.append(timeit.default_timer() - start)
+        return statistics.median(times) * 1e3
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "expr.sock")
+        daemon = subprocess.Popen([sys.executable, "daemon.py", "--socket", path], cwd=here,
+                                  stderr=subprocess.DEVNULL)
+        try:
+            while not os.path.exists(path):  # the daemon is up once it has built the parser and bound the socket
+                assert daemon.poll() is None, "daemon failed to start"
+                time.sleep(0.01)
+            cold = f"import parser; parser.parse_and_run({script!r})"
+            print("latency of one script (median of fresh processes):")
+            print(f"  {'interpreter':<12} {median_ms([sys.executable, '-c', cold]):9.1f} ms")
+            print(f"  {'client':<12} {median_ms([sys.executable, 'client.py', '--socket', path, script]):9.1f} ms")
+            print(f"{requests} requests through client.request(), percentiles by concurrent clients:")
+            for clients in (1, 8, 32):
+                latencies: List[float] = []
+                def worker(n: int) -> None:
+                    for _ in range(n):
+                        start = timeit.default_timer()
+                        response = client.request(script, path=path)
+                        latencies.append(timeit.default_timer() - start)
+                        assert response["value"] == 42, response
+                threads = [threading.Thread(target=worker, args=(requests // clients,)) for _ in range(clients)]
+                start = timeit.default_timer()
+                for t in threads:
+                    t.start()
+                for t in threads:
+                    t.join()
+                elapsed = timeit.default_timer() - start
+                p50, p90, p99 = (statistics.quantiles(latencies, n=100)[i] * 1e3 for i in (49, 89, 98))
+                print(f"  {clients:>2} clients  p50 {p50:6.1f} ms  p90 {p90:6.1f} ms  p99 {p99:6.1f} ms  "
+                      f"{len(latencies) / elapsed:6.0f} requests/s")
+        finally:
+            daemon.terminate()
+            daemon.wait()
+
+BENCHMARKS = {
+    "backends": bench_backends,
+    "tailcalls": bench_tailcalls,
+    "startup": bench_startup,
+    "memory": bench_memory,
+    "spawns": bench_spawns,
+    "memo": bench_memo,
+    "cmdcache": bench_cmdcache,
+    "parallel": bench_parallel,
+    "async": bench_async,
+    "jobs": bench_jobs,
+    "spawnrate": bench_spawnrate,
+    "builtins": bench_builtins,
+    "redirect": bench_redirect,
+    "bigfile": bench_bigfile,
+    "streams": bench_streams,
+    "arrays": bench_arrays,
+    "typed": bench_typed,
+    "batch": bench_batch,
+    "astcache": bench_astcache,
+    "parse": bench_parse,
+    "daemon": bench_daemon,
+}
+
+if __name__ == "__main__":
+    for name in sys.argv[1:] or BENCHMARKS:
+        BENCHMARKS[name]()
@@ -0,0 +1,407 @@
+'''
+In-process versions of echo, cat, wc, head and grep, for the flags listed with each one.
+
+lookup(argv) returns a Program when argv is one of them with only supported flags, and None otherwise, in which
+case the caller starts the real binary as before; nothing else changes. A Program reads its input and writes
+its output as iterators of lines (bytes, each ending in a newline except maybe the last), so a pipeline made
+only of builtins hands lines from stage to stage without any OS pipe. Input files, named or redirected with <,
+are mmap'd (see Mapped) rather than read into memory. Output, messages and exit statuses follow
+GNU coreutils 9 and grep 3; bench.py builtins checks them against the real binaries on a corpus.
+
+Inputs larger than max_input bytes go to the real binaries, which are faster on them. Set EXPR_NO_BUILTINS=1
+(or command_builtins.enabled = False) to always start processes. One difference: a stage whose reader stops
+early (`cat big | head -n 1`) is simply stopped, where the real process would usually be killed by SIGPIPE.
+'''
+import os
+import io
+import sys
+import re
+import mmap
+import locale
+import itertools
+from dataclasses import dataclass
+from typing import Callable, IO, Iterable, Iterator, List
+from pipeline import Stage, PipelineResult, OutputLimitError
+
+type Lines = Iterator[bytes]
+
+@dataclass
+class Run():
+    '''One running builtin: where its messages go, and its exit status once its output has been read to the end.'''
+    name: str
+    stderr: IO[bytes]
+    status: int = 0
+
+    def error(self, message: str, status: int = 1) -> None:
+        self.stderr.write(f"{self.name}: {message}\n".encode())
+        self.status = status
+
+@dataclass
+class Program():
+    body: Callable[[Run, Iterable[bytes]], Lines]  # stdin, as lines, to output lines
+    needs_stdin: bool = False
+    inputs: tuple[str, ...] = ()  # the files it reads
+    stdin_size: int | None = None  # set when stdin is a regular file, to its size (wc's column width depends on it)
+
+REGISTRY: dict[str, Callable[[List[str]], Program | None]] = {}
+
+def builtin(name: str):
+    def register(parse: Callable[[List[str]], Program | None]):
+        REGISTRY[name] = parse
+        return parse
+    return register
+
+class Builtins:
+    def __init__(self, max_input: int = 16384):
+        self.enabled = os.environ.get("EXPR_NO_BUILTINS", "") in ("", "0")
+        self.max_input = max_input  # bytes; past roughly this much, a line at a time in Python loses to a process
+        self.runs = 0  # commands run in process instead of spawned
+
+    def lookup(self, argv: List[str], stdin: str | None = None) -> Program | None:
+        '''The builtin for argv, reading stdin (a file name) if given; None if argv needs the real binary.'''
+        if not self.enabled or argv[0] not in REGISTRY:
+            return None
+        program = REGISTRY[argv[0]](argv[1:])
+        if program is None:
+            return None
+        size = 0
+        for name in program.inputs + ((stdin,) if stdin is not None else ()):
+            try:
+                size += os.stat(name).st_size
+            except OSError:
+                pass  # the builtin reports it
+        return program if size <= self.max_input else None
+
+command_builtins = Builtins()
+
+class Mapped:
+    '''
+    An input file as a read-only buffer, mmap'd so that nothing is copied until a line is taken from it, and
+    iterable by lines like a file. buffer is None for what can't be mapped (empty files, pipes, devices).
+    '''
+    def __init__(self, path: str):
+        self.file = open(path, "rb")
+        try:
+            self.buffer: mmap.mmap | None = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        except (ValueError, OSError):
+            self.buffer = None
+
+    def __iter__(self) -> Lines:
+        if self.buffer is None:
+            yield from self.file
+            return
+        buf, start = self.buffer, 0
+        while start < len(buf):
+            end = buf.find(b"\n", start) + 1 or len(buf)
+            yield buf[start:end]
+            start = end
+
+    def count(self, byte: bytes, chunk: int = 1 << 20) -> int:
+        '''Occurrences of byte in the whole buffer, a chunk at a time.'''
+        return sum(self.buffer[i:i + chunk].count(byte) for i in range(0, len(self.buffer), chunk))
+
+    def close(self) -> None:
+        if self.buffer is not None:
+            self.buffer.close()
+        self.file.close()
+
+def file_lines(path: str) -> Lines:
+    source = Mapped(path)
+    try:
+        yield from source
+    finally:
+        source.close()
+
+def options(args: List[str], allowed: str) -> tuple[set[str], List[str]] | None:
+    '''Splits leading single-letter flags (combined or not) off args; None if one isn't allowed.'''
+    flags: set[str] = set()
+    i = 0
+    while i < len(args) and args[i].startswith("-") and args[i] != "-":
+        if args[i] == "--" or not set(args[i][1:]) <= set(allowed):
+            return None
+        flags |= set(args[i][1:])
+        i += 1
+    return flags, args[i:]
+
+#ECHO: -n, and -E (the default)
+@builtin("echo")
+def echo(args: List[str]) -> Program | None:
+    if args in (["--help"], ["--version"]):
+        return None
+    newline = True
+    while args and re.fullmatch(r"-[neE]+", args[0]):
+        if "e" in args[0]:
+            return None  # backslash escapes
+        newline = newline and "n" not in args[0]
+        args = args[1:]
+
+    def body(run: Run, stdin: Iterable[bytes]) -> Lines:
+        yield os.fsencode(" ".join(args)) + (b"\n" if newline else b"")
+    return Program(body)
+
+#CAT: no flags
+@builtin("cat")
+def cat(args: List[str]) -> Program | None:
+    if any(a.startswith("-") and a != "-" for a in args):
+        return None
+    files = args or ["-"]
+
+    def body(run: Run, stdin: Iterable[bytes]) -> Lines:
+        for name in files:
+            if name == "-":
+                yield from stdin
+                continue
+            try:
+                yield from file_lines(name)
+            except OSError as err:
+                run.error(f"{name}: {err.strerror}")
+    return Program(body, needs_stdin="-" in files, inputs=tuple(files))
+
+#WC: -l, -w, -c
+@builtin("wc")
+def wc(args: List[str]) -> Program | None:
+    parsed = options(args, "lwc")
+    if parsed is None:
+        return None
+    flags, files = parsed
+    shown = [c for c in "lwc" if c in flags] or ["l", "w", "c"]
+    names = files or ["-"]
+    program = Program(lambda run, stdin: body(run, stdin), needs_stdin="-" in names, inputs=tuple(files))
+
+    def width() -> int:
+        # GNU's rule: no padding for one count of one input; otherwise wide enough for the total size of the
+        # regular files, and at least 7 when an input isn't one
+        if len(shown) == 1 and len(names) == 1:
+            return 1
+        regular, minimum = 0, 1
+        for name in names:
+            if name == "-":
+                if program.stdin_size is not None:
+                    regular += program.stdin_size
+                else:
+                    minimum = 7
+                continue
+            try:
+                st = os.stat(name)
+            except OSError:
+                continue
+            if os.path.isfile(name):
+                regular += st.st_size
+            else:
+                minimum = 7
+        return max(len(str(regular)), minimum)
+
+    def line(counts: dict[str, int], w: int, name: str | None) -> bytes:
+        text = " ".join(str(counts[c]).rjust(w) for c in shown)
+        return os.fsencode(text + (f" {name}" if name is not None else "") + "\n")
+
+    def count(source: Iterable[bytes], counts: dict[str, int]) -> None:
+        if isinstance(source, Mapped) and source.buffer is not None and "w" not in shown:
+            counts["l"] = source.count(b"\n")
+            counts["c"] = len(source.buffer)
+            return
+        for chunk in source:
+            counts["l"] += chunk.count(b"\n")
+            counts["w"] += len(chunk.split())
+            counts["c"] += len(chunk)
+
+    def body(run: Run, stdin: Iterable[bytes]) -> Lines:
+        w = width()
+        total = {"l": 0, "w": 0, "c": 0}
+        for name in names:
+            counts = {"l": 0, "w": 0, "c": 0}
+            try:
+                if name == "-":
+                    count(stdin, counts)
+                else:
+                    source = Mapped(name)
+                    try:
+                        count(source, counts)
+                    finally:
+                        source.close()
+            except OSError as err:
+                run.error(f"{name}: {err.strerror}")
+                if not os.path.exists(name):
+                    continue
+            for c in total:
+                total[c] += counts[c]
+            yield line(counts, w, None if not files else name)
+        if len(names) > 1:
+            yield line(total, w, "total")
+    return program
+
+#HEAD: -n N
+@builtin("head")
+def head(args: List[str]) -> Program | None:
+    count = 10
+    if args[:1] == ["-n"]:
+        if len(args) < 2 or not args[1].isdigit():
+            return None
+        count, args = int(args[1]), args[2:]
+    if any(a.startswith("-") and a != "-" for a in args):
+        return None
+    files = args or ["-"]
+
+    def body(run: Run, stdin: Iterable[bytes]) -> Lines:
+        first = True
+        for name in files:
+            try:
+                source = stdin if name == "-" else open(name, "rb")
+            except IsADirectoryError as err:  # C's open() succeeds here, and the read fails after the header
+                source = iter(())
+                failed = f"error reading '{name}': {err.strerror}"
+            except OSError as err:
+                run.error(f"cannot open '{name}' for reading: {err.strerror}")
+                continue
+            else:
+                failed = ""
+            if len(files) > 1:
+                shown = "standard input" if name == "-" else name
+                yield f"{'' if first else chr(10)}==> {shown} <==\n".encode()
+                first = False
+            if failed:
+                run.error(failed)
+                continue
+            try:
+                for n, chunk in enumerate(source):
+                    if n == count:
+                        break
+                    yield chunk
+            finally:
+                if name != "-":
+                    source.close()
+    return Program(body, needs_stdin="-" in files, inputs=tuple(files))
+
+def sniff(lines: Iterable[bytes], size: int = 32768) -> tuple[bool, Lines]:
+    '''Like grep, calls an input binary when its first buffer has a NUL byte; returns that and its lines.'''
+    seen: List[bytes] = []
+    lines = iter(lines)
+    for chunk in lines:
+        seen.append(chunk)
+        size -= len(chunk)
+        if size <= 0:
+            break
+    lines = itertools.chain(seen, lines)
+    if not any(b"\0" in chunk for chunk in seen):
+        return False, lines
+    return True, (piece for chunk in lines for piece in chunk.split(b"\0"))  # NULs end lines too, in a binary file
+
+def printable(text: bytes) -> bool:
+    '''False for a line grep would not print as text: one that is not valid in the locale's encoding.'''
+    if locale.nl_langinfo(locale.CODESET) != "UTF-8":
+        return True
+    try:
+        text.decode("utf-8")
+        return True
+    except UnicodeDecodeError:
+        return False
+
+#GREP: -i, -v, -c, -n, -F, with a pattern that has no regex syntax (or -F)
+@builtin("grep")
+def grep(args: List[str]) -> Program | None:
+    parsed = options(args, "ivcnF")
+    if parsed is None or not parsed[1]:
+        return None
+    flags, (pattern, *files) = parsed
+    if "F" not in flags and re.search(r"[\\.\[\]*^$]", pattern):
+        return None  # a basic regular expression, not a fixed string
+    if "i" in flags and not pattern.isascii():
+        return None
+    needle = os.fsencode(pattern.lower() if "i" in flags else pattern)
+    names = files or ["-"]
+    prefix = len(names) > 1
+
+    def body(run: Run, stdin: Iterable[bytes]) -> Lines:
+        matched = False
+        for name in names:
+            shown = "(standard input)" if name == "-" else name
+            count = 0
+            try:
+                binary, source = sniff(stdin if name == "-" else file_lines(name))
+                for n, chunk in enumerate(source, 1):
+                    text = chunk.rstrip(b"\n")
+                    hit = needle in (text.lower() if "i" in flags else text)
+                    if hit == ("v" in flags):
+                        continue
+                    count += 1
+                    matched = True
+                    if "c" in flags:
+                        continue
+                    if binary or not printable(text):
+                        run.stderr.write(f"grep: {shown}: binary file matches\n".encode())
+                        break
+                    yield (f"{shown}:" if prefix else "").encode() + (f"{n}:" if "n" in flags else "").encode() + text + b"\n"
+            except OSError as err:
+                run.error(f"{name}: {err.strerror}", 2)
+                continue
+            if "c" in flags:
+                yield (f"{shown}:" if prefix else "").encode() + f"{count}\n".encode()
+        if run.status != 2:
+            run.status = 0 if matched else 1
+    return Program(body, needs_stdin="-" in names, inputs=tuple(files))
+
+#RUNNING
+def run_argv(argv: List[str]) -> tuple[bytes, bytes, int] | None:
+    '''Runs one command in process: (stdout, stderr, status), or None when the real binary has to do it.'''
+    program = command_builtins.lookup(argv)
+    if program is None or program.needs_stdin:  # a real process would read our own stdin
+        return None
+    err = io.BytesIO()
+    run = Run(argv[0], err)
+    out = b"".join(program.body(run, iter(())))
+    command_builtins.runs += 1
+    return out, err.getvalue(), run.status
+
+def run_stages(stages: List[Stage], capture: bool = True, stdout: IO | None = None,
+               limit: int | None = None) -> PipelineResult | None:
+    '''run_pipeline() for pipelines made only of builtins, with lines passed along as iterators; None otherwise.'''
+    if any(stage.stderr_in is not None for stage in stages):
+        return None
+    programs = [command_builtins.lookup(stage.argv, stage.stdin) for stage in stages]
+    if None in programs or (programs[0].needs_stdin and stages[0].stdin is None):
+        return None
+    runs: List[Run] = []
+    bodies: List[Lines] = []
+    files: List[IO | Mapped] = []
+    try:
+        upstream: Iterable[bytes] = iter(())
+        for stage, program in zip(stages, programs):
+            err = sys.stderr.buffer
+            if stage.stderr is not None:
+                err = open(stage.stderr, "wb")
+                files.append(err)
+            run = Run(stage.argv[0], err)
+            runs.append(run)
+            if stage.stdin is not None:
+                source = Mapped(stage.stdin)
+                files.append(source)
+                upstream = source  # the previous stage's output is dropped
+                if os.path.isfile(stage.stdin):
+                    program.stdin_size = os.path.getsize(stage.stdin)
+            upstream = program.body(run, upstream)
+            bodies.append(upstream)
+            if stage.stdout is not None:
+                with open(stage.stdout, stage.mode) as f:
+                    f.writelines(upstream)
+                upstream = iter(())  # the next stage reads nothing, like sh does after a redirect
+
+        result = PipelineResult()
+        if capture and stages[-1].stdout is None:
+            result.output = bytearray()
+            for chunk in upstream:
+                result.output += chunk
+                if limit is not None and len(result.output) > limit:
+                    raise OutputLimitError(limit)
+        elif stdout is not None:
+            stdout.writelines(upstream)
+        else:
+            sys.stdout.buffer.writelines(upstream)
+            sys.stdout.flush()
+    finally:
+        for body in bodies:
+            body.close()  # stops stages whose output was not read to the end
+        for f in files:
+            f.close()
+    command_builtins.runs += len(stages)
+    result.statuses = [run.status for run in runs]
+    return result
@@ -0,0 +1,101 @@
+'''
+Client for the interpreter daemon (daemon.py). It imports nothing but the standard library, so running a
+script through the daemon costs a Python startup and a round trip, not an import of Lark and a grammar load.
+
+    python client.py 'COM ls -la | COM grep py'
+    echo 'let x = 4 in x * x end' | python client.py -
+
+Scripts run in this shell's working directory and environment, and the daemon writes what they print
+straight to this process's stdout and stderr (the descriptors travel over the socket). request() is the
+same thing for callers that want the response instead.
+
+Messages both ways are a 4-byte big-endian length and then that many bytes of JSON. A request is
+{"source": ..., "backend": "tree", "typed": false, "level": 0, "cwd": ..., "env": {...}}, every key but
+source optional; the response has batch.Result's fields: value, error, parse_ms, eval_ms and cached,
+plus output (what the script printed, when its stdout was not passed along).
+'''
+import os
+import sys
+import json
+import socket
+import struct
+import argparse
+from typing import Any, List
+
+MAX_MESSAGE = 64 << 20  # larger lengths are taken to be garbage rather than allocated
+
+def socket_path() -> str:
+    '''$EXPR_SOCKET, else a socket in the user's runtime directory (or /tmp), private to them.'''
+    if path := os.environ.get("EXPR_SOCKET"):
+        return path
+    runtime = os.environ.get("XDG_RUNTIME_DIR")
+    return os.path.join(runtime, "expr.sock") if runtime else f"/tmp/expr-{os.getuid()}.sock"
+
+def frame(message: Any) -> bytes:
+    data = json.dumps(message).encode()
+    return struct.pack(">I", len(data)) + data
+
+def receive_exactly(sock: socket.socket, n: int, data: bytes = b"") -> bytes:
+    while len(data) < n:
+        chunk = sock.recv(min(n - len(data), 1 << 20))
+        if not chunk:
+            raise ConnectionError("connection closed in the middle of a message")
+        data += chunk
+    return data
+
+def receive(sock: socket.socket, start: bytes = b"") -> Any:
+    '''One message; start is whatever of it has already been read.'''
+    head = receive_exactly(sock, 4, start[:4])
+    (length,) = struct.unpack(">I", head)
+    if length > MAX_MESSAGE:
+        raise ValueError(f"message of {length} bytes is too large")
+    return json.loads(receive_exactly(sock, length, start[4:]))
+
+def request(source: str, backend: str = "tree", typed: bool = False, level: int = 0, cwd: str | None = None,
+            env: dict[str, str] | None = None, stdio: bool = False, path: str | None = None) -> dict:
+    '''
+    Runs source on the daemon and returns its response. cwd and env default to the daemon's own. With stdio
+    set, this process's stdin, stdout and stderr are handed over, and the script reads and writes them.
+    '''
+    message = {"source": source, "backend": backend, "typed": typed, "level": level}
+    if cwd is not None:
+        message["cwd"] = cwd
+    if env is not None:
+        message["env"] = env
+    data = frame(message)
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.connect(path or socket_path())
+        if stdio:
+            sys.stdout.flush()
+            sys.stderr.flush()
+            socket.send_fds(sock, [data[:4]], [0, 1, 2])  # the descriptors ride along with the length
+            sock.sendall(data[4:])
+        else:
+            sock.sendall(data)
+        return receive(sock)
+
+def main(argv: List[str] | None = None) -> int:
+    args = argparse.ArgumentParser(description="Run a script on the interpreter daemon.")
+    args.add_argument("source", help="the script, or - to read it from stdin")
+    args.add_argument("--backend", default="tree", choices=["tree", "compiled", "vm"])
+    args.add_argument("--typed", action="store_true", help="type-check the script before running it")
+    args.add_argument("-O", dest="level", type=int, default=0, help="optimization level")
+    args.add_argument("--socket", default=None, help=f"daemon socket (default: {socket_path()})")
+    opts = args.parse_args(argv)
+    source = sys.stdin.read() if opts.source == "-" else opts.source
+    try:
+        response = request(source, opts.backend, opts.typed, opts.level, os.getcwd(), dict(os.environ),
+                           stdio=opts.source != "-", path=opts.socket)  # a script read from stdin can't also use it
+    except (ConnectionError, FileNotFoundError) as err:
+        print(f"no daemon at {opts.socket or socket_path()} ({err}); start one with python daemon.py",
+              file=sys.stderr)
+        return 2
+    sys.stdout.write(response.get("output", ""))
+    if response["error"] is not None:
+        print(f"Evaluation error: {response['error']}", file=sys.stderr)
+        return 1
+    print(f"Result = {response['value']}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,106 @@
+'''
+Result cache for read-only commands, turned on with run(e, cache=True).
+
+A command's output is looked up under a digest of everything it can see that we can cheaply check: its argv,
+the working directory, the environment variables that change what programs print, the identity
+(inode, size, mtime, ctime) of the working directory and of every argument that names an existing file,
+and the capture policy the output was read back under (text or bytes, and the size limit).
+Editing, replacing or creating such a file changes the digest, so a stale entry is simply never found again
+and ages out. That is the only invalidation there is, so only hermetic runs are cached: a program on the
+allowlist, whose output depends on nothing but its argv and the contents of the regular files it names.
+A run that names a directory (whose entries' contents its identity does not cover), or that would read our
+stdin because it names no file, is not cached. ls and stat print metadata that changes without the digest
+changing, and anything that reads the clock or the network has to stay off the allowlist too.
+'''
+import os
+import hashlib
+from typing import Callable, List
+from dataclasses import dataclass
+from collections import OrderedDict
+from pipeline import capture_policy
+
+ALLOWLIST = frozenset({"echo", "cat", "grep", "head", "tail", "wc", "sort", "uniq", "cut", "tr"})
+NEEDS_FILE = ALLOWLIST - {"echo"}  # with no file to read, these read stdin
+ENVIRONMENT = ("PATH", "HOME", "LANG", "LC_ALL", "LC_CTYPE", "LC_COLLATE", "TZ")
+
+@dataclass
+class CacheStats():
+    hits: int = 0
+    misses: int = 0
+    evictions: int = 0
+    uncacheable: int = 0  # runs that are not hermetic
+    bytes: int = 0
+
+    def __str__(self) -> str:
+        total = self.hits + self.misses
+        rate = self.hits / total if total else 0.0
+        return (f"{self.hits} hits, {self.misses} misses ({rate:.0%} hit rate), {self.evictions} evictions, "
+                f"{self.uncacheable} uncacheable, {self.bytes} bytes held")
+
+def identity(path: str) -> tuple | None:
+    try:
+        st = os.stat(path)
+    except (OSError, ValueError):
+        return None
+    return (st.st_ino, st.st_size, st.st_mtime_ns, st.st_ctime_ns)
+
+def digest(argv: List[str]) -> str:
+    cwd = os.getcwd()
+    parts = (
+        tuple(argv),
+        capture_policy.binary, capture_policy.max_bytes,  # the same run read back as str, as bytes or cut off
+        cwd, identity(cwd),
+        tuple(os.environ.get(k) for k in ENVIRONMENT),
+        tuple(identity(a) for a in argv[1:]),  # None for flags and arguments that aren't files
+    )
+    return hashlib.sha256(repr(parts).encode()).hexdigest()
+
+def nbytes(output: str | memoryview) -> int:
+    return output.nbytes if isinstance(output, memoryview) else len(output.encode())
+
+class CommandCache:
+    '''LRU table of command outputs, bounded both by number of entries and by the total size of the outputs.'''
+    def __init__(self, max_entries: int = 1024, max_bytes: int = 16 << 20, allowlist: frozenset[str] = ALLOWLIST):
+        self.enabled = False
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.allowlist = allowlist
+        self.entries: OrderedDict[str, str] = OrderedDict()
+        self.stats = CacheStats()
+
+    def cacheable(self, argv: List[str]) -> bool:
+        program = os.path.basename(argv[0])
+        if program not in self.allowlist:
+            return False
+        if any(os.path.isdir(a) for a in argv[1:]):
+            return False
+        return program not in NEEDS_FILE or any(os.path.isfile(a) for a in argv[1:])
+
+    def run(self, argv: List[str], compute: Callable[[], tuple[str | memoryview, bool]]) -> str | memoryview:
+        '''compute() runs the command and returns (output, succeeded); failed runs are never stored.'''
+        if not self.cacheable(argv):
+            self.stats.uncacheable += 1
+            return compute()[0]
+        key = digest(argv)
+        if key in self.entries:
+            self.entries.move_to_end(key)
+            self.stats.hits += 1
+            return self.entries[key]
+
+        self.stats.misses += 1
+        output, ok = compute()
+        size = nbytes(output)
+        if ok and size <= self.max_bytes:
+            self.entries[key] = output
+            self.stats.bytes += size
+            while len(self.entries) > self.max_entries or self.stats.bytes > self.max_bytes:
+                _, old = self.entries.popitem(last=False)
+                self.stats.bytes -= nbytes(old)
+                self.stats.evictions += 1
+        return output
+
+    def clear(self) -> None:
+        self.entries.clear()
+        self.stats = CacheStats()
+
+command_cache = CommandCache()
@@ -0,0 +1,320 @@
+'''
+Closure-compilation backend. compile() walks a resolved AST once and turns every node into a Python
+closure that does only the work left for that node at run time: the match on the node type, the
+unpacking of its fields and the dispatch on literal operands all happen here, ahead of time.
+The closures behave exactly like interp.eval, error messages included. Shell nodes are handed
+back to interp.eval, since spawning the process dwarfs any dispatch cost. Given the types that
+typecheck.check() inferred, operators whose operands are proven ints or bools leave out their checks.
+'''
+from typing import Callable
+from interp import (Add, Sub, Mul, Div, Neg, Lit, And, Or, Not, Name, Local, Let, Eq, Lt, If, Letfun, App, Block, Memo,
+                    ArrayLit, ToArray, Sum, Max, Count, Array, Closure, EvalError, Expr, Frame, Value, eval, newFrame,
+                    array_of, to_array, vector, reduce_array)
+from memo import memoizing
+from typecheck import Typing, INT, BOOL
+
+type Code = Callable[[Frame[Value]], Value]
+
+def constant(e: Expr) -> tuple[bool, Value]:
+    '''Returns (True, value) when e is an int or bool literal whose value is known right now.'''
+    match e:
+        case Lit(bool(b)):
+            return True, b
+        case Lit(int(i)):
+            return True, i
+        case _:
+            return False, None
+
+class TailCall:
+    '''
+    Returned by a call in tail position instead of making the call; the nearest non-tail call runs it.
+    check is set by a && or || whose right operand the call is: the error raised if the value is not a bool.
+    '''
+    __slots__ = ("closure", "frame", "check")
+    def __init__(self, closure: Closure, frame: Frame[Value]):
+        self.closure = closure
+        self.frame = frame
+        self.check: str | None = None
+
+def operand(rv: Value, error: str) -> Value:
+    '''The right operand of && or ||: a bool, or a tail call that has to give one.'''
+    if type(rv) is TailCall:
+        rv.check = rv.check or error  # one made further in reports its own operator
+        return rv
+    if not isinstance(rv, bool):
+        raise EvalError(error)
+    return rv
+
+def enter(fun: Value, arg: Value) -> tuple[Closure, Frame[Value]]:
+    if not isinstance(fun, Closure):
+        raise EvalError("Application of a non-function!")
+    frame = newFrame(fun.size, fun.env)
+    frame.slots[0] = arg
+    return fun, frame
+
+def call(fun: Closure, frame: Frame[Value], memo: bool = True) -> Value:
+    # trampoline: tail calls inside the body come back here instead of growing the Python stack
+    check = None  # once the value is the right operand of a && or ||, what to raise if it is not a bool
+    while True:
+        if fun.pure and memo and (table := memoizing()) is not None:
+            # the result has to be stored, so this call (tail or not) runs to completion here
+            c, fr = fun, frame
+            result = table.call(c, fr.slots[0], lambda: call(c, fr, False))
+        elif fun.code is None:  # made by the tree walker
+            result = eval(fun.body, frame)
+        else:
+            result = fun.code(frame)
+            if type(result) is TailCall:
+                fun, frame, memo = result.closure, result.frame, True
+                check = result.check or check
+                continue
+        if check is not None and not isinstance(result, bool):
+            raise EvalError(check)
+        return result
+
+def proven(types: Typing | None, t, *nodes: Expr) -> bool:
+    return types is not None and types.unchecked(t, *nodes)
+
+def compile(e: Expr, tail: bool = False, types: Typing | None = None) -> Code:
+    '''
+    Compiles e; with tail set, a call in tail position returns a TailCall for the caller to run.
+    types, from typecheck.check(e), lets operators whose operand types are proven skip their runtime checks.
+    '''
+    match e:
+        case Lit(_):
+            known, v = constant(e)
+            if known:
+                return lambda f: v
+            return lambda f: eval(e, f)  # unsupported literals fail at run time, like in eval
+
+        case Local(_, 0, slot):
+            return lambda f: f.slots[slot]
+        case Local(_, 1, slot):
+            return lambda f: f.parent.slots[slot]
+        case Local(_, depth, slot):
+            def local(f):
+                for _ in range(depth):
+                    f = f.parent
+                return f.slots[slot]
+            return local
+        case Name(n):
+            raise EvalError(f"unresolved name {n}, run resolve() first")
+
+        case Add(l, r):
+            return compileAdd(l, r, types)
+        case Sub(l, r):
+            cl, cr = compile(l, types=types), compile(r, types=types)
+            if proven(types, INT, l, r):
+                return lambda f: cl(f) - cr(f)
+            def sub(f):
+                lv, rv = cl(f), cr(f)
+                if (type(lv) != int) or (type(rv) != int):
+                    if type(lv) is Array or type(rv) is Array:
+                        return vector("-", lv, rv)
+                    raise EvalError("subtraction of non integers!")
+                return lv - rv
+            return sub
+        case Mul(l, r):
+            cl, cr = compile(l, types=types), compile(r, types=types)
+            if proven(types, INT, l, r):
+                return lambda f: cl(f) * cr(f)
+            def mul(f):
+                lv, rv = cl(f), cr(f)
+                if type(lv) is Array or type(rv) is Array:
+                    return vector("*", lv, rv)
+                if type(lv) != type(rv):
+                    raise EvalError("Less than operation on two variables that arent the same type@!")
+                return lv * rv
+            return mul
+        case Div(l, r):
+            cl, cr = compile(l, types=types), compile(r, types=types)
+            if proven(types, INT, l, r):
+                def intdiv(f):
+                    lv, rv = cl(f), cr(f)
+                    if rv == 0:
+                        raise EvalError("Division by zero!")
+                    return lv // rv
+                return intdiv
+            def div(f):
+                lv, rv = cl(f), cr(f)
+                if isinstance(lv, bool) or isinstance(rv, bool):
+                    raise EvalError("One of the operands is a bool")
+                if type(lv) is Array or type(rv) is Array:
+                    return vector("/", lv, rv)
+                if isinstance(lv, int) and rv == 0:
+                    raise EvalError("Division by zero!")
+                return lv // rv
+            return div
+        case Neg(s):
+            cs = compile(s, types=types)
+            if proven(types, INT, s):
+                return lambda f: -cs(f)
+            def neg(f):
+                val = cs(f)
+                if type(val) is not int:
+                    if type(val) is Array:
+                        return vector("-", 0, val)
+                    raise EvalError
+                return -1 * val
+            return neg
+
+        case Lt(l, r):
+            cl, cr = compile(l, types=types), compile(r, types=types)
+            if proven(types, INT, l, r) or proven(types, BOOL, l, r):
+                return lambda f: cl(f) < cr(f)
+            def lt(f):
+                lv, rv = cl(f), cr(f)
+                if type(lv) is Array or type(rv) is Array:
+                    return vector("<", lv, rv)
+                if type(lv) != type(rv):
+                    raise EvalError("Less than operation on two variables that arent the same type@!")
+                return lv < rv
+            return lt
+        case Eq(l, r):
+            cl, cr = compile(l, types=types), compile(r, types=types)
+            if proven(types, INT, l, r) or proven(types, BOOL, l, r):
+                return lambda f: cl(f) == cr(f)
+            def eq(f):
+                lv, rv = cl(f), cr(f)
+                if type(lv) is Array or type(rv) is Array:
+                    return vector("==", lv, rv)
+                if type(rv) != type(lv):
+                    return False
+                if isinstance(lv, (bool, int)):
+                    return lv == rv
+                if isinstance(lv, str):
+                    return "The strings are equal!" if lv == rv else "The strings are not the same!"
+                raise EvalError("Type is not bool, nor int, nor command!")
+            return eq
+
+        case And(l, r):
+            cl, cr = compile(l, types=types), compile(r, tail, types)  # the right operand is in tail position
+            if proven(types, BOOL, l, r):
+                return lambda f: cl(f) and cr(f)
+            def and_(f):
+                lv = cl(f)
+                if not isinstance(lv, bool):
+                    raise EvalError("Left operand is not a bool")
+                if not lv:
+                    return False
+                return operand(cr(f), "Right operand is not a bool!")
+            return and_
+        case Or(l, r):
+            cl, cr = compile(l, types=types), compile(r, tail, types)
+            if proven(types, BOOL, l, r):
+                return lambda f: cl(f) or cr(f)
+            def or_(f):
+                lv = cl(f)
+                if type(lv) != bool:
+                    raise EvalError("LHS isnt bool!")
+                if lv:
+                    return True
+                return operand(cr(f), "One of the operands is not a bool!")
+            return or_
+        case Not(s):
+            cs = compile(s, types=types)
+            if proven(types, BOOL, s):
+                return lambda f: not cs(f)
+            def not_(f):
+                val = cs(f)
+                if not isinstance(val, bool):
+                    raise EvalError("Not expects a boolean")
+                return not val
+            return not_
+        case If(c, t, el):
+            cc, ct, ce = compile(c, types=types), compile(t, tail, types), compile(el, tail, types)
+            if proven(types, BOOL, c):
+                return lambda f: ct(f) if cc(f) else ce(f)
+            def if_(f):
+                bv = cc(f)
+                if not isinstance(bv, bool):
+                    raise EvalError("First operand in If statement is not a bool!")
+                return ct(f) if bv else ce(f)
+            return if_
+
+        case Let(_, d, b, slot):
+            cd, cb = compile(d, types=types), compile(b, tail, types)
+            def let(f):
+                f.slots[slot] = cd(f)
+                return cb(f)
+            return let
+        case Block(size, b):
+            cb = compile(b, tail, types)
+            return lambda f: cb(newFrame(size, f))
+        case Memo(slot, m):
+            cm = compile(m, types=types)
+            def memo(f):
+                v = f.slots[slot]
+                if v is None:
+                    v = f.slots[slot] = cm(f)
+                return v
+            return memo
+        case Letfun(_, p, b, i, slot, size, pure):
+            cb, ci = compile(b, True, types), compile(i, tail, types)
+            def letfun(f):
+                f.slots[slot] = Closure(p.name, b, f, size, cb, pure)
+                return ci(f)
+            return letfun
+        case App(fn, a):
+            cf, ca = compile(fn, types=types), compile(a, types=types)
+            if tail:
+                return lambda f: TailCall(*enter(cf(f), ca(f)))
+            return lambda f: call(*enter(cf(f), ca(f)))
+        case ArrayLit(values):
+            arr = array_of(values)  # arrays are never changed in place, so one will do for every evaluation
+            return lambda f: arr
+        case ToArray(s):
+            cs = compile(s, types=types)
+            return lambda f: to_array(cs(f))
+        case Sum(s) | Max(s) | Count(s):
+            cs, op = compile(s, types=types), {Sum: "sum", Max: "max", Count: "count"}[type(e)]
+            return lambda f: reduce_array(op, cs(f))
+
+        case _:
+            return lambda f: eval(e, f)
+
+def compileAdd(l: Expr, r: Expr, types: Typing | None = None) -> Code:
+    # an int literal operand needs no type check at run time, only the other side does
+    lknown, lv = constant(l)
+    rknown, rv = constant(r)
+    if proven(types, INT, l, r):
+        if lknown and not rknown:
+            cr = compile(r, types=types)
+            return lambda f: lv + cr(f)
+        if rknown and not lknown:
+            cl = compile(l, types=types)
+            return lambda f: cl(f) + rv
+        cl, cr = compile(l, types=types), compile(r, types=types)
+        return lambda f: cl(f) + cr(f)
+    if lknown and type(lv) is int and not rknown:
+        cr = compile(r, types=types)
+        def addConstLeft(f):
+            v = cr(f)
+            if type(v) is not int:
+                if type(v) is Array:
+                    return vector("+", lv, v)
+                raise EvalError("One of the operands is a bool" if isinstance(v, bool) else "addition of non-integers")
+            return lv + v
+        return addConstLeft
+    if rknown and type(rv) is int and not lknown:
+        cl = compile(l, types=types)
+        def addConstRight(f):
+            v = cl(f)
+            if type(v) is not int:
+                if type(v) is Array:
+                    return vector("+", v, rv)
+                raise EvalError("One of the operands is a bool" if isinstance(v, bool) else "addition of non-integers")
+            return v + rv
+        return addConstRight
+
+    cl, cr = compile(l, types=types), compile(r, types=types)
+    def add(f):
+        a, b = cl(f), cr(f)
+        if type(a) is int and type(b) is int:
+            return a + b
+        if isinstance(a, bool) or isinstance(b, bool):
+            raise EvalError("One of the operands is a bool")
+        if type(a) is Array or type(b) is Array:
+            return vector("+", a, b)
+        raise EvalError("addition of non-integers")
+    return add
@@ -0,0 +1,94 @@
+'''
+Common-subexpression elimination over a resolved AST, turned on with run(e, cse=True).
+
+Within one scope (the top level, or one letfun body) every subtree that is pure or is a plain command
+invocation and occurs more than once is wrapped in a Memo node, and all its copies share one fresh frame
+slot: whichever copy is evaluated first stores the value and the others read it back. Nothing is hoisted,
+so evaluation order and short-circuiting are unchanged. Running after resolve() means two subtrees only
+match when their names point at the same bindings, which hold the same values for the whole scope.
+Commands are assumed to give the same output within one scope; that is what turning the pass on asks for.
+'''
+from collections import Counter
+from dataclasses import fields, is_dataclass, replace
+from interp import (Add, Sub, Mul, Div, Neg, Lit, And, Or, Not, Name, Local, Eq, Lt, If, Letfun, Block, Memo,
+                    Command, Pipe, RedirectOut, RedirectIn, RedirectErrorOut, RedirectErrorIn, Append, Bg, Sequence, Lines,
+                    Sum, Max, Count, Expr, located)
+
+SHARED = (Add, Sub, Mul, Div, Neg, And, Or, Not, Eq, Lt, If, Pipe, Sum, Max, Count)  # nodes that are pure given pure children
+LEAVES = (Lit, Local, Name)  # cheaper to evaluate than to share
+SHELL = (Pipe, RedirectOut, RedirectIn, RedirectErrorOut, RedirectErrorIn, Append, Bg, Sequence, Lines)  # keep their commands as they are
+
+class Eliminator:
+    def __init__(self):
+        self.numbers: dict[tuple, int] = {}  # structure of a subtree -> its number
+        self.known: dict[int, int | None] = {}  # id(node) -> number, None when it can't be shared
+
+    def number(self, e: Expr) -> int | None:
+        '''Gives structurally identical shareable subtrees the same number.'''
+        if id(e) in self.known:
+            return self.known[id(e)]
+        match e:
+            case Lit(v):
+                parts = (Lit, type(v), v)
+            case Local(_, depth, slot):
+                parts = (Local, depth, slot)
+            case Command(program, flags, arguments):
+                parts = (Command, program, flags, arguments)
+            case _ if type(e) in SHARED:
+                kids = tuple(self.number(getattr(e, f.name)) for f in fields(e))
+                parts = None if None in kids else (type(e), *kids)
+            case _:
+                parts = None
+        n = None if parts is None else self.numbers.setdefault(parts, len(self.numbers))
+        self.known[id(e)] = n
+        return n
+
+    def count(self, e: Expr, counts: Counter) -> None:
+        n = self.number(e)
+        if n is not None and not isinstance(e, LEAVES):
+            counts[n] += 1
+        if isinstance(e, Letfun):
+            self.count(e.inexpr, counts)  # the body is a scope of its own
+            return
+        if isinstance(e, SHELL):
+            return
+        for f in fields(e):
+            v = getattr(e, f.name)
+            if is_dataclass(v):
+                self.count(v, counts)
+
+    def scope(self, body: Expr, size: int) -> tuple[Expr, int]:
+        '''Rewrites one scope; returns the new body and the frame size including the memo slots.'''
+        counts: Counter = Counter()
+        self.count(body, counts)
+        slots: dict[int, int] = {}
+
+        def rewrite(e: Expr) -> Expr:
+            nonlocal size
+            if isinstance(e, Letfun):
+                b, inner = self.scope(e.bodyexpr, e.size)
+                return located(replace(e, bodyexpr=b, size=inner, inexpr=rewrite(e.inexpr)), e)
+            if isinstance(e, SHELL):
+                new = e
+            else:
+                changes = {f.name: rewrite(getattr(e, f.name)) for f in fields(e) if is_dataclass(getattr(e, f.name))}
+                new = located(replace(e, **changes), e) if changes else e
+            n = self.number(e)
+            if n is not None and counts[n] > 1:
+                if n not in slots:
+                    slots[n] = size
+                    size += 1
+                return Memo(slots[n], new)
+            return new
+
+        body = rewrite(body)
+        return body, size
+
+def cse(e: Expr) -> Expr:
+    '''e must come from resolve(), i.e. be a Block.'''
+    match e:
+        case Block(size, body):
+            body, size = Eliminator().scope(body, size)
+            return Block(size, body)
+        case _:
+            raise ValueError("cse() needs a resolved program, run resolve() first")
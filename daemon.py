@@ -0,0 +1,134 @@
+'''
+Interpreter daemon: a long-lived process that keeps the parser built (and the AST cache's directory hot), and
+runs scripts sent to it over a Unix domain socket, so a one-line script costs a fork instead of a Python
+startup, an import of Lark and a grammar load.
+
+    python daemon.py                      serves on client.socket_path() until interrupted
+    python daemon.py --socket /tmp/s -j 8
+
+client.py speaks the protocol (length-prefixed JSON, see there) and is the way to send it scripts.
+
+Every request is run in a child forked for it, so requests run concurrently (up to --max-children at once)
+and each one gets its own working directory, environment, job table and stdout without being able to
+disturb the others or the daemon. The flip side is that what a script adds to the in-memory command cache
+is gone with its child; the parser, and everything the daemon had when it forked, is shared, and so are the
+settings modules read once at import (EXPR_NO_BUILTINS, EXPR_MAX_OUTPUT and the like), which come from the
+daemon's environment rather than the request's. The socket is created readable and writable
+by its owner only: whoever can connect to it can run commands.
+'''
+import io
+import os
+import sys
+import socket
+import signal
+import argparse
+from contextlib import redirect_stdout
+from dataclasses import asdict
+from typing import Any, List
+from client import socket_path, frame, receive
+from parser import get_ast_parser
+from batch import run_script
+
+def listen(path: str) -> socket.socket:
+    '''A socket bound to path; a socket file left there by a daemon that died is replaced, a live one is not.'''
+    if os.path.exists(path):
+        probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            probe.connect(path)
+        except ConnectionRefusedError:
+            os.unlink(path)
+        else:
+            raise RuntimeError(f"a daemon is already listening on {path}")
+        finally:
+            probe.close()
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    umask = os.umask(0o077)  # the socket file is born private, with no window in which others can connect
+    try:
+        sock.bind(path)
+    finally:
+        os.umask(umask)
+    sock.listen(128)
+    return sock
+
+def isolate(message: dict) -> None:
+    if "env" in message:
+        os.environ.clear()
+        os.environ.update(message["env"])
+    if "cwd" in message:
+        os.chdir(message["cwd"])
+
+def respond(conn: socket.socket) -> None:
+    '''Reads one request from conn, runs it and writes the response; runs in the child forked for it.'''
+    data, fds, _, _ = socket.recv_fds(conn, 4, 3)
+    try:
+        message: Any = receive(conn, data)
+    except (ValueError, ConnectionError) as err:
+        conn.sendall(frame({"value": None, "error": f"bad request: {err}"}))
+        return
+    if fds:
+        for target, fd in enumerate(fds):  # the client's stdin, stdout and stderr become ours
+            os.dup2(fd, target)
+            os.close(fd)
+    else:
+        devnull = os.open(os.devnull, os.O_RDWR)  # nothing a script runs may write on the daemon's terminal
+        for target in (0, 1, 2):
+            os.dup2(devnull, target)
+        os.close(devnull)
+    output = io.StringIO()
+    try:
+        isolate(message)
+        with redirect_stdout(sys.stdout if fds else output):
+            result = run_script(("", message["source"]), message.get("backend", "tree"),
+                                message.get("typed", False), message.get("level", 0))
+        response = asdict(result) | {"output": output.getvalue()}
+        del response["id"]
+    except Exception as err:  # a bad cwd, a missing source: reported, like errors in the script
+        response = {"value": None, "error": f"{type(err).__name__}: {err}", "output": output.getvalue()}
+    sys.stdout.flush()
+    conn.sendall(frame(response))
+
+def serve(path: str, max_children: int = 64) -> None:
+    get_ast_parser()  # before forking, so every child starts with it built
+    sock = listen(path)
+    children: set[int] = set()
+    print(f"listening on {path}", file=sys.stderr)
+    try:
+        while True:
+            conn, _ = sock.accept()
+            while children:  # reap whoever has finished, and wait for someone when at the limit
+                pid, _ = os.waitpid(-1, 0 if len(children) >= max_children else os.WNOHANG)
+                if pid == 0:
+                    break
+                children.discard(pid)
+            pid = os.fork()
+            if pid == 0:
+                status = 0
+                try:
+                    sock.close()
+                    signal.signal(signal.SIGINT, signal.SIG_DFL)
+                    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+                    respond(conn)
+                except BaseException:
+                    status = 1  # the client is gone, most likely; nothing to tell it
+                finally:
+                    os._exit(status)  # never back into the accept loop, and no cleanup the parent still needs
+            conn.close()
+            children.add(pid)
+    finally:
+        sock.close()
+        os.unlink(path)
+
+def main(argv: List[str] | None = None) -> int:
+    args = argparse.ArgumentParser(description="Serve script evaluation on a Unix domain socket.")
+    args.add_argument("--socket", default=socket_path(), help="socket path (default: %(default)s)")
+    args.add_argument("--max-children", "-j", type=int, default=64, help="requests running at once")
+    opts = args.parse_args(argv)
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))  # so the socket file is removed on kill too
+    try:
+        serve(opts.socket, opts.max_children)
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
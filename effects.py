@@ -0,0 +1,60 @@
+'''
+Effect analysis over a resolved AST, turned on with run(e, memo=True).
+
+A letfun is marked pure when its body cannot reach a command, pipe, redirect or background job,
+either directly or through a call. A call counts as pure only when its callee is a letfun already
+known to be pure; calls through parameters or let-bound copies are assumed to have effects. While
+a body is analysed the function itself is assumed pure, so self-recursion does not spoil it; if the
+body turns out impure anyway it is analysed again, so nested functions that call it are not left marked.
+
+Applications of closures made from pure letfuns go through the bounded table in memo.py, which lasts
+one evaluation. A memoized call has to store its result afterwards, so it is not a tail call.
+'''
+from dataclasses import fields, is_dataclass, replace
+from interp import (Letfun, App, Local, Block, Command, Pipe, RedirectOut, RedirectIn, RedirectErrorOut, RedirectErrorIn,
+                    Append, Bg, Wait, Jobs, Sequence, Lines, Map, Filter, Take, Fold, ToArray, Expr, located)
+
+EFFECTS = (Command, Pipe, RedirectOut, RedirectIn, RedirectErrorOut, RedirectErrorIn, Append, Bg, Wait, Jobs, Sequence,
+           Lines, Map, Filter, Take, Fold, ToArray)  # streams are read once, so even pure ones can't be shared
+
+type Frames = list[dict[int, bool]]  # per frame level, innermost last: slot -> is that letfun pure
+
+def mark(e: Expr, frames: Frames) -> tuple[Expr, bool]:
+    '''Returns e with its letfuns marked, and whether evaluating e itself is free of effects.'''
+    match e:
+        case _ if isinstance(e, EFFECTS):
+            return e, False
+        case Letfun(_, _, b, i, slot):
+            frames[-1][slot] = True  # optimistic, for self-calls
+            body, pure = mark(b, frames + [{}])
+            if not pure:
+                frames[-1][slot] = False
+                body, _ = mark(b, frames + [{}])
+            inexpr, ipure = mark(i, frames)
+            return located(replace(e, bodyexpr=body, inexpr=inexpr, pure=pure), e), ipure
+        case App(Local(_, depth, slot) as f, a):
+            arg, apure = mark(a, frames)
+            known = depth < len(frames) and frames[-1 - depth].get(slot, False)
+            return located(App(f, arg), e), apure and known
+        case App(f, a):
+            fun, _ = mark(f, frames)
+            arg, _ = mark(a, frames)
+            return located(App(fun, arg), e), False
+        case _:
+            pure = True
+            changes = {}
+            for field in fields(e):
+                v = getattr(e, field.name)
+                if is_dataclass(v):
+                    changes[field.name], p = mark(v, frames)
+                    pure = pure and p
+            return (located(replace(e, **changes), e) if changes else e), pure
+
+def mark_pure(e: Expr) -> Expr:
+    '''e must come from resolve(), i.e. be a Block.'''
+    match e:
+        case Block(size, body):
+            body, _ = mark(body, [{}])
+            return Block(size, body)
+        case _:
+            raise ValueError("mark_pure() needs a resolved program, run resolve() first")
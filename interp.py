@@ -1,13 +1,75 @@
-from typing import List, Any
-from dataclasses import dataclass
-import subprocess
+from typing import List, Any, Callable
+from dataclasses import dataclass, fields
+import sys
+import shlex
+from pipeline import Stage, PipelineResult, run_pipeline, start_pipeline, capture_policy
+from spawn import spawn, collect, PIPE, OutputLimitError
+from memo import evaluation, memoizing
+from cmdcache import command_cache
+from workers import worker_pool
+from jobs import job_table
+from builtin_commands import run_argv, run_stages
+from streams import Stream, output_lines, text_lines, mapped, filtered, taken
+import arrays
+from arrays import Array, ArrayError
 
+# AST nodes are slotted and immutable: no per-node __dict__, and structurally equal nodes hash alike,
+# so they can be shared between trees (see ToExpr's hashcons option) and used as cache keys.
 
-@dataclass
-class Command():
+class Node():
+    '''
+    Base of the AST nodes. A node made by the parser records where it came from in the source, as one int:
+    start << 32 | end (character offsets). It is a slot rather than a field, so it takes no part in ==, hashing,
+    match patterns or the passes that walk fields(); passes that rebuild a node carry it over with located().
+    '''
+    __slots__ = ("_span",)
+
+    @property
+    def span(self) -> int:
+        return getattr(self, "_span", 0)  # 0: unknown, e.g. a node built by hand or a literal the optimizer made
+
+    def __reduce__(self):
+        # the pickling dataclass generates for slotted classes only saves fields
+        return placed, (type(self), self.span, *(getattr(self, f.name) for f in fields(self)))
+
+def placed(cls: type, span: int, *args: Any) -> Any:
+    node = cls(*args)
+    if span:
+        object.__setattr__(node, "_span", span)  # frozen, but the node is brand new
+    return node
+
+def located[N](new: N, old: Any) -> N:
+    '''new, which a pass built to replace old, given old's span unless it has its own.'''
+    if new is not old and old.span and not new.span:
+        object.__setattr__(new, "_span", old.span)
+    return new
+
+def where(source: str, span: int) -> str:
+    '''Line, column and text of a span in source, for error messages.'''
+    start, end = span >> 32, span & 0xFFFFFFFF
+    line = source.count("\n", 0, start) + 1
+    column = start - source.rfind("\n", 0, start)
+    text = source[start:end].split("\n")[0]
+    return f"line {line}, column {column}: {text if len(text) <= 40 else text[:37] + '...'}"
+
+def blame(err: BaseException) -> int:
+    '''
+    The span of the innermost node being worked on when err was raised, 0 if none is known. Found by looking
+    for a local e (what eval, resolveNode and typecheck call the node at hand) in the frames err unwound.
+    '''
+    span, tb = 0, err.__traceback__
+    while tb is not None:
+        e = tb.tb_frame.f_locals.get("e")
+        if isinstance(e, Node) and e.span:
+            span = e.span
+        tb = tb.tb_next
+    return span
+
+@dataclass(slots=True, frozen=True)
+class Command(Node):
     program: str
-    flags: List[str] = None
-    arguments: List[str] = None
+    flags: tuple[str, ...] = ()
+    arguments: tuple[str, ...] = ()
 
     def __str__(self) -> str:
         com = f"{self.program}"
@@ -20,8 +82,8 @@ class Command():
         
         return com
 
-@dataclass
-class Filename():
+@dataclass(slots=True, frozen=True)
+class Filename(Node):
     name: str
     
     def __str__(self) -> str:
@@ -31,459 +93,1022 @@ class Filename():
 type Literal = int | Command | Filename
 type Expr = Add | Sub | Mul | Div | Neg | Lit | And | Or | Not | Name | Eq | Lt | If | Pipe | RedirectOut | RedirectIn  | RedirectErrorIn | Bg 
 
-@dataclass
-class Add():
+@dataclass(slots=True, frozen=True)
+class Add(Node):
     left: Expr
     right: Expr
     def __str__(self) -> str:
         return f"({self.left} + {self.right})"
 
-@dataclass
-class Sub():
+@dataclass(slots=True, frozen=True)
+class Sub(Node):
     left: Expr
     right: Expr
     def __str__(self) -> str:
         return f"({self.left} - {self.right})"
 
-@dataclass
-class Mul():
+@dataclass(slots=True, frozen=True)
+class Mul(Node):
     left: Expr
     right: Expr
     def __str__(self) -> str:
         return f"({self.left} * {self.right})"
 
-@dataclass
-class Div():
+@dataclass(slots=True, frozen=True)
+class Div(Node):
     left: Expr
     right: Expr
     def __str__(self) -> str:
             return f"({self.left} / {self.right})"
 
-@dataclass
-class Neg():
+@dataclass(slots=True, frozen=True)
+class Neg(Node):
     subexpr: Expr
     def __str__(self) -> str:
         return f"(- {self.subexpr})"
 
-@dataclass
-class Lit():
+@dataclass(slots=True, frozen=True)
+class Lit(Node):
     value: Literal
     def __str__(self) -> str:
         return f"{self.value}"
 
-@dataclass
-class And():
+@dataclass(slots=True, frozen=True)
+class And(Node):
     left: Expr
     right: Expr
     def __str__(self) -> str:
         return f"{self.left} and {self.right}"
 
-@dataclass
-class Or():
+@dataclass(slots=True, frozen=True)
+class Or(Node):
     left: Expr
     right: Expr
     def __str__(self) -> str:
         return f"{self.left} or {self.right}"
 
-@dataclass
-class Not():
+@dataclass(slots=True, frozen=True)
+class Not(Node):
     subexpr: Expr
     def __str__(self) -> str:
         return f"(not {self.subexpr})"
     
-@dataclass
-class Name():
+@dataclass(slots=True, frozen=True)
+class Name(Node):
+    name: str
+    def __str__(self) -> str:
+        return self.name
+
+@dataclass(slots=True, frozen=True)
+class Local(Node):
     name: str
+    depth: int  # how many frames up the binding lives
+    slot: int   # index of the binding in that frame
     def __str__(self) -> str:
         return self.name
 
-@dataclass
-class Let():
+@dataclass(slots=True, frozen=True)
+class Let(Node):
     name: str
     defexpr: Expr
     bodyexpr: Expr
+    slot: int = -1  # filled in by resolve()
     def __str__(self) -> str:
         return f"(let {self.name} = {self.defexpr} in {self.bodyexpr})"
     
-@dataclass
-class Eq():
+@dataclass(slots=True, frozen=True)
+class Eq(Node):
     left: Expr
     right: Expr
     def __str__(self) -> str:
         return f"({self.left} == {self.right})"
 
-@dataclass
-class Lt():
+@dataclass(slots=True, frozen=True)
+class Lt(Node):
     left: Expr
     right: Expr
     def __str__(self) -> str:
         return f"{self.left} < {self.right}"
 
-@dataclass
-class If():
+@dataclass(slots=True, frozen=True)
+class If(Node):
     condition: Expr
     thenBranch: Expr
     elseBranch: Expr
     def __str__(self) -> str:
         return f"If {self.condition} then {self.thenBranch} else {self.elseBranch}"
 
-@dataclass
-class Letfun():
+@dataclass(slots=True, frozen=True)
+class Letfun(Node):
     name: str
     param: Name  # param is now a Name Expr
     bodyexpr: Expr
     inexpr: Expr
+    slot: int = -1  # slot of the function in the enclosing frame, filled in by resolve()
+    size: int = 0   # frame size of the body, parameter in slot 0
+    pure: bool = False  # set by effects.mark_pure() when calls can be memoized
     def __str__(self) -> str:
         return f"letfun {self.name} ({self.param}) = {self.bodyexpr} in {self.inexpr} end"
 
-@dataclass
-class App():
+@dataclass(slots=True, frozen=True)
+class App(Node):
     fun: Expr
     arg: Expr
     def __str__(self) -> str:
         return f"({self.fun} ({self.arg}))"
     
-@dataclass
-class Pipe():
+@dataclass(slots=True, frozen=True)
+class Pipe(Node):
     left: Command
     right: Command
     def __str__(self) -> str:
         return f"Command: {self.left} | Command: {self.right}"
     
-@dataclass
-class RedirectOut():
+@dataclass(slots=True, frozen=True)
+class RedirectOut(Node):
     left: Command
     right: Command
     def __str__(self) -> str:
         return f"Redirect from {self.left} > {self.right}"
     
-@dataclass
-class RedirectIn():
+@dataclass(slots=True, frozen=True)
+class RedirectIn(Node):
     left: Command
     right: Command
     def __str__(self) -> str:
         return f"Redirect to {self.left} < from {self.right}"
     
     
-@dataclass
-class RedirectErrorOut():
+@dataclass(slots=True, frozen=True)
+class RedirectErrorOut(Node):
     left: Command
     right: Filename
     def __str__(self) -> str:
         return f"Redirect stderr from {self.left} 2> {self.right}"
 
-@dataclass
-class RedirectErrorIn():
+@dataclass(slots=True, frozen=True)
+class RedirectErrorIn(Node):
     left: Command
     right: Filename
     def __str__(self) -> str:
         return f"Redirect stderr from {self.left} 2< {self.right}"
 
-@dataclass
-class Append():
+@dataclass(slots=True, frozen=True)
+class Append(Node):
     left: Command
-    right: Command
+    right: Filename
     def __str__(self) -> str:
         return f"Redirect from {self.left} >> {self.right}"
 
-@dataclass
-class Bg():
+@dataclass(slots=True, frozen=True)
+class Bg(Node):
     program: Command
     def __str__(self) -> str:
         return f"Background {self.program}&"
 
-@dataclass
-class Sequence():
+@dataclass(slots=True, frozen=True)
+class Wait(Node):
+    job: Expr  # evaluates to a job number, as returned by Bg
+    def __str__(self) -> str:
+        return f"wait {self.job}"
+
+@dataclass(slots=True, frozen=True)
+class Jobs(Node):
+    def __str__(self) -> str:
+        return "jobs"
+
+@dataclass(slots=True, frozen=True)
+class Lines(Node):
+    source: Expr  # a command or pipeline, read lazily, or a string
+    def __str__(self) -> str:
+        return f"lines({self.source})"
+
+@dataclass(slots=True, frozen=True)
+class Map(Node):
+    fun: Expr
+    stream: Expr
+    def __str__(self) -> str:
+        return f"map({self.fun}, {self.stream})"
+
+@dataclass(slots=True, frozen=True)
+class Filter(Node):
+    fun: Expr
+    stream: Expr
+    def __str__(self) -> str:
+        return f"filter({self.fun}, {self.stream})"
+
+@dataclass(slots=True, frozen=True)
+class Take(Node):
+    count: Expr
+    stream: Expr
+    def __str__(self) -> str:
+        return f"take({self.count}, {self.stream})"
+
+@dataclass(slots=True, frozen=True)
+class Fold(Node):
+    fun: Expr  # called as fun(acc)(value)
+    init: Expr
+    stream: Expr
+    def __str__(self) -> str:
+        return f"fold({self.fun}, {self.init}, {self.stream})"
+
+@dataclass(slots=True, frozen=True)
+class ArrayLit(Node):
+    values: tuple[int, ...]
+    def __str__(self) -> str:
+        return f"[{', '.join(map(str, self.values))}]"
+
+@dataclass(slots=True, frozen=True)
+class ToArray(Node):
+    source: Expr  # the numbers in a command's output, a stream of ints, or an array
+    def __str__(self) -> str:
+        return f"array({self.source})"
+
+@dataclass(slots=True, frozen=True)
+class Sum(Node):
+    array: Expr
+    def __str__(self) -> str:
+        return f"sum({self.array})"
+
+@dataclass(slots=True, frozen=True)
+class Max(Node):
+    array: Expr
+    def __str__(self) -> str:
+        return f"max({self.array})"
+
+@dataclass(slots=True, frozen=True)
+class Count(Node):
+    array: Expr
+    def __str__(self) -> str:
+        return f"count({self.array})"
+
+@dataclass(slots=True, frozen=True)
+class Sequence(Node):
     left: Command
     right: Command
     def __str__(self) -> str:
         return f"Sequence {self.left};{self.right}"
-    
-type Binding[V] = tuple[str,V]
-type Env[V] = tuple[Binding[V],...]
-emptyEnv : Env[Any] = ()
 
-def extendEnv[V](name: str, value: V, env:Env[V]) -> Env[V]:
-    return ((name,value),) + env
+@dataclass(slots=True, frozen=True)
+class Memo(Node):
+    slot: int  # frame slot holding the value once it has been computed
+    expr: Expr
+    def __str__(self) -> str:
+        return f"{self.expr}"
 
-def lookupEnv[V](name: str, env: Env[V]) -> (V | None) :
-    match env:
-        case ((n,v), *rest) :
-            if n == name:
-                return v
-            else:
-                return lookupEnv(name, rest) # type:ignore
-        case _ :
-            return None  
+@dataclass(slots=True, frozen=True)
+class Fork(Node):
+    memos: tuple[Memo, ...]  # evaluated concurrently into their slots, then read back by body
+    body: Expr
+    def __str__(self) -> str:
+        return f"{self.body}"
+
+@dataclass(slots=True, frozen=True)
+class Block(Node):
+    size: int
+    body: Expr
+    def __str__(self) -> str:
+        return f"{self.body}"
+
+# Environments are parent-linked frames of slots. resolve() gives every binder a slot in the frame
+# of its enclosing function (or of the top-level Block), so binding is a store and lookup is an index.
+@dataclass(eq=False, slots=True)
+class Frame[V]:
+    slots: List[V]
+    parent: "Frame[V] | None" = None
+
+emptyFrame : Frame[Any] = Frame([])
+
+def newFrame[V](size: int, parent: Frame[V] | None = None) -> Frame[V]:
+    return Frame([None] * size, parent)
+
+def lookupFrame[V](depth: int, slot: int, frame: Frame[V]) -> V:
+    for _ in range(depth):
+        frame = frame.parent
+    return frame.slots[slot]
 
 class EvalError(Exception):
     pass
 
-type Value = int | bool | Command | Closure
+type Value = int | bool | str | memoryview | Stream | Array | Command | Closure
 
-@dataclass
+@dataclass(eq=False)  # compared and hashed by identity, so closures can key the memo table
 class Closure:
     param: str
     body: Expr
-    env: Env[Value]
+    env: Frame[Value]
+    size: int
+    code: Callable | int | None = None  # compiled body (a closure, or a bytecode entry point) when a backend made it
+    pure: bool = False  # made from a letfun marked pure: applications go through the memo table (memo.py)
 
-def eval(e: Expr, env: Env[Value] = emptyEnv) -> Value:
-    match e:
-        case Add(l, r):
-            lv, rv = eval(l, env), eval(r, env)
+def eval(e: Expr, env: Frame[Value] = emptyFrame, check: list[str] | None = None) -> Value:
+    # tail positions (If branches, let bodies, closure bodies, right operands of && and ||) loop here instead
+    # of recursing, so tail-recursive letfun programs run in constant Python stack. check is set when the
+    # caller makes sure the value is a bool: a && or || then continues into its right operand and leaves the
+    # caller the error message to raise, rather than recursing to check the operand itself.
+    while True:
+        match e:
+            case Add(l, r):
+                lv, rv = eval(l, env), eval(r, env)
             
-            if isinstance(lv, bool) or isinstance(rv, bool):
-                raise EvalError("One of the operands is a bool")
-            match (lv, rv):
-                case (int(lv), int(rv)):
-                    return lv + rv
-                case _:
-                    raise EvalError("addition of non-integers")
+                if isinstance(lv, bool) or isinstance(rv, bool):
+                    raise EvalError("One of the operands is a bool")
+                match (lv, rv):
+                    case (int(lv), int(rv)):
+                        return lv + rv
+                    case (Array(), _) | (_, Array()):
+                        return vector("+", lv, rv)
+                    case _:
+                        raise EvalError("addition of non-integers")
                 
-        case Sub(l,r):
-            lv = eval(l,env)
-            rv = eval(r,env)
-
-            if (type(lv) != int) or (type(rv) != int):
-                raise EvalError("subtraction of non integers!")
-            else:
-                return lv - rv
-
-        case Mul(l, r):
-            lv = eval(l,env)
-            rv = eval(r,env)
-
-            if (type(lv) != type(rv)):
-                raise EvalError("Less than operation on two variables that arent the same type@!")
-            else:
-                return (lv*rv)
-
-        case Lt(l,r):
-            lv = eval(l,env)
-            rv = eval(r,env)
-            
-            if (type(lv) != type(rv)):
-                raise EvalError("Less than operation on two variables that arent the same type@!")
+            case Sub(l,r):
+                lv = eval(l,env)
+                rv = eval(r,env)
+
+                if (type(lv) != int) or (type(rv) != int):
+                    if type(lv) is Array or type(rv) is Array:
+                        return vector("-", lv, rv)
+                    raise EvalError("subtraction of non integers!")
+                else:
+                    return lv - rv
+
+            case Mul(l, r):
+                lv = eval(l,env)
+                rv = eval(r,env)
+
+                if type(lv) is Array or type(rv) is Array:
+                    return vector("*", lv, rv)
+                if (type(lv) != type(rv)):
+                    raise EvalError("Less than operation on two variables that arent the same type@!")
+                else:
+                    return (lv*rv)
+
+            case Lt(l,r):
+                lv = eval(l,env)
+                rv = eval(r,env)
+
+                if type(lv) is Array or type(rv) is Array:
+                    return vector("<", lv, rv)
+                if (type(lv) != type(rv)):
+                    raise EvalError("Less than operation on two variables that arent the same type@!")
             
-            if(lv < rv):
-                return True
-            elif(lv > rv):
-                return False
-            elif(lv == rv):
-                return False
-                
-        case And(l, r):
-            lv = eval(l, env)
-            if isinstance(lv, bool):
-                if not lv:  # short-circuit
+                if(lv < rv):
+                    return True
+                elif(lv > rv):
                     return False
-            else:
-                raise EvalError("Left operand is not a bool")
-    
-            rv = eval(r, env)
-            if isinstance(rv, bool):
-                return lv and rv
-            else:
-                raise EvalError("Right operand is not a bool!")
-        case Or(l, r):
-            lv = eval(l, env)
-            if isinstance(lv, bool) and lv:
-                return True
-            if (type(lv) != bool):
-                raise EvalError("LHS isnt bool!")
-            rv = eval(r, env)
-            if isinstance(rv, bool):
-                return lv or rv
-            else:
-                raise EvalError("One of the operands is not a bool!")
-        case Not(s):
-            val = eval(s, env)
-            if isinstance(val, bool):
-                return not val  # Negate the boolean value
-            else:
-                raise EvalError("Not expects a boolean")
-        case Eq(l,r):
-            lv = eval(l, env)
-            rv = eval(r, env)
-            if (type(rv) != type(lv)):
-                return False
-            match (eval(l, env), eval(r, env)):
-                case((bool(lv), bool(rv))):
-                    if lv == rv:
-                        return True
-                    else:
-                        return False
-                case((int(lv), int(rv))):
-                    if lv == rv:
-                        return True
-                    else:
+                elif(lv == rv):
+                    return False
+                
+            case And(l, r):
+                lv = eval(l, env)
+                if isinstance(lv, bool):
+                    if not lv:  # short-circuit
                         return False
-                case((str(lv), str(rv))):
-                    if lv == rv:
-                        return ("The strings are equal!")
-                    else:
-                        return ("The strings are not the same!")
-                case _:
-                    raise EvalError("Type is not bool, nor int, nor command!")
-        case Div(l,r):
-            lv = eval(l,env)
-            rv = eval(r,env)
-            
-            if isinstance(lv, bool) or isinstance(rv, bool):
-                raise EvalError("One of the operands is a bool")
+                else:
+                    raise EvalError("Left operand is not a bool")
+                if check is not None:
+                    check[0] = "Right operand is not a bool!"
+                    e = r
+                    continue
+                return operand(r, env, "Right operand is not a bool!")
+            case Or(l, r):
+                lv = eval(l, env)
+                if isinstance(lv, bool) and lv:
+                    return True
+                if (type(lv) != bool):
+                    raise EvalError("LHS isnt bool!")
+                if check is not None:
+                    check[0] = "One of the operands is not a bool!"
+                    e = r
+                    continue
+                return operand(r, env, "One of the operands is not a bool!")
+            case Not(s):
+                val = eval(s, env)
+                if isinstance(val, bool):
+                    return not val  # Negate the boolean value
+                else:
+                    raise EvalError("Not expects a boolean")
+            case Eq(l,r):
+                lv = eval(l, env)  # each operand is evaluated exactly once
+                rv = eval(r, env)
+                if type(lv) is Array or type(rv) is Array:
+                    return vector("==", lv, rv)
+                if (type(rv) != type(lv)):
+                    return False
+                match (lv, rv):
+                    case((bool(lv), bool(rv))):
+                        if lv == rv:
+                            return True
+                        else:
+                            return False
+                    case((int(lv), int(rv))):
+                        if lv == rv:
+                            return True
+                        else:
+                            return False
+                    case((str(lv), str(rv))):
+                        if lv == rv:
+                            return ("The strings are equal!")
+                        else:
+                            return ("The strings are not the same!")
+                    case _:
+                        raise EvalError("Type is not bool, nor int, nor command!")
+            case Div(l,r):
+                lv = eval(l,env)
+                rv = eval(r,env)
             
-            if isinstance(lv, int) and (rv == 0):
-                raise EvalError("Division by zero!")
+                if isinstance(lv, bool) or isinstance(rv, bool):
+                    raise EvalError("One of the operands is a bool")
+
+                if type(lv) is Array or type(rv) is Array:
+                    return vector("/", lv, rv)
+                if isinstance(lv, int) and (rv == 0):
+                    raise EvalError("Division by zero!")
             
-            else:
-                return lv // rv
+                else:
+                    return lv // rv
                 
-        case If(b,t,e):
-            match(eval(b, env)):
-                case bool(bv):
-                    if bv:
-                        return eval(t, env)
-                    elif (bv == False):
-                        return eval(e, env)
-                case _:
-                    raise EvalError("First operand in If statement is not a bool!")
+            case If(b,t,f):
+                match(eval(b, env)):
+                    case bool(bv):
+                        e = t if bv else f
+                        continue
+                    case _:
+                        raise EvalError("First operand in If statement is not a bool!")
                 
-        case Neg(s):
-            val = eval(s, env)
-            if (type(val)) is not int:
-                raise EvalError
-            else:
-                return (-1 * val)
-
-        case Lit(lit):
-            match lit:  # two-level matching keeps type-checker happy
-                case int(i):
-                    return i
-                case bool(b):
-                    return b
-                case Command(c):
-                    return str(c)
-                case _:
-                    raise EvalError(f"Unsupported literal type: {lit}")
-        case Name(n):
-            v = lookupEnv(n, env)
-            if v is None:
-                raise EvalError(f"unbound name {n}")
-            return v
-        case Let(n,d,b):
-            v = eval(d, env)
-            newEnv = extendEnv(n, v, env)
-            return eval(b, newEnv)
-        case Command(program, flags, arguments):
-            cmd = [program] + (flags if flags else []) + (arguments if arguments else [])
-
-            # 🛠 Debugging print statements
-            print(f"DEBUG: Running command: {cmd}")
-
-            try:
-                result = subprocess.run(cmd, capture_output=True, text=True, check=True)
-                return result.stdout.strip()
-            except subprocess.CalledProcessError as e:
-                print(f"DEBUG: Command failed: {e.stderr}")
-                return f"Command failed: {e.stderr}"
-        case Filename(s):
-            return str('"' + s + '"')
-        case Pipe(left, right):
-            left_output = eval(left, env)
-            if not isinstance(left_output, str):
-                raise EvalError("Pipe left side must produce a string")
-            
-            right_cmd = eval(right, env) 
-
-            process = subprocess.run(right_cmd, input=left_output, text=True, capture_output=True, shell=True)
-            return process.stdout.strip()
-        case RedirectOut(command, filename):
-            output = eval(command, env)
-            with open(filename.name, "w") as f:
-                f.write(output)
-            return f"Output written to {filename.name}"
-        case RedirectIn(command, filename):
-            with open(filename.name, "r") as f:
-                input_data = f.read()
-            return eval(command, extendEnv("STDIN", input_data, env))
-        case RedirectErrorOut(command, filename):
-            cmd = eval(command, env)
-            if not isinstance(cmd, str):
-                raise EvalError("Command must be a string")
-            
-            try:
-                with open(filename.name, "w") as f:
-                    subprocess.run(cmd, shell=True, stderr=f)
-                return f"Error output written to {filename.name}"
-            except Exception as e:
-                raise EvalError(f"Failed to redirect stderr: {str(e)}")
-        case Append(lc,rc):
-            lcp = eval(lc,env)
-            rcp = eval(rc,env)
-
-            if(type(lcp) != str):
-               raise EvalError("Left command isnt a command!")
-            
-            elif(type(rcp) != str):
-               raise EvalError("Right side of append isnt a filename!")
-            
-            else:
-                return str(lcp + ' >> ' + rcp)
-        case Bg(command):
-            cmd = eval(command, env)
-            if not isinstance(cmd, str):
-                raise EvalError("Command must be a string")
-            
-            subprocess.Popen(cmd, shell=True)
-            return f"Running in background: {cmd}"
-        case Sequence(lc,rc):
-            lcp = eval(lc,env)
-            rcp = eval(rc,env)
-
-            if(type(lcp) != str):
-               raise EvalError("Left command isnt a command!")
+            case Neg(s):
+                val = eval(s, env)
+                if (type(val)) is not int:
+                    if type(val) is Array:
+                        return vector("-", 0, val)
+                    raise EvalError
+                else:
+                    return (-1 * val)
+
+            case Lit(lit):
+                match lit:  # two-level matching keeps type-checker happy
+                    case int(i):
+                        return i
+                    case bool(b):
+                        return b
+                    case Command(c):
+                        return str(c)
+                    case _:
+                        raise EvalError(f"Unsupported literal type: {lit}")
+            case Local(_, depth, slot):
+                return lookupFrame(depth, slot, env)
+            case Name(n):
+                raise EvalError(f"unresolved name {n}, run resolve() first")
+            case Let(_, d, b, slot):
+                env.slots[slot] = eval(d, env)
+                e = b
+                continue
+            case Block(size, b):
+                e, env = b, newFrame(size, env)
+                continue
+            case Memo(slot, m):
+                v = env.slots[slot]  # no value is ever None, so None means not computed yet
+                if v is None:
+                    v = env.slots[slot] = eval(m, env)
+                return v
+            case Fork(memos, b):
+                values = worker_pool.run_all([lambda m=m: eval(m.expr, env) for m in memos])
+                for m, v in zip(memos, values):
+                    env.slots[m.slot] = v
+                e = b
+                continue
+            case Command(program, flags, arguments):
+                cmd = command_argv(e)
+                if command_cache.enabled:
+                    return command_cache.run(cmd, lambda: run_command(cmd))
+                return run_command(cmd)[0]
+            case Filename(s):
+                return str('"' + s + '"')
+            case Pipe(_, RedirectOut(_, filename) | Append(_, filename)):
+                return written(filename, eval_pipe(e).status)
+            case Pipe(_, _):
+                return captured(eval_pipe(e).output)
+            case RedirectOut(Pipe(_, _) as pipe, filename) | Append(Pipe(_, _) as pipe, filename):
+                with open(filename.name, "ab" if isinstance(e, Append) else "wb") as f:
+                    status = eval_pipe(pipe, stdout=f).status
+                return written(filename, status)
+            case RedirectOut(Command(_, _, _), filename) | Append(Command(_, _, _), filename):
+                return written(filename, eval_pipe(e).status)  # the child writes to the file itself
+            case RedirectOut(command, filename) | Append(command, filename):
+                output = eval(command, env)
+                with open(filename.name, "ab" if isinstance(e, Append) else "wb") as f:
+                    f.write(output if isinstance(output, memoryview) else str(output).encode())
+                return f"Output written to {filename.name}"
+            case RedirectIn(Command(_, _, _), filename) | RedirectErrorIn(Command(_, _, _), filename):
+                return captured(eval_pipe(e).output)  # the child reads the file through its own descriptor
+            case RedirectIn(command, filename):
+                return eval(command, env)  # only commands have a stdin
+            case RedirectErrorOut(command, filename):
+                try:
+                    stages = pipe_stages(e)
+                    run_stages(stages, capture=False) or run_pipeline(stages, capture=False)  # stdout stays ours
+                    return f"Error output written to {filename.name}"
+                except OSError as err:
+                    raise EvalError(f"Failed to redirect stderr: {str(err)}")
+            case Bg(command):
+                return start_job(command)
+            case Wait(j):
+                return wait_job(eval(j, env))
+            case Jobs():
+                return job_table.listing()
+            case Lines(source) if isinstance(source, (Command, Pipe, RedirectIn, RedirectErrorIn, RedirectErrorOut)):
+                return start_stream(source)
+            case Lines(source):
+                v = eval(source, env)
+                match v:
+                    case str(text):
+                        return text_lines(text)
+                    case Stream():
+                        return v
+                    case _:
+                        raise EvalError("lines expects a command or a string")
+            case Map(f, st):
+                fun, stream = eval(f, env), unread(eval(st, env), "map")
+                return mapped(lambda x: apply(fun, x), stream)
+            case Filter(f, st):
+                fun, stream = eval(f, env), unread(eval(st, env), "filter")
+                def keep(x: Value) -> bool:
+                    v = apply(fun, x)
+                    if type(v) is not bool:
+                        raise EvalError("filter expects a function returning a bool")
+                    return v
+                return filtered(keep, stream)
+            case Take(n, st):
+                count, stream = eval(n, env), unread(eval(st, env), "take")
+                if type(count) is not int:
+                    raise EvalError("take expects a number of values")
+                return taken(count, stream)
+            case Fold(f, z, st):
+                fun, acc, stream = eval(f, env), eval(z, env), unread(eval(st, env), "fold")
+                try:
+                    for x in stream:
+                        acc = apply(apply(fun, acc), x)
+                finally:
+                    stream.close()
+                return acc
+            case ArrayLit(values):
+                return array_of(values)
+            case ToArray(source):
+                return to_array(eval(source, env))
+            case Sum(a):
+                return reduce_array("sum", eval(a, env))
+            case Max(a):
+                return reduce_array("max", eval(a, env))
+            case Count(a):
+                return reduce_array("count", eval(a, env))
+            case Sequence(lc,rc):
+                lcp = eval(lc,env)
+                rcp = eval(rc,env)
+
+                if(type(lcp) != str):
+                   raise EvalError("Left command isnt a command!")
             
-            elif(type(rcp) != str):
-               raise EvalError("Right side of sequence isnt a command!")
+                elif(type(rcp) != str):
+                   raise EvalError("Right side of sequence isnt a command!")
             
-            else:
-                return str(lcp + ' ; ' + rcp)
-        case App(f, a):
-            fun = eval(f, env)
-            arg = eval(a, env)
-            match fun:
-                case Closure(p, b, cenv):
-                    newEnv = cenv  # Start with the closure's environment
-                    newEnv = extendEnv(p, arg, newEnv)  # Create a *new* environment
-                    return eval(b, newEnv)  # Evaluate in the *new* environment
+                else:
+                    return str(lcp + ' ; ' + rcp)
+            case App(f, a):
+                fun = eval(f, env)
+                arg = eval(a, env)
+                match fun:
+                    case Closure(_, b, cenv, size):
+                        newEnv = newFrame(size, cenv)  # Fresh frame chained to the closure's environment
+                        newEnv.slots[0] = arg  # The parameter always lives in slot 0
+                        if fun.pure and (table := memoizing()) is not None:
+                            return table.call(fun, arg, lambda: eval(b, newEnv))  # not a tail call: the result is stored
+                        e, env = b, newEnv
+                        continue
+                    case _:
+                        raise EvalError("Application of a non-function!")
+
+            case Letfun(_, p, b, i, slot, size, pure):
+                env.slots[slot] = Closure(p.name, b, env, size, pure=pure)
+                e = i
+                continue
+            case _:
+                raise EvalError(f"Unsupported expression: {e}")  # without this, the loop would spin forever
 
+#RESOLVER PASS
+class Scope:
+    '''Names visible inside one function body (or the top level) and the slots they occupy.'''
+    def __init__(self, parent: "Scope | None" = None):
+        self.parent = parent
+        self.names: dict[str, int] = {}
+        self.size = 0
+
+    def bind(self, name: str) -> tuple[int, int | None]:
+        slot = self.size
+        self.size += 1
+        shadowed = self.names.get(name)
+        self.names[name] = slot
+        return slot, shadowed
+
+    def unbind(self, name: str, shadowed: int | None) -> None:
+        if shadowed is None:
+            del self.names[name]
+        else:
+            self.names[name] = shadowed
+
+    def find(self, name: str) -> tuple[int, int] | None:
+        '''(depth, slot) of the binding name refers to from here, None if it is unbound.'''
+        depth, s = 0, self
+        while s is not None:
+            if name in s.names:
+                return depth, s.names[name]
+            depth, s = depth + 1, s.parent
+        return None
+
+# Builtins are names every program starts with, outside its own bindings: a let or letfun of the same name
+# shadows one like any other binding. A call of a builtin that is not shadowed becomes the builtin's node;
+# f(a, b) is f(a)(b), so arguments past the builtin's own are applied to its result.
+BUILTINS: dict[str, tuple[type, int]] = {  # name -> (node, number of arguments)
+    "wait": (Wait, 1),
+    "jobs": (Jobs, 0),
+    "lines": (Lines, 1),
+    "map": (Map, 2),
+    "filter": (Filter, 2),
+    "take": (Take, 2),
+    "fold": (Fold, 3),  # fold(f, init, s) computes f(acc)(value) for each value
+    "array": (ToArray, 1),  # the numbers in a command's output, or a stream of ints, as an array
+    "sum": (Sum, 1),
+    "max": (Max, 1),
+    "count": (Count, 1),
+}
+
+def builtin(e: Expr, scope: Scope) -> Expr | None:
+    '''
+    e as a builtin's node when e calls (or for jobs, names) a builtin that no binding in scope shadows, None
+    otherwise. The arguments are left as they are, for the caller to resolve.
+    '''
+    calls = []
+    f = e
+    while isinstance(f, App):
+        calls.append(f)
+        f = f.fun
+    if not isinstance(f, Name) or f.name not in BUILTINS or scope.find(f.name) is not None:
+        return None
+    calls.reverse()  # innermost, i.e. first argument, first
+    cls, arity = BUILTINS[f.name]
+    if len(calls) < arity:
+        raise EvalError(f"{f.name} expects {arity} argument{'s' if arity > 1 else ''}")
+    node = located(cls(*(c.arg for c in calls[:arity])), calls[arity - 1] if arity else f)
+    for c in calls[arity:]:
+        node = located(App(node, c.arg), c)
+    return node
+
+def resolve(e: Expr) -> Expr:
+    '''
+    Rewrites every Name into a Local (depth, slot) address and assigns slots to every binder.
+    Unbound names are reported here, once, instead of during evaluation.
+    '''
+    top = Scope()
+    body = resolveIn(e, top)
+    return Block(top.size, body)
+
+def resolveIn(e: Expr, scope: Scope) -> Expr:
+    '''e with its names resolved in scope. A work stack rather than recursion, so any depth can be resolved.'''
+    # the work stack holds ("node", expr, scope) items still to resolve and callables that rebuild a node from its
+    # resolved children, or bind and unbind names; children are pushed in reverse, so they come off `done` in
+    # source order
+    work: List[Any] = [("node", e, scope)]
+    done: List[Expr] = []
+    while work:
+        item = work.pop()
+        if callable(item):
+            item()
+        else:
+            resolveNode(item[1], item[2], work, done)
+    return done.pop()
+
+def resolveNode(e: Expr, scope: Scope, work: List[Any], done: List[Expr]) -> None:
+    def rebuild(n: int, make):
+        '''Replaces the last n resolved children with e rebuilt from them by make.'''
+        def finish():
+            parts = done[len(done) - n:]
+            del done[len(done) - n:]
+            done.append(located(make(*parts), e))
+        return finish
+
+    match e:
+        case Name(_) | App(_, _) if (call := builtin(e, scope)) is not None:
+            work.append(("node", call, scope))
+        case Name(n):
+            found = scope.find(n)
+            if found is None:
+                raise EvalError(f"unbound name {n}")
+            done.append(located(Local(n, *found), e))
+        case Let(n, d, b):
+            def bind():  # after the definition, which does not see the name
+                slot, shadowed = scope.bind(n)
+                work.extend([rebuild(2, lambda d, b: Let(n, d, b, slot)), lambda: scope.unbind(n, shadowed),
+                             ("node", b, scope)])
+            work += [bind, ("node", d, scope)]
         case Letfun(n, p, b, i):
-            closure = Closure(p.name, b, env)  # Store param correctly
-            newEnv = extendEnv(n, closure, env)
-            return eval(i, newEnv)
+            slot, shadowed = scope.bind(n)  # bound first, so the body can call itself
+            inner = Scope(scope)
+            inner.bind(p.name)
+            work += [rebuild(2, lambda b, i: Letfun(n, p, b, i, slot, inner.size)), lambda: scope.unbind(n, shadowed),
+                     ("node", i, scope), ("node", b, inner)]
+        case Add(l, r) | Sub(l, r) | Mul(l, r) | Div(l, r) | And(l, r) | Or(l, r) | Eq(l, r) | Lt(l, r) | App(l, r):
+            work += [rebuild(2, type(e)), ("node", r, scope), ("node", l, scope)]
+        case Neg(s) | Not(s):
+            work += [rebuild(1, type(e)), ("node", s, scope)]
+        case If(c, t, f):
+            work += [rebuild(3, If), ("node", f, scope), ("node", t, scope), ("node", c, scope)]
+        case Wait(j):
+            work += [rebuild(1, Wait), ("node", j, scope)]
+        case Lines(x):
+            work += [rebuild(1, Lines), ("node", x, scope)]
+        case Map(f, x) | Filter(f, x) | Take(f, x):
+            work += [rebuild(2, type(e)), ("node", x, scope), ("node", f, scope)]
+        case Fold(f, z, x):
+            work += [rebuild(3, Fold), ("node", x, scope), ("node", z, scope), ("node", f, scope)]
+        case ToArray(x) | Sum(x) | Max(x) | Count(x):
+            work += [rebuild(1, type(e)), ("node", x, scope)]
+        case _:
+            done.append(e)  # literals and shell nodes bind no names
+
+#HELPERS FOR PIPELINES
+def command_argv(c: Command) -> List[str]:
+    return [c.program, *c.flags, *c.arguments]
+
+def pipe_stages(p: Pipe) -> List[Stage]:
+    '''Flattens a (left-nested) tree of Pipe nodes into its stages, left to right.'''
+    nodes = []
+    while isinstance(p, Pipe):
+        nodes.append(p.right)
+        p = p.left
+    nodes.append(p)
+    nodes.reverse()
+
+    stages = []
+    for node in nodes:
+        match node:
+            case Command(_, _, _):
+                stages.append(Stage(command_argv(node)))
+            case RedirectIn(Command(_, _, _) as c, filename):
+                stages.append(Stage(command_argv(c), stdin=filename.name))
+            case RedirectOut(Command(_, _, _) as c, filename):
+                stages.append(Stage(command_argv(c), stdout=filename.name))
+            case RedirectErrorOut(Command(_, _, _) as c, filename):
+                stages.append(Stage(command_argv(c), stderr=filename.name))
+            case Append(Command(_, _, _) as c, filename):
+                stages.append(Stage(command_argv(c), stdout=filename.name, append=True))
+            case RedirectErrorIn(Command(_, _, _) as c, filename):
+                stages.append(Stage(command_argv(c), stderr_in=filename.name))
+            case _:
+                raise EvalError(f"Unsupported pipeline stage: {node}")
+    return stages
+
+def eval_pipe(p: Pipe, stdout=None) -> PipelineResult:
+    '''
+    Runs every stage of the pipeline concurrently. The last stage's output is captured only when
+    no stdout file is given, i.e. when the pipeline's result is used as a value.
+    '''
+    stages = pipe_stages(p)
+    limit = capture_policy.max_bytes
+    try:
+        return (run_stages(stages, capture=stdout is None, stdout=stdout, limit=limit)
+                or run_pipeline(stages, capture=stdout is None, stdout=stdout, limit=limit))
+    except OutputLimitError as err:
+        raise EvalError(f"Output of {' | '.join(str(s) for s in stages)} is {err}")
+    except OSError as err:
+        raise EvalError(f"Failed to start pipeline: {err}")
+
+def captured(output: bytes | bytearray) -> Value:
+    '''A command's output as a value: stripped text, or the exact bytes when capture_policy.binary is set.'''
+    if capture_policy.binary:
+        return memoryview(output)
+    return output.decode(errors="replace").strip()
+
+def written(filename: Filename, status: int) -> str:
+    if status != 0:
+        return f"Command failed: exit status {status}"
+    return f"Output written to {filename.name}"
+
+#HELPERS FOR STREAMS
+def start_stream(source: Expr) -> Stream:
+    '''Starts a command or pipeline with its output read back lazily, a line at a time.'''
+    stages = pipe_stages(source)
+    try:
+        return output_lines(start_pipeline(stages))
+    except OSError as err:
+        raise EvalError(f"Failed to start pipeline: {err}")
+
+def unread(v: Value, op: str) -> Stream:
+    if not isinstance(v, Stream):
+        raise EvalError(f"{op} expects a stream")
+    if v.started:
+        raise EvalError(f"{op}: this stream has already been read")
+    return v
+
+def operand(r: Expr, env: Frame[Value], error: str) -> Value:
+    '''The right operand of && or ||, which must be a bool; the ones nested in its tail position update error.'''
+    check = [error]
+    rv = eval(r, env, check)
+    if not isinstance(rv, bool):
+        raise EvalError(check[0])
+    return rv
+
+def apply(fun: Value, arg: Value) -> Value:
+    '''Calls a closure from Python, for the functions streams are mapped, filtered and folded with.'''
+    if type(fun) is not Closure:
+        raise EvalError("Application of a non-function!")
+    if callable(fun.code):  # made by the closure compiler, so it is loaded: run the compiled body
+        compiler = sys.modules["compiler"]  # an import statement here would cost as much as the call
+        return compiler.call(*compiler.enter(fun, arg))
+    newEnv = newFrame(fun.size, fun.env)
+    newEnv.slots[0] = arg
+    if fun.pure and (table := memoizing()) is not None:
+        return table.call(fun, arg, lambda: eval(fun.body, newEnv))
+    return eval(fun.body, newEnv)
+
+def materialize(v: Value) -> Value:
+    '''A stream, read to the end as text, one value per line, for printing.'''
+    if not isinstance(v, Stream):
+        return v
+    if v.started:
+        raise EvalError("this stream has already been read")
+    try:
+        return "\n".join(str(x) for x in v)
+    finally:
+        v.close()
+
+#HELPERS FOR ARRAYS
+def array_of(values: tuple[int, ...]) -> Array:
+    try:
+        return arrays.of(values)
+    except ArrayError as err:
+        raise EvalError(str(err))
+
+def to_array(v: Value) -> Array:
+    '''array(v): the numbers in a command's output, or the values of a stream, which must all be ints.'''
+    try:
+        match v:
+            case Array():
+                return v
+            case str(text):
+                return arrays.parse(text)
+            case Stream():
+                stream = unread(v, "array")
+                try:
+                    return arrays.of(stream)
+                finally:
+                    stream.close()
+            case _:
+                raise EvalError("array expects a command's output, a stream or an array")
+    except ArrayError as err:
+        raise EvalError(str(err))
+
+def vector(op: str, lv: Value, rv: Value) -> Array:
+    '''lv op rv when either side is an array, computed element-wise.'''
+    try:
+        return arrays.elementwise(op, lv, rv)
+    except ArrayError as err:
+        raise EvalError(str(err))
+
+REDUCTIONS = {"sum": arrays.total, "max": arrays.largest, "count": arrays.count}
+
+def reduce_array(op: str, v: Value) -> Value:
+    if type(v) is not Array:
+        raise EvalError(f"{op} expects an array")
+    try:
+        return REDUCTIONS[op](v)
+    except ArrayError as err:
+        raise EvalError(str(err))
+
+#HELPERS FOR BACKGROUND JOBS
+def start_job(job: Expr) -> int:
+    '''Starts a command or pipeline in the background (or queues it, past the job cap) and returns its job number.'''
+    stages = pipe_stages(job)
+    return job_table.submit(stages).id
+
+def wait_job(id: Value) -> str:
+    '''Waits for a background job and returns its output, like a command run in the foreground.'''
+    if type(id) is not int:
+        raise EvalError("wait expects a job number")
+    try:
+        job = job_table.wait(id)
+    except KeyError:
+        raise EvalError(f"No such job: {id}")
+    if job.error:
+        raise EvalError(f"Failed to start job {id}: {job.error}")
+    if job.status != 0:
+        return f"Command failed: exit status {job.status}"
+    limit = capture_policy.max_bytes
+    if limit is not None and len(job.output) > limit:
+        raise EvalError(f"Output of job {id} is {OutputLimitError(limit)}")
+    return captured(job.output)
 
 #HELPER FUNCTION TO EXECUTE COMMANDS
+def run_command(cmd: List[str]) -> tuple[str, bool]:
+    '''Runs one command and returns its output, and whether it succeeded.'''
+    limit = capture_policy.max_bytes
+    done = run_argv(cmd)  # echo, cat, wc, head and grep run in process when they can
+    if done is not None:
+        out, err, returncode = done
+        if limit is not None and len(out) > limit:
+            raise EvalError(f"Output of {' '.join(cmd)} is {OutputLimitError(limit)}")
+    else:
+        try:
+            child = spawn(cmd, stdout=PIPE, stderr=PIPE)
+        except OSError as err:
+            raise EvalError(f"Failed to start command: {err}")
+        try:
+            out, err = collect(child, limit)
+        except OutputLimitError as exc:
+            raise EvalError(f"Output of {' '.join(cmd)} is {exc}")
+        returncode = child.returncode
+    if returncode != 0:
+        return f"Command failed: {err.decode(errors='replace')}", False
+    return captured(out), True
+
 def execute_command(cmd: str) -> str:
+    '''Runs a command line, split like sh would split it; there is no shell, so no globs, variables or redirects.'''
     try:
-        result = subprocess.run(cmd, shell=True, capture_output=True, text=True, check=True)
-        if result.stdout:
-            return result.stdout
+        child = spawn(shlex.split(cmd), stdout=PIPE, stderr=PIPE)
+        out, err = child.communicate()
+        if child.returncode != 0:
+            return f"Command failed with error: {err.decode(errors='replace')}"
+        elif out:
+            return out.decode(errors="replace")
         else:
             return "No output from command"
-
-    except subprocess.CalledProcessError as e:
-        return f"Command failed with error: {e.stderr}"
     except Exception as e:
         return f"An unexpected error occurred: {str(e)}"
 
+def prepare(e: Expr, cse: bool = False, memo: bool = False, parallel: bool = False) -> Expr:
+    prog = resolve(e)
+    if cse:
+        from cse import cse as eliminate
+        prog = eliminate(prog)
+    if memo:
+        from effects import mark_pure
+        prog = mark_pure(prog)
+    if parallel:
+        from parallel import parallelize
+        prog = parallelize(prog)
+    return prog
+
 #RUN FUNCTION LIKE TURTLE FOR REQUIREMENT
-def run(e: Expr) -> None:
+def evaluate(e: Expr, backend: str = "tree", cse: bool = False, memo: bool = False, parallel: bool = False,
+             typed: bool = False) -> Value:
+    '''The value run() prints, streams read out; raises EvalError. The options are run()'s.'''
+    if typed:
+        from typecheck import check
+    with evaluation():  # closures and frames the table holds go when the evaluation does
+        match backend:
+            case "tree":
+                prog = prepare(e, cse, memo, parallel)
+                if typed:
+                    check(prog)
+                result = eval(prog)
+            case "compiled":
+                from compiler import compile
+                prog = prepare(e, cse, memo, parallel)
+                result = compile(prog, types=check(prog) if typed else None)(emptyFrame)
+            case "vm":
+                from vm import compile, execute
+                if typed:
+                    check(resolve(e))
+                result = execute(compile(e))
+            case _:
+                raise ValueError(f"Unknown backend: {backend}")
+        return materialize(result)
+
+def run(e: Expr, backend: str = "tree", cse: bool = False, memo: bool = False, cache: bool = False,
+        parallel: bool = False, typed: bool = False, source: str | None = None) -> None:
+    '''
+    Evaluates e and prints the result. backend is "tree", "compiled" (closure compiler) or "vm" (bytecode).
+    With cse set, repeated pure subexpressions and commands are evaluated once per scope (not for "vm").
+    With memo set, calls to letfuns without effects are memoized for the length of the evaluation (not for "vm"),
+    and the memo table's hits, misses and evictions are printed after the result.
+    With cache set, outputs of hermetic commands (see cmdcache.py) are kept in command_cache across runs.
+    With parallel set, independent command operands run concurrently on worker_pool (not for "vm").
+    With typed set, the program is type-checked (see typecheck.py) and rejected before it runs if ill-typed;
+    the "compiled" backend then leaves out the runtime checks the types make redundant.
+    Given the source e was parsed from, errors say where in it they happened, when that is known.
+    '''
     print(f"Running: {e}")
+    enabled, command_cache.enabled = command_cache.enabled, cache
     try:
-        result = eval(e)
-        print(f"Result = {result}")
+        with evaluation() as stats:  # evaluate() uses this table, so its counts can be reported
+            print(f"Result = {evaluate(e, backend, cse, memo, parallel, typed)}")
     except EvalError as err:
-        print(f"Evaluation error: {err}")
+        span = blame(err) if source is not None else 0
+        print(f"Evaluation error: {err}" + (f" (at {where(source, span)})" if span else ""))
+    finally:
+        command_cache.enabled = enabled
+    if memo:
+        print(f"Memo table: {stats}")
+    if cache:
+        print(f"Command cache: {command_cache.stats}")
 '''
 #PROOF OF CONCEPT TESTS
 command_stra = RedirectOut(Pipe(Command('ls', ['-l']), Command("grep", ["jgafron"])), Filename("output.txt"))
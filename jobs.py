@@ -0,0 +1,157 @@
+'''
+Background jobs, as started by Bg. Every job gets a number, runs with its output collected in a temporary file,
+and is reaped as soon as it exits by a watcher thread that sleeps on pidfds (one blocking wait4() thread per
+process where pidfds are not available), so no zombies are left and nothing polls. At most max_running jobs
+run at once; the rest wait in a queue and start, in order, as running ones finish.
+Wall time, CPU time and peak RSS come from each process's rusage.
+'''
+import os
+import time
+import selectors
+import tempfile
+import threading
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Callable, IO, List
+from pipeline import Stage, start_pipeline, capture_policy
+from spawn import Child
+
+@dataclass
+class Job():
+    id: int
+    stages: List[Stage]
+    state: str = "queued"  # queued, running or done
+    statuses: List[int] = field(default_factory=list)
+    started: float = 0.0
+    wall: float = 0.0     # seconds
+    cpu: float = 0.0      # user + system seconds, summed over the stages
+    maxrss: int = 0       # largest peak RSS of any stage, in KB
+    output: bytes = b""   # the last stage's stdout, once done; one byte past capture_policy.max_bytes at most
+    error: str = ""       # set when the job could not be started
+    done: threading.Event = field(default_factory=threading.Event)
+    procs: List[Child] = field(default_factory=list)
+    out: IO | None = None
+    left: int = 0         # stages not reaped yet
+
+    @property
+    def status(self) -> int:
+        return self.statuses[-1] if self.statuses else 0
+
+    def __str__(self) -> str:
+        command = " | ".join(str(s) for s in self.stages)
+        if self.state != "done":
+            return f"[{self.id}] {self.state:<7} {command}"
+        return (f"[{self.id}] done    status {self.status}, {self.wall:.2f}s wall, {self.cpu:.2f}s cpu, "
+                f"{self.maxrss} KB max rss  {command}")
+
+class Reaper:
+    '''Calls back with (status, rusage) when a child exits, reaping it with wait4().'''
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.selector: selectors.BaseSelector | None = None
+        self.wakeup: tuple[int, int] | None = None
+
+    def watch(self, pid: int, callback: Callable[[int, object], None]) -> None:
+        try:
+            pidfd = os.pidfd_open(pid)
+        except (AttributeError, OSError):  # not Linux, or a kernel older than 5.3
+            threading.Thread(target=self.reap, args=(pid, callback), daemon=True).start()
+            return
+        with self.lock:
+            if self.selector is None:
+                self.selector = selectors.DefaultSelector()
+                self.wakeup = os.pipe()
+                self.selector.register(self.wakeup[0], selectors.EVENT_READ)
+                threading.Thread(target=self.loop, name="job-reaper", daemon=True).start()
+            self.selector.register(pidfd, selectors.EVENT_READ, (pid, callback))
+        os.write(self.wakeup[1], b"x")  # the loop picks up the new pidfd on its next select()
+
+    def loop(self) -> None:
+        while True:
+            with self.lock:
+                selector = self.selector
+            for key, _ in selector.select():
+                if key.data is None:
+                    os.read(key.fd, 512)
+                    continue
+                with self.lock:
+                    selector.unregister(key.fd)
+                os.close(key.fd)
+                self.reap(*key.data)
+
+    def reap(self, pid: int, callback: Callable[[int, object], None]) -> None:
+        _, status, rusage = os.wait4(pid, 0)
+        callback(status, rusage)
+
+class JobTable:
+    def __init__(self, max_running: int = 4):
+        self.max_running = max_running
+        self.jobs: dict[int, Job] = {}
+        self.queue: deque[Job] = deque()
+        self.running = 0
+        self.lock = threading.RLock()
+        self.reaper = Reaper()
+
+    def submit(self, stages: List[Stage]) -> Job:
+        with self.lock:
+            job = Job(len(self.jobs) + 1, stages)
+            self.jobs[job.id] = job
+            if self.running < self.max_running:
+                self.start(job)
+            else:
+                self.queue.append(job)
+        return job
+
+    def start(self, job: Job) -> None:
+        self.running += 1
+        job.state = "running"
+        job.started = time.monotonic()
+        job.out = tempfile.TemporaryFile()
+        try:
+            job.procs = start_pipeline(job.stages, capture=False, stdout=job.out)
+        except OSError as err:
+            job.error = str(err)
+            job.statuses = [127]
+            self.finish(job)
+            return
+        job.left = len(job.procs)
+        for i, proc in enumerate(job.procs):
+            self.reaper.watch(proc.pid, lambda status, rusage, i=i: self.exited(job, i, status, rusage))
+
+    def exited(self, job: Job, i: int, status: int, rusage) -> None:
+        with self.lock:
+            code = os.waitstatus_to_exitcode(status)
+            job.procs[i].returncode = code  # reaped here, so nothing must wait for it again
+            job.cpu += rusage.ru_utime + rusage.ru_stime
+            job.maxrss = max(job.maxrss, rusage.ru_maxrss)
+            job.left -= 1
+            if job.left == 0:
+                job.statuses = [p.returncode for p in job.procs]
+                self.finish(job)
+
+    def finish(self, job: Job) -> None:
+        job.wall = time.monotonic() - job.started
+        if job.out is not None:
+            job.out.seek(0)
+            limit = capture_policy.max_bytes
+            job.output = job.out.read(-1 if limit is None else limit + 1)  # enough to tell it went over
+            job.out.close()
+            job.out = None
+        job.procs = []
+        job.state = "done"
+        self.running -= 1
+        job.done.set()
+        while self.queue and self.running < self.max_running:
+            self.start(self.queue.popleft())
+
+    def wait(self, id: int) -> Job:
+        '''Blocks until job id has finished; KeyError for an unknown id.'''
+        job = self.jobs[id]
+        job.done.wait()
+        return job
+
+    def listing(self) -> str:
+        with self.lock:
+            return "\n".join(str(job) for job in self.jobs.values())
+
+job_table = JobTable()
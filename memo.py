@@ -0,0 +1,90 @@
+from typing import Any, Callable, Iterator
+from dataclasses import dataclass
+from collections import OrderedDict
+from contextlib import contextmanager
+from contextvars import ContextVar
+import threading
+
+
+@dataclass
+class MemoStats():
+    hits: int = 0
+    misses: int = 0
+    evictions: int = 0
+
+    def __str__(self) -> str:
+        total = self.hits + self.misses
+        rate = self.hits / total if total else 0.0
+        return f"{self.hits} hits, {self.misses} misses ({rate:.0%} hit rate), {self.evictions} evictions"
+
+class MemoTable:
+    '''
+    Bounded LRU table of one evaluation's pure function applications, keyed by (closure, argument).
+    Closures compare by identity, and a key keeps its closure alive, so an entry can never be
+    picked up by a different closure that happens to reuse the address. Since keys and values hold
+    closures and their frames, a table only lives as long as the evaluation() that made it.
+    '''
+    def __init__(self, maxsize: int = 4096, max_depth: int = 100):
+        self.maxsize = maxsize
+        self.max_depth = max_depth  # memoized calls in progress on one thread; see memoizing()
+        self.entries: OrderedDict[tuple, Any] = OrderedDict()
+        self.stats = MemoStats()
+        self.local = threading.local()  # depth, per thread: Fork operands run on workers with the same table
+
+    def call(self, closure: Any, arg: Any, compute: Callable[[], Any]) -> Any:
+        entries = self.entries
+        key = (closure, type(arg), arg)  # the type keeps f(1) and f(true) apart
+        try:
+            value = entries[key]
+        except KeyError:
+            pass
+        except TypeError:
+            return compute()  # unhashable argument: nothing to key on
+        else:
+            entries.move_to_end(key)
+            self.stats.hits += 1
+            return value
+
+        self.stats.misses += 1
+        local = self.local
+        local.depth = getattr(local, "depth", 0) + 1
+        try:
+            value = compute()
+        finally:
+            local.depth -= 1
+        entries[key] = value
+        if len(entries) > self.maxsize:
+            entries.popitem(last=False)
+            self.stats.evictions += 1
+        return value
+
+current_table: ContextVar[MemoTable | None] = ContextVar("current_table", default=None)
+
+@contextmanager
+def evaluation() -> Iterator[MemoStats]:
+    '''
+    Gives one evaluation an empty table, dropped with everything it holds when the evaluation ends.
+    The table is per context, so evaluations in other threads or asyncio tasks never see it; one evaluation
+    started inside another shares the outer one's table.
+    '''
+    table = current_table.get()
+    if table is not None:
+        yield table.stats
+        return
+    table = MemoTable()
+    token = current_table.set(table)
+    try:
+        yield table.stats
+    finally:
+        current_table.reset(token)
+
+def memoizing() -> MemoTable | None:
+    '''
+    The table for a pure call to go through, or None to make the call as usual: outside of an evaluation, and
+    once max_depth memoized calls are in progress on this thread. A memoized call runs to completion to store
+    its result, so it can't be a tail call; past the limit, recursion in tail position loops again.
+    '''
+    table = current_table.get()
+    if table is None or getattr(table.local, "depth", 0) >= table.max_depth:
+        return None
+    return table
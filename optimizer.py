@@ -0,0 +1,149 @@
+'''
+AST optimizer, run between ToExpr and run(). Works on unresolved ASTs (with Names), before resolve().
+
+Level 1 folds literal-only subtrees and prunes If/And/Or branches whose condition is a known literal.
+Level 2 also inlines lets bound to literals into their bodies and drops the binding.
+Folding evaluates the subtree with interp.eval itself, so folded results and errors are exactly the
+evaluator's; a literal division by zero is raised here, other type errors are left for run time.
+'''
+from dataclasses import dataclass, fields, is_dataclass
+from interp import (Add, Sub, Mul, Div, Neg, Lit, And, Or, Not, Name, Let, Eq, Lt, If, Letfun, App, Bg, Wait, Jobs,
+                    Lines, Map, Filter, Take, Fold, ArrayLit, ToArray, Sum, Max, Count, EvalError, Expr, Value, eval, located)
+
+@dataclass
+class Report():
+    level: int
+    before: int
+    after: int
+
+    def __str__(self) -> str:
+        return f"Optimized at level {self.level}: {self.before} -> {self.after} nodes"
+
+def count_nodes(e: Expr) -> int:
+    n = 0
+    todo = [e]
+    while todo:
+        node = todo.pop()
+        n += 1
+        for f in fields(node):
+            v = getattr(node, f.name)
+            if is_dataclass(v):
+                todo.append(v)
+    return n
+
+def known(e: Expr) -> bool:
+    '''True for int and bool literals, the only values folding works with.'''
+    return isinstance(e, Lit) and type(e.value) in (int, bool)
+
+class Optimizer:
+    def __init__(self, level: int):
+        self.fold = level >= 1
+        self.prune = level >= 1
+        self.inline = level >= 2
+
+    def opt(self, e: Expr) -> Expr:
+        return located(self.rewrite(e), e)  # a folded literal stands where its expression was
+
+    def rewrite(self, e: Expr) -> Expr:
+        match e:
+            case If(c, t, f):
+                c = self.opt(c)
+                if self.prune and known(c) and type(c.value) is bool:
+                    return self.opt(t if c.value else f)  # the dead branch is never looked at
+                return If(c, self.opt(t), self.opt(f))
+            case And(l, r):
+                l = self.opt(l)
+                if self.prune and known(l) and l.value is False:
+                    return Lit(False)
+                return self.constant(And(l, self.opt(r)))
+            case Or(l, r):
+                l = self.opt(l)
+                if self.prune and known(l) and l.value is True:
+                    return Lit(True)
+                return self.constant(Or(l, self.opt(r)))
+
+            case Add(l, r) | Sub(l, r) | Mul(l, r) | Div(l, r) | Eq(l, r) | Lt(l, r) | App(l, r):
+                return self.constant(type(e)(self.opt(l), self.opt(r)))
+            case Neg(s) | Not(s):
+                return self.constant(type(e)(self.opt(s)))
+
+            case Let(n, d, b):
+                d = self.opt(d)
+                if self.inline and known(d):
+                    return self.opt(substitute(b, n, d))
+                return Let(n, d, self.opt(b))
+            case Letfun(n, p, b, i):
+                return Letfun(n, p, self.opt(b), self.opt(i))
+            case Wait(j):
+                return Wait(self.opt(j))
+            case Bg(_) | Jobs():
+                return e  # a job's commands hold no names
+            case Lines(x):
+                return Lines(self.opt(x))
+            case Map(f, x) | Filter(f, x) | Take(f, x):
+                return type(e)(self.opt(f), self.opt(x))
+            case Fold(f, z, x):
+                return Fold(self.opt(f), self.opt(z), self.opt(x))
+            case ToArray(x) | Sum(x) | Max(x) | Count(x):
+                return type(e)(self.opt(x))
+            case ArrayLit(_):
+                return e  # its elements are already ints
+            case _:
+                return e
+
+    def constant(self, e: Expr) -> Expr:
+        '''Folds e into a literal when all of its operands are literals.'''
+        if not self.fold or isinstance(e, App):
+            return e
+        if not all(known(getattr(e, f.name)) for f in fields(e)):
+            return e
+        try:
+            v: Value = eval(e)
+        except EvalError:
+            if isinstance(e, Div) and type(e.left.value) is int and type(e.right.value) is int and e.right.value == 0:
+                raise
+            return e  # let it fail at run time, with the evaluator's message
+        return Lit(v)
+
+def substitute(e: Expr, name: str, value: Lit) -> Expr:
+    '''Replaces free occurrences of name in e by the literal value. Literals have no free names, so nothing can be captured.'''
+    match e:
+        case Name(n):
+            return value if n == name else e
+        case Let(n, d, b):
+            d = substitute(d, name, value)
+            return located(Let(n, d, b if n == name else substitute(b, name, value)), e)
+        case Letfun(n, p, b, i):
+            if n == name:
+                return e  # shadowed in both the body (recursion) and the rest
+            b = b if p.name == name else substitute(b, name, value)
+            return located(Letfun(n, p, b, substitute(i, name, value)), e)
+        case Add(l, r) | Sub(l, r) | Mul(l, r) | Div(l, r) | And(l, r) | Or(l, r) | Eq(l, r) | Lt(l, r) | App(l, r):
+            return located(type(e)(substitute(l, name, value), substitute(r, name, value)), e)
+        case Neg(s) | Not(s):
+            return located(type(e)(substitute(s, name, value)), e)
+        case If(c, t, f):
+            return located(If(substitute(c, name, value), substitute(t, name, value), substitute(f, name, value)), e)
+        case Wait(j):
+            return located(Wait(substitute(j, name, value)), e)
+        case Bg(_) | Jobs():
+            return e
+        case Lines(x):
+            return located(Lines(substitute(x, name, value)), e)
+        case Map(f, x) | Filter(f, x) | Take(f, x):
+            return located(type(e)(substitute(f, name, value), substitute(x, name, value)), e)
+        case Fold(f, z, x):
+            return located(Fold(substitute(f, name, value), substitute(z, name, value), substitute(x, name, value)), e)
+        case ToArray(x) | Sum(x) | Max(x) | Count(x):
+            return located(type(e)(substitute(x, name, value)), e)
+        case ArrayLit(_):
+            return e
+        case _:
+            return e
+
+def optimize(e: Expr, level: int = 2) -> tuple[Expr, Report]:
+    '''Runs the passes enabled at the given level (0 does nothing) and reports node counts before and after.'''
+    before = count_nodes(e)
+    if level > 0:
+        e = Optimizer(level).opt(e)
+    return e, Report(level, before, count_nodes(e))
@@ -0,0 +1,103 @@
+'''
+Concurrent evaluation of independent command operands over a resolved AST, turned on with run(e, parallel=True).
+
+When both operands of a strict binary node (Add, Sub, Mul, Div, Eq, Lt) run commands, and they are independent,
+the node is wrapped in a Fork: the operands are evaluated concurrently on workers.worker_pool into fresh frame
+slots, and the node itself then reads them back through Memo nodes, so its checks and results are the usual ones.
+And, Or and If are left alone, since their right side may not run at all.
+
+Operands are independent when they share no Memo slot (from CSE), neither writes a file the other redirects
+from, redirects to or names as an argument, and neither calls a function, whose commands can't be seen here.
+Any command may write the files it names (rm f, touch f, cp a f), so every argument counts as a write, and a
+file named by both operands keeps them in order; only numbers (sleep 0.1, head -n 5) are known not to be files.
+If an operand fails, the first failure in left-to-right order is raised, as sequentially; but commands on the
+other side may already have run by then. Set EXPR_SEQUENTIAL=1 (or worker_pool.sequential) to run forks in order.
+'''
+from dataclasses import dataclass, field, fields, is_dataclass, replace
+from interp import (Add, Sub, Mul, Div, Eq, Lt, Letfun, App, Block, Memo, Fork, Command, Pipe, RedirectOut, RedirectIn,
+                    RedirectErrorOut, RedirectErrorIn, Append, Bg, Wait, Sequence, Lines, Map, Filter, Take, Fold, ToArray,
+                    Filename, Expr, located)
+
+STRICT = (Add, Sub, Mul, Div, Eq, Lt)  # both operands are always evaluated
+EFFECTS = (Command, Pipe, RedirectOut, RedirectIn, RedirectErrorOut, RedirectErrorIn, Append, Bg, Wait, Sequence, Lines)
+STREAMS = (Map, Filter, Take, Fold, ToArray)  # they call functions or read streams, and two may read the same one
+WRITES = (RedirectOut, RedirectErrorOut, Append)
+
+@dataclass
+class Footprint():
+    effects: bool = False
+    calls: bool = False
+    memos: set[int] = field(default_factory=set)
+    reads: set[str] = field(default_factory=set)
+    writes: set[str] = field(default_factory=set)
+
+    def independent(self, other: "Footprint") -> bool:
+        return (not (self.calls or other.calls)
+                and not self.memos & other.memos
+                and not self.writes & (other.reads | other.writes)
+                and not other.writes & self.reads)
+
+def number(argument: str) -> bool:
+    try:
+        float(argument)
+    except ValueError:
+        return False
+    return True
+
+def footprint(e: Expr) -> Footprint:
+    fp = Footprint()
+    todo = [e]
+    while todo:
+        node = todo.pop()
+        match node:
+            case Command(program, flags, arguments):
+                fp.effects = True
+                fp.writes.update(a for a in arguments if not number(a))
+            case Filename(name):
+                pass  # recorded by the redirect it belongs to
+            case App(_, _) | Letfun(_, _, _, _):
+                fp.calls = True
+            case _ if isinstance(node, STREAMS):
+                fp.calls = True
+            case Memo(slot, _):
+                fp.memos.add(slot)
+            case _ if isinstance(node, WRITES) and isinstance(node.right, Filename):
+                fp.writes.add(node.right.name)
+            case RedirectIn(_, Filename(name)) | RedirectErrorIn(_, Filename(name)):
+                fp.reads.add(name)
+        if isinstance(node, EFFECTS):
+            fp.effects = True
+        for f in fields(node):
+            v = getattr(node, f.name)
+            if is_dataclass(v):
+                todo.append(v)
+    return fp
+
+def scope(body: Expr, size: int) -> tuple[Expr, int]:
+    '''Rewrites one scope; returns the new body and the frame size including the fork slots.'''
+    def rewrite(e: Expr) -> Expr:
+        nonlocal size
+        if isinstance(e, Letfun):
+            b, inner = scope(e.bodyexpr, e.size)
+            return located(replace(e, bodyexpr=b, size=inner, inexpr=rewrite(e.inexpr)), e)
+        changes = {f.name: rewrite(getattr(e, f.name)) for f in fields(e) if is_dataclass(getattr(e, f.name))}
+        new = located(replace(e, **changes), e) if changes else e
+        if isinstance(new, STRICT):
+            left, right = footprint(new.left), footprint(new.right)
+            if left.effects and right.effects and left.independent(right):
+                l, r = Memo(size, new.left), Memo(size + 1, new.right)
+                size += 2
+                return Fork((l, r), type(new)(l, r))
+        return new
+
+    body = rewrite(body)
+    return body, size
+
+def parallelize(e: Expr) -> Expr:
+    '''e must come from resolve(), i.e. be a Block.'''
+    match e:
+        case Block(size, body):
+            body, size = scope(body, size)
+            return Block(size, body)
+        case _:
+            raise ValueError("parallelize() needs a resolved program, run resolve() first")
@@ -1,15 +1,53 @@
-from interp import Add, Sub, Mul, Div, Neg, Let, Lit, And, Or, Not, Name, Eq, Lt, If, Pipe, RedirectOut, RedirectIn, Command, Filename, RedirectErrorOut,RedirectErrorIn, Bg, Letfun, App, Expr, run
+from interp import Add, Sub, Mul, Div, Neg, Let, Lit, And, Or, Not, Name, Eq, Lt, If, Pipe, RedirectOut, RedirectIn, Command, Filename, RedirectErrorOut,RedirectErrorIn, Append, Bg, ArrayLit, Letfun, App, Expr, EvalError, Node, run
+from optimizer import optimize, Report
+from astcache import ast_cache
 from lark import Lark, Token, ParseTree, Transformer, Tree
 from lark.exceptions import VisitError
 from pathlib import Path
+from dataclasses import is_dataclass
+import hashlib
+
+GRAMMAR = Path(__file__).with_name('expr.lark')  # next to this file, not wherever we were started from
+parser: Lark | None = None  # built on first use by get_parser()
+ast_parser: Lark | None = None  # built on first use by get_ast_parser()
+
+def grammar_cache(text: str) -> Path:
+    '''Where the LALR tables for this grammar are cached; a changed grammar gets a new file.'''
+    digest = hashlib.sha256(text.encode()).hexdigest()[:16]
+    return GRAMMAR.with_name('__pycache__') / f'expr.lark.{digest}.cache'
+
+def get_parser() -> Lark:
+    '''Builds the parser on first use, loading the LALR tables from the on-disk cache when it is there.'''
+    global parser
+    if parser is None:
+        text = GRAMMAR.read_text()
+        cache = grammar_cache(text)
+        try:
+            cache.parent.mkdir(exist_ok=True)
+        except OSError:
+            pass  # read-only install: lark just builds the tables without caching them
+        parser = Lark(text, start='expr', parser='lalr', strict=True, cache=str(cache)) #import lark grammar
+    return parser
+
+def get_ast_parser() -> Lark:
+    '''
+    Like get_parser(), but its parse() returns the AST: ToExpr's callbacks run as the LALR parser reduces each
+    rule, so no parse tree is built and walked a second time, and every node records its span in the source.
+    '''
+    global ast_parser
+    if ast_parser is None:
+        text = GRAMMAR.read_text()
+        get_parser()  # makes sure the tables are cached; both parsers load the same file
+        ast_parser = Lark(text, start='expr', parser='lalr', strict=True, cache=str(grammar_cache(text)),
+                          transformer=Spans(ToExpr()))
+    return ast_parser
 
-parser = Lark(Path('expr.lark').read_text(),start='expr', parser='lalr', strict=True) #import lark grammar
 class ParseError(Exception): #raise some error 
     pass
 
 def parse(s:str) -> ParseTree: #output parsetree
     try:
-        return parser.parse(s)
+        return get_parser().parse(s)
     except Exception as e:
         raise ParseError(e)
 
@@ -18,6 +56,22 @@ class AmbiguousParse(Exception): #raise error if expr is ambigous
 
 class ToExpr(Transformer[Token,Expr]): #Class ToExpr that is a subclass of Transformer which will transform tokens into expressions
     '''Defines a transformation from5 a parse tree into an AST'''
+    def __init__(self, hashcons: bool = False):
+        super().__init__()
+        self.nodes: dict | None = {} if hashcons else None  # interned nodes, keyed by type and fields
+
+    def mk(self, cls, *args) -> Expr:
+        '''Builds an AST node; with hashcons on, structurally identical subtrees come back as one shared instance.'''
+        if self.nodes is None:
+            return cls(*args)
+        # children are already interned, so comparing them by identity is enough; leaves also key on their
+        # type so that Lit(True) and Lit(1) stay apart
+        key = (cls, *(id(a) if is_dataclass(a) else (type(a), a) for a in args))
+        node = self.nodes.get(key)
+        if node is None:
+            node = self.nodes[key] = cls(*args)
+        return node
+
     def flag(self, args):
         return "-" + args[0].value  # Convert flag token to string
     def command_base(self, args):
@@ -25,7 +79,14 @@ class ToExpr(Transformer[Token,Expr]): #Class ToExpr that is a subclass of Trans
         flags = []
         arguments = []
 
-        for arg in args[2:]:  # Process flags and arguments
+        rest = []
+        for arg in args[2:]:  # several arguments arrive wrapped in an `args` tree
+            if isinstance(arg, Tree) and arg.data == "args":
+                rest.extend(arg.children)
+            else:
+                rest.append(arg)
+
+        for arg in rest:  # Process flags and arguments
 
             # Handle flags correctly even if they arrive as strings
             if isinstance(arg, str) and arg.startswith("-"):
@@ -36,43 +97,51 @@ class ToExpr(Transformer[Token,Expr]): #Class ToExpr that is a subclass of Trans
                 flags.append(flag_value)
 
             elif isinstance(arg, Token):
-                if arg.type == "ID":
+                if arg.type in ("ID", "FILENAME", "INT"):
                     arguments.append(arg.value)
                 elif arg.type == "STRING":  
                     arguments.append(arg.value)  # Keep the quotes
 
-        return Command(program, flags=flags, arguments=arguments)
+        return self.mk(Command, program, tuple(flags), tuple(arguments))
     def pipe(self, args):
         left, right = args
-        return Pipe(left, right)
+        return self.mk(Pipe, left, right)
     def redirect_out(self, args):
-        return RedirectOut(args[0], Filename(args[1].value))
+        return self.mk(RedirectOut, args[0], self.mk(Filename, args[1].value))
+    def redirect_append(self, args):
+        return self.mk(Append, args[0], self.mk(Filename, args[1].value))
     def redirect_in(self, args):
-        return RedirectIn(args[0], Filename(args[1].value))
+        return self.mk(RedirectIn, args[0], self.mk(Filename, args[1].value))
     def redirect_err_out(self, args):
-        return RedirectErrorOut(args[0], Filename(args[1].value))
+        return self.mk(RedirectErrorOut, args[0], self.mk(Filename, args[1].value))
     def redirect_err_in(self, args):
-        return RedirectErrorIn(args[0], Filename(args[1].value))
+        return self.mk(RedirectErrorIn, args[0], self.mk(Filename, args[1].value))
     def background(self, args):
-        return Bg(args[0])
+        return self.mk(Bg, args[0])
+    def empty_array(self, args: tuple) -> Expr:
+        return self.mk(ArrayLit, ())
+    def array_exp(self, args: tuple[Token | int, ...]) -> Expr:
+        return self.mk(ArrayLit, tuple(int(x) for x in args))
+    def negative(self, args: tuple[Token]) -> int:
+        return -int(args[0].value)
     def true(self, args: tuple) -> Expr:
-        return Lit(True)  # Represent 'true' as a boolean literal True
+        return self.mk(Lit, True)  # Represent 'true' as a boolean literal True
     def false(self, args: tuple) -> Expr:
-        return Lit(False)  # Represent 'false' as a boolean literal False
+        return self.mk(Lit, False)  # Represent 'false' as a boolean literal False
     def plus(self, args:tuple[Expr,Expr]) -> Expr: #if you run across a plus, transform into an ADD ast node
-        return Add(args[0],args[1])
+        return self.mk(Add, args[0],args[1])
     def times(self, args:tuple[Expr,Expr]) -> Expr:
-        return Mul(args[0],args[1])
+        return self.mk(Mul, args[0],args[1])
     def minus(self, args:tuple[Expr,Expr]) -> Expr:
-        return Sub(args[0],args[1])
+        return self.mk(Sub, args[0],args[1])
     def divide(self, args:tuple[Expr,Expr]) -> Expr:
-        return Div(args[0],args[1])
+        return self.mk(Div, args[0],args[1])
     def and_exp(self, args:tuple[Expr, Expr]) -> Expr:
-        return And(args[0],args[1])
+        return self.mk(And, args[0],args[1])
     def or_exp(self, args:tuple[Expr, Expr]) -> Expr:
-        return Or(args[0],args[1])
+        return self.mk(Or, args[0],args[1])
     def not_exp(self, args:tuple[Expr]) -> Expr:
-        return Not(args[0])
+        return self.mk(Not, args[0])
     def comparison_expr(self, args: tuple) -> Expr:
         left = args[0]
         op_tree = args[1]  # This is a Tree, not a Token!
@@ -80,55 +149,117 @@ class ToExpr(Transformer[Token,Expr]): #Class ToExpr that is a subclass of Trans
 
         op = op_tree.data # Access the data attribute of the tree, which is the operator name
         if op == "equalop":
-            return Eq(left, right)
+            return self.mk(Eq, left, right)
         elif op == "lessthan":
-            return Lt(left, right)
+            return self.mk(Lt, left, right)
         else:
             raise Exception("Unknown comparison operator")
     def neg(self, args:tuple[Expr]) -> Expr:
-        return Neg(args[0])
+        return self.mk(Neg, args[0])
     def let(self, args:tuple[Token,Expr,Expr]) -> Expr:
-        return Let(args[0].value,args[1],args[2]) 
+        return self.mk(Let, args[0].value,args[1],args[2]) 
     def id(self, args: tuple[Token]) -> Expr:
         if args[0].value == "true":
-            return Lit(True)
+            return self.mk(Lit, True)
         elif args[0].value == "false":
-            return Lit(False)
-        return Name(args[0].value)
+            return self.mk(Lit, False)
+        return self.mk(Name, args[0].value)
     def int(self,args:tuple[Token]) -> Expr:
-        return Lit(int(args[0].value))
+        return self.mk(Lit, int(args[0].value))
     def ifnz(self,args:tuple[Expr,Expr,Expr]) -> Expr:
-        return If(args[0],args[1],args[2])
+        return self.mk(If, args[0],args[1],args[2])
     def if_exp(self, args: tuple[Expr,Expr,Expr]) -> Expr:
-        return If(args[0], args[1], args[2])
+        return self.mk(If, args[0], args[1], args[2])
         
     def letfun(self, args: tuple[Token, Token, Expr, Expr]) -> Expr:
         name = args[0].value
-        param = Name(args[1].value)  # Create a Name node for the parameter
+        param = self.mk(Name, args[1].value)  # Create a Name node for the parameter
         body = args[2]
         inexpr = args[3]
-        return Letfun(name, param, body, inexpr)
+        return self.mk(Letfun, name, param, body, inexpr)
     def app(self, args: tuple[Expr, Expr]) -> Expr:
         fun_expr = args[0]
         if isinstance(fun_expr, Token):  # Convert Token to Name if necessary
-            fun_expr = Name(fun_expr.value)
-        return App(fun_expr, args[1])
+            fun_expr = self.mk(Name, fun_expr.value)
+        return self.mk(App, fun_expr, args[1])
+    def call(self, args: tuple[Expr, ...]) -> Expr:
+        fun_expr = args[0]
+        for arg in args[1:]:
+            fun_expr = self.mk(App, fun_expr, arg)
+        return fun_expr
     
     def _ambig(self,_) -> Expr:    # ambiguity marker
         raise AmbiguousParse()
 
 
-def parse_and_run(s: str):
-    """Parses the input string, converts it into an AST, and executes it."""
+def offsets(child) -> tuple[int, int] | None:
+    '''Start and end of a callback's argument in the source: a token, a node, or an untransformed args tree.'''
+    if isinstance(child, Token):
+        return child.start_pos, child.end_pos
+    if isinstance(child, Node):
+        span = child.span
+        return (span >> 32, span & 0xFFFFFFFF) if span else None
+    if isinstance(child, Tree) and child.children:
+        first, last = offsets(child.children[0]), offsets(child.children[-1])
+        return (first[0], last[1]) if first and last else None
+    return None  # flags and negative array elements arrive as plain strs and ints
+
+class Spans:
+    '''
+    The transformer get_ast_parser() hands lark: ToExpr's callbacks, each wrapped to stamp the node it returns
+    with the span from its first argument to its last. Keywords and brackets are not passed to callbacks, so
+    a span starts and ends at the outermost operands, names and literals (in let x = 1 in x end, at x ... x).
+    '''
+    def __init__(self, transformer: ToExpr):
+        self.transformer = transformer
+
+    def __getattr__(self, name: str):
+        if name.startswith("_"):
+            raise AttributeError(name)  # e.g. __default__, which would otherwise make lark call it for every rule
+        callback = getattr(self.transformer, name)
+        def spanned(children: list):
+            node = callback(children)
+            if isinstance(node, Node) and not node.span:  # a hash-consed node keeps the span it was first seen at
+                first = last = None
+                for child in children:
+                    if first := offsets(child):
+                        break
+                for child in reversed(children):
+                    if last := offsets(child):
+                        break
+                if first and last:
+                    object.__setattr__(node, "_span", first[0] << 32 | last[1])  # frozen, but brand new
+            return node
+        return spanned
+
+def front_end(s: str, level: int = 0) -> tuple[Expr, Report | None]:
+    '''Parses s into an AST and optimizes it at level (reporting on that), or loads both from ast_cache.'''
+    if ast_cache.enabled:
+        cached = ast_cache.load(s, level)
+        if cached is not None:
+            return cached
+    ast, report = get_ast_parser().parse(s), None
+    if level > 0:
+        ast, report = optimize(ast, level)
+    if ast_cache.enabled:
+        ast_cache.store(s, level, (ast, report))
+    return ast, report
+
+def parse_and_run(s: str, backend: str = "tree", level: int = 0, cse: bool = False, memo: bool = False, cache: bool = False,
+                  parallel: bool = False, typed: bool = False):
+    """Parses the input string, converts it into an AST, optimizes it at the given level and executes it."""
     try:
-        parse_tree = parser.parse(s)
-        ast = ToExpr().transform(parse_tree)
-        run(ast)
+        ast, report = front_end(s, level)
+        if report is not None:
+            print(report)
+        run(ast, backend, cse, memo, cache, parallel, typed, source=s)
     except VisitError as e:
         if isinstance(e.orig_exc, AmbiguousParse):
             raise AmbiguousParse()
         else:
             raise e
+    except EvalError:
+        raise  # the optimizer found a certain error, e.g. a literal division by zero
     except Exception as e:
         raise ParseError(e)
 
@@ -160,16 +291,17 @@ test_dsl2 = "COM echo 'Hello, world!'"
 test_dsl3 = "COM grep 'error'"
 test_dsl4 = "COM ls -la | grep"
 
-parse_and_run(test_arith1)
-parse_and_run(test_arith2)
-parse_and_run(test_arith3)
-parse_and_run(test_arith4)
-parse_and_run(test_arith5)
-parse_and_run(test_arith6)
-parse_and_run(test_bool1)
-parse_and_run(test_bool2)
-parse_and_run(test_bool3)
-parse_and_run(test_bool_simple1)
-parse_and_run(test_bool_simple2)
-parse_and_run(test_bool_simple3)
-parse_and_run(test_dsl4)
+if __name__ == "__main__":
+    parse_and_run(test_arith1)
+    parse_and_run(test_arith2)
+    parse_and_run(test_arith3)
+    parse_and_run(test_arith4)
+    parse_and_run(test_arith5)
+    parse_and_run(test_arith6)
+    parse_and_run(test_bool1)
+    parse_and_run(test_bool2)
+    parse_and_run(test_bool3)
+    parse_and_run(test_bool_simple1)
+    parse_and_run(test_bool_simple2)
+    parse_and_run(test_bool_simple3)
+    parse_and_run(test_dsl4)
@@ -0,0 +1,232 @@
+from typing import List, IO
+from dataclasses import dataclass, field
+from contextlib import asynccontextmanager
+from weakref import WeakKeyDictionary
+import os
+import asyncio
+from spawn import Child, PIPE, DEVNULL, OutputLimitError, read_all, spawn, spawn_stats
+
+
+@dataclass
+class Stage():
+    argv: List[str]
+    stdin: str | None = None    # file the stage reads from instead of the previous stage
+    stdout: str | None = None   # file the stage writes to instead of the next stage
+    stderr: str | None = None   # file the stage writes its errors to
+    stderr_in: str | None = None  # file opened for reading as the stage's fd 2, as sh does for 2<
+    append: bool = False        # add to the end of the stdout file instead of truncating it
+
+    def __str__(self) -> str:
+        return " ".join(self.argv)
+
+    @property
+    def mode(self) -> str:
+        '''How to open the stdout file.'''
+        return "ab" if self.append else "wb"
+
+@dataclass
+class PipelineResult():
+    statuses: List[int] = field(default_factory=list)  # exit status of every stage, in order
+    output: bytearray | None = None  # the last stage's stdout, only set when it was captured
+
+    @property
+    def status(self) -> int:
+        return self.statuses[-1] if self.statuses else 0
+
+    @property
+    def stdout(self) -> str | None:
+        return None if self.output is None else self.output.decode(errors="replace")
+
+@dataclass
+class Capture():
+    '''How the output of a command used as a value is read back (files and pipes never go through Python).'''
+    max_bytes: int | None = int(os.environ.get("EXPR_MAX_OUTPUT", 0)) or None  # past this, evaluation fails
+    binary: bool = False  # values are memoryviews over the exact bytes, rather than decoded and stripped str
+
+capture_policy = Capture()
+
+def run_pipeline(stages: List[Stage], capture: bool = True, stdout: IO | None = None,
+                 limit: int | None = None) -> PipelineResult:
+    '''
+    Starts every stage at once, wiring stage i's stdout to stage i+1's stdin through a kernel pipe,
+    so no intermediate output ever passes through Python. Only the last stage's output is read back,
+    and only when capture is set; otherwise it goes to the given file object (or our own stdout).
+    Past limit bytes of captured output, every stage is killed and OutputLimitError raised.
+    '''
+    procs = start_pipeline(stages, capture, stdout)
+    result = PipelineResult()
+    if capture and stages[-1].stdout is None:
+        try:
+            result.output = read_all(procs[-1].stdout, limit)
+        except OutputLimitError:
+            for proc in procs:
+                proc.kill()
+                proc.wait()
+            raise
+        finally:
+            procs[-1].stdout.close()
+    result.statuses = [proc.wait() for proc in procs]
+    return result
+
+def start_pipeline(stages: List[Stage], capture: bool = True, stdout: IO | None = None) -> List[Child]:
+    '''Starts the stages as run_pipeline() does and returns without waiting for them.'''
+    procs: List[Child] = []
+    files: List[IO] = []
+    prev = None
+    try:
+        for i, stage in enumerate(stages):
+            last = i == len(stages) - 1
+
+            if stage.stdin is not None:
+                stdin = open(stage.stdin, "rb")
+                files.append(stdin)
+            elif prev is not None:
+                stdin = prev
+            else:
+                stdin = None
+
+            if stage.stdout is not None:
+                out = open(stage.stdout, stage.mode)
+                files.append(out)
+            elif not last:
+                out = PIPE
+            elif capture:
+                out = PIPE
+            else:
+                out = stdout
+
+            err = None
+            if stage.stderr is not None:
+                err = open(stage.stderr, "wb")
+                files.append(err)
+            elif stage.stderr_in is not None:
+                err = open(stage.stderr_in, "rb")
+                files.append(err)
+
+            proc = spawn(stage.argv, stdin=stdin, stdout=out, stderr=err)
+            procs.append(proc)
+
+            # the child owns its end now; closing ours lets the producer see SIGPIPE if the consumer exits early
+            if prev not in (None, DEVNULL):
+                prev.close()
+            if stage.stdout is not None and not last:
+                prev = DEVNULL  # next stage reads nothing, like sh does after a redirect
+            else:
+                prev = proc.stdout
+    except OSError:
+        for proc in procs:
+            proc.kill()
+            proc.wait()
+        raise
+    finally:
+        for f in files:
+            f.close()
+    return procs
+
+class ChildLimit:
+    '''
+    Caps the number of child processes the async evaluator runs at once, across every evaluation on one
+    event loop. A pipeline takes a slot per stage, all at once (or the whole cap, if it is longer).
+    '''
+    def __init__(self, max_children: int = 16):
+        self.max_children = max_children
+        self.loops: WeakKeyDictionary[asyncio.AbstractEventLoop, tuple[asyncio.Condition, List[int]]] = WeakKeyDictionary()
+
+    def state(self) -> tuple[asyncio.Condition, List[int]]:
+        loop = asyncio.get_running_loop()
+        if loop not in self.loops:
+            self.loops[loop] = (asyncio.Condition(), [0])  # the condition belongs to this loop, the list counts children
+        return self.loops[loop]
+
+    @asynccontextmanager
+    async def reserve(self, n: int = 1):
+        n = min(n, self.max_children)
+        changed, running = self.state()
+        async with changed:
+            await changed.wait_for(lambda: running[0] + n <= self.max_children)
+            running[0] += n
+        try:
+            yield
+        finally:
+            async with changed:
+                running[0] -= n
+                changed.notify_all()
+
+child_limit = ChildLimit()
+
+async def aread_all(stream: asyncio.StreamReader, limit: int | None = None) -> bytearray:
+    '''read_all() for asyncio streams.'''
+    buf = bytearray()
+    while data := await stream.read(1 << 16):
+        buf += data
+        if limit is not None and len(buf) > limit:
+            raise OutputLimitError(limit)
+    return buf
+
+async def arun_pipeline(stages: List[Stage], capture: bool = True, stdout: IO | None = None,
+                        limit: int | None = None) -> PipelineResult:
+    '''
+    run_pipeline() for asyncio: the stages are wired through kernel pipes the same way, and only the last
+    stage's output is read back, through an asyncio pipe, while the event loop keeps running other work.
+    '''
+    async with child_limit.reserve(len(stages)):
+        procs: List[asyncio.subprocess.Process] = []
+        try:
+            prev: int | None = None  # read end of the pipe from the previous stage
+            for i, stage in enumerate(stages):
+                last = i == len(stages) - 1
+                files: List[IO] = []
+                ours: List[int] = []  # descriptors the child gets copies of, closed here once it has started
+                try:
+                    piped, prev = prev, None
+                    if piped is not None:
+                        ours.append(piped)
+                    if stage.stdin is not None:
+                        stdin = open(stage.stdin, "rb")
+                        files.append(stdin)
+                    else:
+                        stdin = piped
+
+                    if stage.stdout is not None:
+                        out = open(stage.stdout, stage.mode)
+                        files.append(out)
+                        if not last:
+                            prev = os.open(os.devnull, os.O_RDONLY)  # next stage reads nothing, like sh does after a redirect
+                    elif not last:
+                        prev, out = os.pipe()
+                        ours.append(out)
+                    elif capture:
+                        out = asyncio.subprocess.PIPE
+                    else:
+                        out = stdout
+
+                    err = None
+                    if stage.stderr is not None:
+                        err = open(stage.stderr, "wb")
+                        files.append(err)
+                    elif stage.stderr_in is not None:
+                        err = open(stage.stderr_in, "rb")
+                        files.append(err)
+
+                    proc = await asyncio.create_subprocess_exec(*stage.argv, stdin=stdin, stdout=out, stderr=err)
+                finally:
+                    for f in files:
+                        f.close()
+                    for fd in ours:
+                        os.close(fd)
+                spawn_stats.spawned += 1
+                procs.append(proc)
+
+            result = PipelineResult()
+            if capture and stages[-1].stdout is None:
+                result.output = await aread_all(procs[-1].stdout, limit)
+            result.statuses = [await proc.wait() for proc in procs]
+            return result
+        except BaseException:  # failed to start, or cancelled: don't leave children behind
+            if prev is not None:
+                os.close(prev)
+            for proc in procs:
+                if proc.returncode is None:
+                    proc.kill()
+                await proc.wait()
+            raise
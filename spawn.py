@@ -0,0 +1,132 @@
+'''
+The one place child processes are started from (the asyncio evaluator excepted: its event loop has to own its
+children). spawn() takes an argv that ToExpr has already split and execs it directly, never through /bin/sh.
+Where the os has posix_spawnp() (glibc implements it with a vfork-style clone, so the parent's memory is never
+copied), it is used directly, with dup2 file actions for the standard streams; elsewhere subprocess.Popen does it.
+'''
+import os
+import signal
+import selectors
+import subprocess
+from dataclasses import dataclass
+from typing import IO, List
+
+PIPE = subprocess.PIPE
+DEVNULL = subprocess.DEVNULL
+
+RESTORED = tuple(getattr(signal, name) for name in ("SIGPIPE", "SIGXFSZ") if hasattr(signal, name))
+
+type Stream = IO | int | None  # a file, a descriptor, PIPE, DEVNULL, or None to inherit ours
+
+@dataclass
+class SpawnStats():
+    spawned: int = 0  # child processes started since import, by every launch site
+
+spawn_stats = SpawnStats()
+
+class Child:
+    '''A started process, with the parts of Popen's interface the interpreter uses.'''
+    def __init__(self, pid: int, stdin: IO | None, stdout: IO | None, stderr: IO | None):
+        self.pid = pid
+        self.stdin = stdin
+        self.stdout = stdout
+        self.stderr = stderr
+        self.returncode: int | None = None  # also set by whoever reaps the child instead of wait()
+
+    def wait(self) -> int:
+        if self.returncode is None:
+            _, status = os.waitpid(self.pid, 0)
+            self.returncode = os.waitstatus_to_exitcode(status)
+        return self.returncode
+
+    def kill(self) -> None:
+        if self.returncode is None:
+            try:
+                os.kill(self.pid, signal.SIGKILL)
+            except ProcessLookupError:
+                pass
+
+    def communicate(self, limit: int | None = None) -> tuple[bytearray, bytes]:
+        return collect(self, limit)
+
+class OutputLimitError(Exception):
+    '''A captured stdout grew past the caller's limit; whoever was writing it has been killed.'''
+    def __init__(self, limit: int):
+        super().__init__(f"more than {limit} bytes")
+        self.limit = limit
+
+def collect(proc: "Child | subprocess.Popen", limit: int | None = None) -> tuple[bytearray, bytes]:
+    '''
+    Reads proc's stdout and stderr (whichever are pipes) to the end, together so neither can fill up, then waits.
+    stdout goes into one growing buffer, never a list of chunks to join; past limit bytes, proc is killed and
+    OutputLimitError raised.
+    '''
+    chunks: dict[IO, bytearray] = {f: bytearray() for f in (proc.stdout, proc.stderr) if f is not None}
+    with selectors.DefaultSelector() as selector:
+        for f in chunks:
+            selector.register(f, selectors.EVENT_READ)
+        while selector.get_map():
+            for key, _ in selector.select():
+                data = os.read(key.fd, 1 << 16)
+                if data:
+                    chunks[key.fileobj] += data
+                else:
+                    selector.unregister(key.fileobj)
+                    key.fileobj.close()
+            if limit is not None and len(chunks.get(proc.stdout, b"")) > limit:
+                proc.kill()
+                for f in chunks:
+                    f.close()
+                proc.wait()
+                raise OutputLimitError(limit)
+    proc.wait()
+    return chunks.get(proc.stdout, bytearray()), bytes(chunks.get(proc.stderr, b""))
+
+def read_all(f: IO, limit: int | None = None) -> bytearray:
+    '''Reads f to the end into one buffer; OutputLimitError past limit bytes, leaving the writer to the caller.'''
+    buf = bytearray()
+    while data := os.read(f.fileno(), 1 << 16):
+        buf += data
+        if limit is not None and len(buf) > limit:
+            raise OutputLimitError(limit)
+    return buf
+
+def spawn(argv: List[str], stdin: Stream = None, stdout: Stream = None, stderr: Stream = None) -> Child | subprocess.Popen:
+    '''Starts argv, looked up on PATH, with the given standard streams; raises OSError when it can't be started.'''
+    if not hasattr(os, "posix_spawnp"):
+        proc = subprocess.Popen(argv, stdin=stdin, stdout=stdout, stderr=stderr)
+        spawn_stats.spawned += 1
+        return proc
+
+    actions = []
+    theirs: List[int] = []     # descriptors only the child needs, closed here once it has started
+    ours: List[IO | None] = [None, None, None]  # our ends of PIPEs, by target descriptor
+    try:
+        for target, spec in ((0, stdin), (1, stdout), (2, stderr)):
+            if spec is None:
+                continue
+            if spec == PIPE:
+                r, w = os.pipe()
+                fd, mine = (r, w) if target == 0 else (w, r)
+                theirs.append(fd)
+                ours[target] = open(mine, "wb" if target == 0 else "rb")
+            elif spec == DEVNULL:
+                fd = os.open(os.devnull, os.O_RDWR)
+                theirs.append(fd)
+            elif isinstance(spec, int):
+                fd = spec
+            else:
+                fd = spec.fileno()
+            actions.append((os.POSIX_SPAWN_DUP2, fd, target))  # dup2 clears close-on-exec on the target
+        # Python ignores SIGPIPE, and ignored signals stay ignored across exec; Popen puts it back, and so must we
+        pid = os.posix_spawnp(argv[0], argv, os.environ, file_actions=actions, setsigdef=RESTORED)
+    except BaseException:
+        for f in ours:
+            if f is not None:
+                f.close()
+        raise
+    finally:
+        for fd in theirs:
+            os.close(fd)
+    spawn_stats.spawned += 1
+    return Child(pid, *ours)
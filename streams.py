@@ -0,0 +1,84 @@
+'''
+Lazy streams of values, as made by lines(...) and transformed by map, filter and take. A stream is read once,
+front to back, and each value is computed only when something asks for it: fold, a take that is itself read,
+or run() printing the result. Nothing is buffered beyond the pipe between the command and us.
+
+A stream over a command owns its processes. Closing the stream (take does it as soon as it has its values,
+fold and run() when they are done or fail) closes our end of the pipe and kills whatever is still running, so
+take(10, lines(COM yes)) ends after ten lines. A stream that is dropped without being read is closed when it
+is garbage collected.
+'''
+import re
+import weakref
+from typing import Any, Callable, Iterator, List
+from spawn import Child
+
+class Stream:
+    def __init__(self, items: Iterator[Any], cleanup: Callable[[], None] | None = None,
+                 upstream: "Stream | None" = None):
+        self.items = items
+        self.upstream = upstream  # closed along with this stream
+        self.started = False
+        self.finalizer = weakref.finalize(self, cleanup) if cleanup is not None else None
+
+    def __iter__(self) -> Iterator[Any]:
+        self.started = True
+        return self.items
+
+    def close(self) -> None:
+        self.items.close()
+        if self.finalizer is not None:
+            self.finalizer()
+        if self.upstream is not None:
+            self.upstream.close()
+
+    def __str__(self) -> str:
+        return "<stream>"
+
+def stop(procs: List[Child]) -> None:
+    if procs[-1].stdout is not None:
+        procs[-1].stdout.close()  # a producer that is still writing gets SIGPIPE
+    for proc in procs:
+        proc.kill()  # and if it is not writing, or ignores that, this
+        proc.wait()
+
+INTEGER = re.compile(r"-?[0-9]+")
+
+def value(line: str) -> int | str:
+    '''A line as a value: an int when it is one (so seq's output can be added up and compared), else the text.'''
+    return int(line) if INTEGER.fullmatch(line) else line
+
+def output_lines(procs: List[Child]) -> Stream:
+    '''The last process's stdout, a line (without the newline) at a time.'''
+    def lines() -> Iterator[int | str]:
+        if procs[-1].stdout is None:  # redirected to a file
+            return
+        for line in procs[-1].stdout:
+            yield value(line.rstrip(b"\n").decode(errors="replace"))
+    return Stream(lines(), lambda: stop(procs))
+
+def text_lines(text: str) -> Stream:
+    return Stream(value(line) for line in text.splitlines())
+
+def mapped(f: Callable[[Any], Any], s: Stream) -> Stream:
+    return Stream((f(x) for x in s), upstream=s)
+
+def filtered(p: Callable[[Any], bool], s: Stream) -> Stream:
+    return Stream((x for x in s if p(x)), upstream=s)
+
+def taken(n: int, s: Stream) -> Stream:
+    items = iter(s)  # claimed now, like map and filter claim theirs
+
+    def first() -> Iterator[Any]:
+        left = n
+        if left <= 0:
+            s.close()
+            return
+        for x in items:
+            left -= 1
+            if left == 0:
+                s.close()  # before handing over the last value, so the producer stops now
+            yield x
+            if left == 0:
+                return
+    return Stream(first(), upstream=s)
@@ -0,0 +1,13 @@
+'''Arrays, and what importing them costs programs that make none.'''
+import sys
+import subprocess
+from pathlib import Path
+from interp import ArrayLit, Sum, Mul, Lit, evaluate
+
+def test_numpy_is_imported_by_the_first_array():
+    code = ("import sys, parser, interp, batch; assert 'numpy' not in sys.modules; "
+            "interp.evaluate(interp.ArrayLit((1, 2))); assert 'numpy' in sys.modules")
+    subprocess.run([sys.executable, "-c", code], cwd=Path(__file__).parent, check=True)
+
+def test_array_arithmetic():
+    assert evaluate(Sum(Mul(ArrayLit((1, 2, 3)), Lit(2)))) == 12
@@ -0,0 +1,70 @@
+'''The AST cache gives back what was stored, renames whole files into place, and treats a bad entry as a miss.'''
+import os
+import time
+import pytest
+from astcache import AstCache
+from parser import front_end, get_ast_parser
+
+SOURCE = "let x = 4 in x * x end"
+
+@pytest.fixture
+def cache(tmp_path) -> AstCache:
+    return AstCache(tmp_path)
+
+def test_round_trip(cache):
+    ast = get_ast_parser().parse(SOURCE)
+    assert cache.load(SOURCE) is None
+    cache.store(SOURCE, 0, (ast, None))
+    assert cache.load(SOURCE) == (ast, None)
+    assert cache.load(SOURCE, 1) is None  # another optimization level is another entry
+    assert (cache.stats.hits, cache.stats.misses, cache.stats.writes) == (1, 2, 1)
+
+def test_store_renames_into_place(cache, monkeypatch):
+    renamed = []
+    replace = os.replace
+    def spy(src, dst):
+        assert os.path.basename(src).endswith(".tmp") and os.path.getsize(src) > 0  # written out in full first
+        renamed.append(dst)
+        replace(src, dst)
+    monkeypatch.setattr(os, "replace", spy)
+    cache.store(SOURCE, 0, "value")
+    assert renamed == [cache.path(SOURCE, 0)]
+    assert [p.name for p in cache.directory.iterdir()] == [cache.path(SOURCE, 0).name]
+
+def test_failed_store_leaves_no_temporary_file(cache, monkeypatch):
+    cache.store(SOURCE, 0, "old")
+    def fail(src, dst):
+        raise OSError("disk full")
+    monkeypatch.setattr(os, "replace", fail)
+    cache.store(SOURCE, 0, "new")
+    assert cache.stats.errors == 1
+    assert not list(cache.directory.glob("*.tmp"))
+    assert cache.load(SOURCE) == "old"
+
+def test_corrupt_entry_is_a_miss_and_is_overwritten(cache):
+    cache.store(SOURCE, 0, "value")
+    cache.path(SOURCE, 0).write_bytes(b"not zlib")
+    assert cache.load(SOURCE) is None
+    assert (cache.stats.misses, cache.stats.errors) == (1, 1)
+    cache.store(SOURCE, 0, "value")
+    assert cache.load(SOURCE) == "value"
+
+def test_prune_drops_least_recently_used(tmp_path):
+    cache = AstCache(tmp_path, max_bytes=1)  # every entry is over the limit
+    cache.store("1", 0, "a")
+    stale = tmp_path / ".left-behind.tmp"
+    stale.write_bytes(b"x")
+    os.utime(stale, (time.time() - 7200,) * 2)
+    cache.store("2", 0, "b")
+    assert cache.load("1") is None and not stale.exists()
+    assert cache.stats.evictions >= 1
+
+def test_front_end_keeps_spans_through_the_cache(tmp_path, monkeypatch):
+    from astcache import ast_cache
+    monkeypatch.setattr(ast_cache, "directory", tmp_path)
+    monkeypatch.setattr(ast_cache, "enabled", True)
+    parsed, _ = front_end(SOURCE)
+    hits = ast_cache.stats.hits
+    loaded, _ = front_end(SOURCE)
+    assert ast_cache.stats.hits == hits + 1
+    assert loaded == parsed and loaded.span == parsed.span != 0
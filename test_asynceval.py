@@ -0,0 +1,14 @@
+'''The asyncio evaluator reports failures the way eval() does.'''
+import asyncio
+import pytest
+from interp import Command, Pipe, EvalError, resolve
+from asynceval import aeval, arun
+
+def test_missing_program_is_an_eval_error():
+    with pytest.raises(EvalError, match="Failed to start command"):
+        asyncio.run(aeval(resolve(Command("no-such-program-expr-test"))))
+    assert asyncio.run(arun(Command("no-such-program-expr-test"))) is None
+
+def test_missing_program_in_a_pipeline_is_an_eval_error():
+    with pytest.raises(EvalError, match="Failed to start pipeline"):
+        asyncio.run(aeval(resolve(Pipe(Command("echo", (), ("hi",)), Command("no-such-program-expr-test")))))
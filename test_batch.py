@@ -0,0 +1,56 @@
+'''The batch runner gives one result per script, in order, and a failing script fails alone.'''
+import json
+import pytest
+from batch import Result, run_batch, run_script, scripts
+from astcache import ast_cache
+
+SCRIPTS = [
+    ("ok", "let x = 4 in x * x end"),
+    ("array", "[1, 2, 3]"),
+    ("parse", "let x = in x end"),
+    ("eval", "let x = 0 in 1 / x end"),
+    ("deep", "-" * 5000 + "1"),  # too deep to evaluate recursively
+    ("bool", "1 < 2"),
+]
+
+@pytest.fixture(autouse=True)
+def cache(tmp_path, monkeypatch):
+    monkeypatch.setattr(ast_cache, "directory", tmp_path / "ast")
+    monkeypatch.setattr(ast_cache, "enabled", True)
+
+def check(results: list[Result]) -> None:
+    by_id = {r.id: r for r in results}
+    assert by_id["ok"].value == 16 and by_id["ok"].error is None
+    assert by_id["array"].value == [1, 2, 3]
+    assert by_id["parse"].error.startswith("parse error:")
+    assert by_id["eval"].value is None and "(at line 1, column " in by_id["eval"].error
+    assert by_id["deep"].error == "RecursionError: maximum recursion depth exceeded"
+    assert by_id["bool"].value is True
+
+@pytest.mark.parametrize("jobs", [1, 2])
+def test_results_in_order(jobs):
+    results = list(run_batch(SCRIPTS, jobs))
+    assert [r.id for r in results] == [id for id, _ in SCRIPTS]
+    check(results)
+
+def test_unordered_results():
+    results = list(run_batch(SCRIPTS, 2, ordered=False))
+    assert sorted(r.id for r in results) == sorted(id for id, _ in SCRIPTS)
+    check(results)
+
+def test_front_end_failure_is_reported():
+    result = run_script(("deep", "-" * 5000 + "1"), level=2)  # the optimizer recurses on it
+    assert result.error == "RecursionError: maximum recursion depth exceeded" and result.value is None
+
+def test_second_run_is_cached():
+    assert not run_script(("ok", "1 + 2")).cached
+    again = run_script(("ok", "1 + 2"))
+    assert again.cached and again.value == 3
+
+def test_scripts_from_a_directory_and_jsonl(tmp_path):
+    (tmp_path / "b").write_text("2")
+    (tmp_path / "a").write_text("1")
+    assert scripts(tmp_path) == [("a", "1"), ("b", "2")]
+    jsonl = tmp_path / "programs.jsonl"
+    jsonl.write_text(json.dumps({"id": "x", "source": "1 + 1"}) + "\n\n" + json.dumps("2 * 2") + "\n")
+    assert scripts(jsonl) == [("x", "1 + 1"), ("3", "2 * 2")]
@@ -0,0 +1,71 @@
+'''The in-process builtins must do exactly what the real binaries do: output, exit statuses, errors and files.'''
+import os
+import sys
+import tempfile
+from pathlib import Path
+import pytest
+from pipeline import Stage as S, PipelineResult, run_pipeline
+from builtin_commands import command_builtins, run_stages, REGISTRY
+
+CORPUS = [
+    [S(["echo", "hello", "world"])], [S(["echo", "-n", "no newline"])], [S(["echo", "-E", "-n", "x"])], [S(["echo"])],
+    [S(["cat", "a.txt"])], [S(["cat", "a.txt", "b.txt"])], [S(["cat", "missing", "a.txt"])], [S(["cat", "dir"])],
+    [S(["cat", "noeol"])], [S(["cat"], stdin="a.txt")], [S(["cat", "-", "b.txt"], stdin="a.txt")],
+    [S(["wc", "a.txt"])], [S(["wc", "-l", "a.txt"])], [S(["wc", "-lw", "a.txt", "b.txt"])], [S(["wc", "-c", "noeol"])],
+    [S(["wc", "missing"])], [S(["wc", "a.txt", "missing"])], [S(["wc", "missing", "a.txt"])], [S(["wc", "dir"])],
+    [S(["wc"], stdin="a.txt")], [S(["wc", "-l"], stdin="big")], [S(["cat", "a.txt"]), S(["wc"])],
+    [S(["cat", "a.txt"]), S(["wc", "-l"])], [S(["wc", "-w", "-"], stdin="b.txt")],
+    [S(["head", "big"])], [S(["head", "-n", "3", "big"])], [S(["head", "-n", "0", "a.txt"])],
+    [S(["head", "-n", "2", "a.txt", "b.txt"])], [S(["head", "a.txt", "missing", "b.txt"])], [S(["head", "dir"])],
+    [S(["head", "missing", "dir", "a.txt"])],
+    [S(["grep", "an", "a.txt"])], [S(["grep", "-n", "an", "a.txt"])], [S(["grep", "-i", "APPLE", "a.txt"])],
+    [S(["grep", "-v", "an", "a.txt"])], [S(["grep", "-c", "an", "a.txt", "b.txt"])], [S(["grep", "zzz", "a.txt"])],
+    [S(["grep", "an", "a.txt", "b.txt"])], [S(["grep", "-n", "an", "missing", "a.txt"])], [S(["grep", "an", "dir"])],
+    [S(["grep", "-F", "a.b", "b.txt"])], [S(["grep", "b", "binary"])], [S(["grep", "-c", "b", "binary"])],
+    [S(["grep", "an"], stdin="a.txt")], [S(["cat", "a.txt", "b.txt"]), S(["grep", "-n", "a"]), S(["wc", "-l"])],
+    [S(["echo", "x"], stdout="out.txt"), S(["wc"])], [S(["cat", "missing"], stderr="err.txt"), S(["wc", "-c"])],
+]
+
+@pytest.fixture
+def files(monkeypatch, tmp_path):
+    monkeypatch.chdir(tmp_path)
+    Path("a.txt").write_text("apple\nbanana\ncherry\nAPPLE pie\n")
+    Path("b.txt").write_text("a.b\naxb\nmango\n")
+    Path("noeol").write_text("one two\nthree")
+    Path("big").write_text("".join(f"line {i} of many words\n" for i in range(500)))  # under max_input
+    Path("binary").write_bytes(b"text b\nb\0b\n")
+    os.mkdir("dir")
+    enabled = command_builtins.enabled
+    yield
+    command_builtins.enabled = enabled
+
+def outcome(run, stages) -> tuple:
+    '''What running stages did: stdout, statuses, what went to fd 2, and the files it wrote.'''
+    with tempfile.TemporaryFile() as err, open(2, "w", closefd=False) as fd2:
+        fd = os.dup(2)
+        os.dup2(err.fileno(), 2)  # the real binaries and the builtins both write errors to fd 2
+        stderr, sys.stderr = sys.stderr, fd2  # which, under pytest, sys.stderr is not
+        try:
+            result: PipelineResult | None = run(stages)
+            fd2.flush()
+        finally:
+            sys.stderr = stderr
+            os.dup2(fd, 2)
+            os.close(fd)
+        assert result is not None  # run_stages() gives None for what it hands back to the real binaries
+        err.seek(0)
+        written = Path("out.txt").read_text() if os.path.exists("out.txt") else None
+        if os.path.exists("err.txt"):
+            written = (written, Path("err.txt").read_text())
+        for f in ("out.txt", "err.txt"):
+            if os.path.exists(f):
+                os.remove(f)
+        return result.stdout, result.statuses, err.read().decode(), written
+
+@pytest.mark.parametrize("stages", CORPUS, ids=lambda stages: " | ".join(map(str, stages)))
+def test_builtins_match_the_binaries(files, stages):
+    assert all(s.argv[0] in REGISTRY for s in stages)
+    command_builtins.enabled = True
+    ours = outcome(run_stages, stages)
+    command_builtins.enabled = False
+    assert ours == outcome(run_pipeline, stages)
@@ -0,0 +1,58 @@
+'''The command cache must give back what running the command would, and only cache hermetic runs.'''
+import os
+from pathlib import Path
+import pytest
+from interp import Command, EvalError, prepare, eval
+from pipeline import capture_policy
+from cmdcache import command_cache
+
+@pytest.fixture(autouse=True)
+def cache(monkeypatch, tmp_path):
+    monkeypatch.chdir(tmp_path)
+    Path("config").write_text("a=1\n")
+    os.mkdir("dir")
+    binary, limit = capture_policy.binary, capture_policy.max_bytes
+    command_cache.clear()
+    command_cache.enabled = True
+    yield
+    command_cache.enabled = False
+    command_cache.clear()
+    capture_policy.binary, capture_policy.max_bytes = binary, limit
+
+def run(program: str, *arguments: str):
+    return eval(prepare(Command(program, (), arguments)))
+
+def test_repeated_runs_hit():
+    assert run("cat", "config") == run("cat", "config") == "a=1"
+    assert (command_cache.stats.hits, command_cache.stats.misses) == (1, 1)
+
+def test_editing_a_file_invalidates():
+    assert run("cat", "config") == "a=1"
+    Path("config").write_text("a=2\n")
+    assert run("cat", "config") == "a=2"
+    assert command_cache.stats.misses == 2
+
+def test_text_and_bytes_are_cached_apart():
+    assert run("cat", "config") == "a=1"
+    capture_policy.binary = True
+    out = run("cat", "config")
+    assert isinstance(out, memoryview) and bytes(out) == b"a=1\n"
+    capture_policy.binary = False
+    assert run("cat", "config") == "a=1"
+    assert (command_cache.stats.hits, command_cache.stats.misses) == (1, 2)
+
+def test_a_lower_limit_is_not_bypassed():
+    assert run("cat", "config") == "a=1"
+    capture_policy.max_bytes = 2
+    with pytest.raises(EvalError):
+        run("cat", "config")
+
+@pytest.mark.parametrize("program, arguments", [
+    ("ls", ("-la",)),  # sizes and times of entries change without the directory's identity changing
+    ("stat", ("config",)),  # so does the access time it prints
+    ("cat", ("dir",)),  # nor do the contents of the files in a directory
+    ("grep", ("a",)),  # no file named, so it would read our stdin
+    ("date", ()),  # not on the allowlist
+])
+def test_runs_that_are_not_hermetic_are_not_cached(program, arguments):
+    assert not command_cache.cacheable([program, *arguments])
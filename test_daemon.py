@@ -0,0 +1,67 @@
+'''Scripts sent to the daemon over its socket come back with their results, run where and how the request says.'''
+import os
+import sys
+import time
+import socket
+import struct
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+import pytest
+from client import request, receive
+from daemon import listen
+
+HERE = Path(__file__).parent
+
+@pytest.fixture(scope="module")
+def daemon(tmp_path_factory):
+    path = str(tmp_path_factory.mktemp("daemon") / "expr.sock")
+    proc = subprocess.Popen([sys.executable, str(HERE / "daemon.py"), "--socket", path], cwd=HERE,
+                            stderr=subprocess.DEVNULL)
+    deadline = time.monotonic() + 30
+    while not os.path.exists(path):
+        assert proc.poll() is None and time.monotonic() < deadline, "the daemon did not start"
+        time.sleep(0.05)
+    yield path
+    proc.terminate()
+    assert proc.wait(10) == 0
+    assert not os.path.exists(path)  # removed on the way out
+
+def test_round_trip(daemon):
+    response = request("let x = 4 in x * x end", path=daemon)
+    assert response["value"] == 16 and response["error"] is None
+    assert set(response) == {"value", "error", "parse_ms", "eval_ms", "cached", "output"}
+
+def test_errors_say_where(daemon):
+    response = request("let x = 0 in\n1 / x end", path=daemon)
+    assert response["value"] is None and response["error"] == "Division by zero! (at line 2, column 1: 1 / x)"
+
+def test_cwd_and_env_are_the_request_s(daemon, tmp_path):
+    env = {"PATH": os.environ["PATH"], "EXPR_TEST": "from the request"}
+    assert request("COM pwd", cwd=str(tmp_path), path=daemon)["value"].strip() == str(tmp_path)
+    assert request("COM printenv EXPR_TEST", env=env, path=daemon)["value"].strip() == "from the request"
+    assert request("COM pwd", path=daemon)["value"].strip() == str(HERE)  # the daemon's own is untouched
+
+def test_bad_request(daemon):
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.connect(daemon)
+        sock.sendall(struct.pack(">I", 0xFFFFFFFF))
+        assert receive(sock)["error"].startswith("bad request")
+    assert request("1 + 1", path=daemon)["value"] == 2  # and the daemon carries on
+
+def test_concurrent_requests(daemon):
+    with ThreadPoolExecutor(8) as pool:
+        responses = list(pool.map(lambda n: request(f"{n} * 2", path=daemon), range(32)))
+    assert [r["value"] for r in responses] == [n * 2 for n in range(32)]
+
+def test_listen_replaces_a_dead_socket(tmp_path):
+    path = str(tmp_path / "dead.sock")
+    dead = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    dead.bind(path)
+    dead.close()  # the file stays, with no one listening
+    live = listen(path)
+    try:
+        with pytest.raises(RuntimeError, match="already listening"):
+            listen(path)
+    finally:
+        live.close()
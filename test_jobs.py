@@ -0,0 +1,30 @@
+'''Background jobs give back their output under the same capture policy as commands run in the foreground.'''
+import pytest
+from parser import get_ast_parser
+from interp import EvalError, evaluate
+from pipeline import capture_policy
+
+@pytest.fixture(autouse=True)
+def policy():
+    binary, limit = capture_policy.binary, capture_policy.max_bytes
+    yield
+    capture_policy.binary, capture_policy.max_bytes = binary, limit
+
+def value(source: str):
+    return evaluate(get_ast_parser().parse(source))
+
+def test_wait_gives_text():
+    assert value("wait(COM echo hi &)") == value("COM echo hi") == "hi"
+
+def test_wait_gives_bytes():
+    capture_policy.binary = True
+    out = value("wait(COM echo hi &)")
+    assert isinstance(out, memoryview) and bytes(out) == bytes(value("COM echo hi")) == b"hi\n"
+
+def test_wait_keeps_to_the_limit():
+    capture_policy.max_bytes = 4
+    assert value("wait(COM echo abc &)") == "abc"
+    with pytest.raises(EvalError, match="more than 4 bytes"):
+        value("wait(COM echo abcdef &)")
+    with pytest.raises(EvalError, match="more than 4 bytes"):
+        value("COM echo abcdef")
@@ -0,0 +1,73 @@
+'''Memoized calls give the plain results, and the memo table lets go of closures when the evaluation ends.'''
+import asyncio
+import contextlib
+import gc
+import io
+import pytest
+from parser import get_ast_parser
+from interp import Closure, evaluate, run
+from asynceval import arun
+from memo import current_table, evaluation, memoizing
+
+FIB = "letfun fib(n) = if n < 2 then n else fib(n - 1) + fib(n - 2) in fib(20) end"
+
+def closures() -> int:
+    gc.collect()
+    return sum(isinstance(o, Closure) for o in gc.get_objects())
+
+@pytest.mark.parametrize("backend", ["tree", "compiled"])
+def test_memoized_results(backend):
+    ast = get_ast_parser().parse(FIB)
+    assert evaluate(ast, backend, memo=True) == evaluate(ast, backend) == 6765
+
+@pytest.mark.parametrize("backend", ["tree", "compiled"])
+def test_closures_do_not_outlive_the_evaluation(backend):
+    ast = get_ast_parser().parse(FIB)
+    before = closures()
+    evaluate(ast, backend, memo=True)
+    assert current_table.get() is None
+    assert closures() == before
+
+def test_each_evaluation_starts_empty():
+    with evaluation() as first:
+        memoizing().call("f", 1, lambda: 2)
+        assert memoizing().call("f", 1, lambda: 3) == 2
+    with evaluation() as second:
+        assert memoizing().call("f", 1, lambda: 3) == 3
+    assert (first.hits, first.misses, second.hits, second.misses) == (1, 1, 0, 1)
+    assert memoizing() is None  # outside of an evaluation nothing is kept
+
+def test_an_inner_evaluation_shares_the_table():
+    with evaluation() as outer:
+        memoizing().call("f", 1, lambda: 2)
+        with evaluation() as inner:
+            assert memoizing().call("f", 1, lambda: 3) == 2
+    assert inner is outer and (outer.hits, outer.misses) == (1, 1)
+
+@pytest.mark.parametrize("backend", ["tree", "compiled"])
+def test_run_reports_the_table(backend):
+    out = io.StringIO()
+    with contextlib.redirect_stdout(out):
+        run(get_ast_parser().parse(FIB), backend, memo=True)
+    assert "Result = 6765" in out.getvalue()
+    assert "Memo table: 18 hits, 21 misses (46% hit rate), 0 evictions" in out.getvalue()
+
+def test_concurrent_aruns_keep_their_own_tables():
+    # each waits on a command between entering its evaluation and calling fib, so the two overlap
+    ast = get_ast_parser().parse(
+        'letfun fib(n) = if n < 2 then n else fib(n - 1) + fib(n - 2) in let x = COM sleep "0.1" in fib(20) end end')
+
+    async def both():
+        return await asyncio.gather(arun(ast, memo=True), arun(ast, memo=True))
+    out = io.StringIO()
+    with contextlib.redirect_stdout(out):
+        assert asyncio.run(both()) == [6765, 6765]
+    reports = [line for line in out.getvalue().splitlines() if line.startswith("Memo table")]
+    assert reports == ["Memo table: 18 hits, 21 misses (46% hit rate), 0 evictions"] * 2
+    assert current_table.get() is None
+
+@pytest.mark.parametrize("backend", ["tree", "compiled"])
+def test_memoized_tail_calls_run_in_constant_stack(backend):
+    # past memo.MemoTable.max_depth calls in progress, tail calls are made unmemoized, and loop
+    ast = get_ast_parser().parse("letfun c(n) = if n == 0 then 0 else c(n - 1) in c(20000) end")
+    assert evaluate(ast, backend, memo=True) == 0
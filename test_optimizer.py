@@ -0,0 +1,72 @@
+'''Every program must give the same value on every backend at every optimization level.'''
+import pytest
+from parser import get_ast_parser
+from optimizer import optimize
+from interp import Name, Let, Lit, Command, Bg, Wait, Letfun, Add, Mul, Lines, Map, Filter, Take, Fold, ArrayLit, ToArray, Sum, Max, Count, Lt, Expr, evaluate
+
+BACKENDS = ["tree", "compiled", "vm"]
+LEVELS = [0, 1, 2]
+
+PROGRAMS = [  # (program, value)
+    ("let x = 10 in x * 2 + 5 end", 25),
+    ("let x = 4 in let y = 2 in if y < x then x / y + 3 else 0 end end", 5),
+    ("letfun f(n) = if n == 0 then 1 else n * f(n - 1) in let k = 5 in f(k) end end", 120),
+    ("let x = 3 in letfun add(a) = letfun g(b) = a + b + x in g end in add(1, 2) end end", 6),
+    ("let x = 1 in let x = x + 1 in x * 10 end end", 20),
+]
+ARRAYS = [  # (program, value)
+    ("let x = [1, 2] in sum(x) end", 3),
+    ("let x = [1, 2, 3] in let k = 2 in max(x * k) + count(x) end end", 9),
+    ("let k = 4 in sum(array(COM seq 1 6) < k) end", 3),
+    (Let("x", Lit(5), Sum(Mul(ArrayLit((1, 2)), Name("x")))), 15),
+    (Let("x", Lit(2), Max(Mul(ToArray(Command("seq", (), ("1", "3"))), Name("x")))), 6),
+    (Let("x", Lit(1), Count(Mul(ArrayLit((4, 5, 6)), Name("x")))), 3),
+]
+ECHO = Command("echo", (), ("hi",))
+JOBS = [  # (program, value)
+    ("let j = COM echo hi & in wait(j) end", "hi"),
+    ("let k = 0 in let j = COM echo hi & in wait(j + k) end end", "hi"),
+    (Let("j", Bg(ECHO), Let("k", Lit(0), Wait(Add(Name("j"), Name("k"))))), "hi"),
+]
+SEQ = Command("seq", (), ("1", "5"))
+STREAMS = [  # (program, value); the vm has no streams
+    ("let n = 2 in take(n, lines(COM seq 1 9)) end", "1\n2"),
+    ("let k = 3 in letfun big(x) = k < x in filter(big, lines(COM seq 1 5)) end end", "4\n5"),
+    ("let z = 10 in fold(letfun g(a) = letfun h(b) = a + b in h end in g end, z, lines(COM seq 1 5)) end", 25),
+    (Let("n", Lit(2), Take(Name("n"), Lines(SEQ))), "1\n2"),
+    (Let("n", Lit(3), Letfun("f", Name("x"), Mul(Name("x"), Name("n")), Map(Name("f"), Lines(SEQ)))), "3\n6\n9\n12\n15"),
+    (Let("n", Lit(3), Letfun("f", Name("x"), Lt(Name("x"), Name("n")), Filter(Name("f"), Lines(SEQ)))), "1\n2"),
+    (Let("z", Lit(1), Letfun("g", Name("a"), Letfun("h", Name("b"), Add(Name("a"), Name("b")), Name("h")),
+                             Fold(Name("g"), Name("z"), Lines(SEQ)))), 16),
+]
+
+def program(p: str | Expr) -> Expr:
+    return get_ast_parser().parse(p) if isinstance(p, str) else p
+
+@pytest.mark.parametrize("level", LEVELS)
+@pytest.mark.parametrize("backend", BACKENDS)
+@pytest.mark.parametrize("p, expected", PROGRAMS)
+def test_programs(p, expected, backend, level):
+    ast, _ = optimize(program(p), level)
+    assert evaluate(ast, backend) == expected
+
+@pytest.mark.parametrize("level", LEVELS)
+@pytest.mark.parametrize("backend", BACKENDS)
+@pytest.mark.parametrize("p, expected", ARRAYS)
+def test_arrays(p, expected, backend, level):
+    ast, _ = optimize(program(p), level)
+    assert evaluate(ast, backend) == expected
+
+@pytest.mark.parametrize("level", LEVELS)
+@pytest.mark.parametrize("backend", BACKENDS)
+@pytest.mark.parametrize("p, expected", JOBS)
+def test_jobs(p, expected, backend, level):
+    ast, _ = optimize(program(p), level)
+    assert evaluate(ast, backend) == expected
+
+@pytest.mark.parametrize("level", LEVELS)
+@pytest.mark.parametrize("backend", ["tree", "compiled"])
+@pytest.mark.parametrize("p, expected", STREAMS)
+def test_streams(p, expected, backend, level):
+    ast, _ = optimize(program(p), level)
+    assert evaluate(ast, backend) == expected
@@ -0,0 +1,55 @@
+'''Which command operands the parallel pass forks, and that forked operands give their results in order.'''
+import time
+import pytest
+from interp import Command, Pipe, RedirectOut, RedirectIn, Filename, Eq, Lt, Fork, EvalError, Expr, prepare, eval
+
+def cmd(program: str, *arguments: str) -> Command:
+    return Command(program, (), arguments)
+
+def forked(e: Expr) -> bool:
+    return isinstance(prepare(e, parallel=True).body, Fork)
+
+NAP = cmd("sleep", "0.3")
+
+@pytest.mark.parametrize("e", [
+    Eq(NAP, NAP),  # numbers are never files
+    Eq(cmd("cat", "a"), cmd("cat", "b")),
+    Eq(RedirectOut(cmd("echo", "x"), Filename("f")), RedirectIn(cmd("cat"), Filename("g"))),
+])
+def test_independent_operands_fork(e):
+    assert forked(e)
+
+@pytest.mark.parametrize("e", [
+    Eq(cmd("rm", "f"), cmd("cat", "f")),
+    Eq(cmd("touch", "x"), cmd("cat", "x")),
+    Eq(cmd("cp", "a", "b"), cmd("wc", "b")),
+    Eq(RedirectOut(cmd("echo", "x"), Filename("f")), cmd("cat", "f")),
+    Eq(RedirectOut(cmd("echo", "x"), Filename("f")), RedirectIn(cmd("cat"), Filename("f"))),
+    Eq(RedirectOut(cmd("echo", "x"), Filename("f")), RedirectOut(cmd("echo", "y"), Filename("f"))),
+])
+def test_operands_naming_the_same_file_stay_in_order(e):
+    assert not forked(e)
+
+def test_forks_run_concurrently():
+    prog = prepare(Eq(NAP, NAP), parallel=True)
+    start = time.monotonic()
+    eval(prog)
+    assert time.monotonic() - start < 0.5  # two 0.3s naps, one after the other, would take 0.6s
+
+SLOW_B = Pipe(NAP, cmd("echo", "b"))  # finishes after the other operand
+
+@pytest.mark.parametrize("e, expected", [
+    (Lt(SLOW_B, cmd("echo", "c")), True),
+    (Lt(cmd("echo", "c"), SLOW_B), False),
+])
+def test_results_keep_operand_order(e, expected):
+    prog = prepare(e, parallel=True)
+    assert isinstance(prog.body, Fork)
+    assert eval(prog) is expected
+    assert eval(prepare(e)) is expected
+
+def test_first_failure_is_the_left_one():
+    prog = prepare(Eq(cmd("no-such-program-left"), Pipe(NAP, cmd("no-such-program-right"))), parallel=True)
+    assert isinstance(prog.body, Fork)
+    with pytest.raises(EvalError, match="no-such-program-left"):
+        eval(prog)
@@ -0,0 +1,82 @@
+'''Programs parsed from source text and evaluated on every backend.'''
+import pytest
+from parser import get_ast_parser
+from optimizer import optimize
+from interp import EvalError, Value, evaluate
+
+BACKENDS = ["tree", "compiled", "vm"]
+
+def value(source: str, backend: str = "tree", level: int = 0) -> Value:
+    ast = get_ast_parser().parse(source)
+    if level > 0:
+        ast, _ = optimize(ast, level)
+    return evaluate(ast, backend)
+
+@pytest.mark.parametrize("backend", BACKENDS)
+def test_jobs_builtins(backend):
+    assert value("wait(COM echo hi &)", backend) == "hi"
+    assert "echo hi" in value("jobs", backend)
+
+@pytest.mark.parametrize("backend", BACKENDS)
+def test_bindings_shadow_jobs_builtins(backend):
+    assert value("let wait = 1 in wait + 1 end", backend) == 2
+    assert value("let jobs = 1 in jobs end", backend) == 1
+    assert value("letfun wait(x) = x * 2 in wait(3) end", backend) == 6
+    assert value("letfun f(jobs) = jobs + 1 in f(2) end", backend) == 3
+    assert value("let x = (let wait = 1 in wait end) in wait(COM echo hi &) end", backend) == "hi"
+
+def test_builtin_needs_its_arguments():
+    with pytest.raises(EvalError, match="wait expects 1 argument"):
+        value("wait")
+
+@pytest.mark.parametrize("backend", ["tree", "compiled"])  # the vm has no streams
+def test_stream_builtins(backend):
+    double = "letfun double(x) = x * 2 in "
+    assert value(double + "fold(letfun g(a) = letfun h(b) = a + b in h end in g end, 0, "
+                 "map(double, lines(COM seq 1 4))) end", backend) == 20
+    assert value("take(2, lines(COM seq 1 9))", backend) == "1\n2"
+
+@pytest.mark.parametrize("backend", BACKENDS)
+def test_bindings_shadow_stream_builtins(backend):
+    assert value("let lines = 2 in lines * 3 end", backend) == 6
+    assert value("letfun map(x) = x + 1 in map(1) end", backend) == 2
+    assert value("letfun filter(x) = x in filter(true) end", backend) is True
+    assert value("let take = 4 in take end", backend) == 4
+    assert value("letfun fold(a) = letfun g(b) = a - b in g end in fold(5, 3) end", backend) == 2
+
+def test_several_arguments_are_applied_one_at_a_time():
+    assert value("letfun add(a) = letfun g(b) = a + b in g end in add(1, 2) end") == 3
+    with pytest.raises(EvalError, match="take expects 2 arguments"):
+        value("take(3)")
+
+@pytest.mark.parametrize("backend", BACKENDS)
+def test_array_builtins(backend):
+    assert value("sum([1, 2, 3] * 2)", backend) == 12
+    assert value("max(array(COM echo 4 12 9))", backend) == 12
+    assert value("count(array(COM seq 1 10))", backend) == 10
+    assert value("sum(array(COM seq 1 10) < 4)", backend) == 3
+
+@pytest.mark.parametrize("backend", BACKENDS)
+def test_bindings_shadow_array_builtins(backend):
+    assert value("let sum = 1 in sum + 1 end", backend) == 2
+    assert value("let count = 3 in count * count end", backend) == 9
+    assert value("letfun max(x) = x in max(3) end", backend) == 3
+    assert value("letfun array(x) = x < 2 in array(1) end", backend) is True
+    assert value("let s = sum([1, 2]) in let sum = 5 in s + sum end end", backend) == 8
+
+@pytest.mark.parametrize("backend", BACKENDS)
+def test_stderr_redirect_after_arguments(backend, monkeypatch, tmp_path):
+    monkeypatch.chdir(tmp_path)
+    assert value("COM ls nothere 2> err", backend) == "Error output written to err"
+    assert "nothere" in (tmp_path / "err").read_text()
+    assert value("COM echo 2 > out", backend) == "Output written to out"  # an argument, then stdout
+    assert (tmp_path / "out").read_text() == "2\n"
+
+@pytest.mark.parametrize("backend", BACKENDS)
+def test_stderr_input_after_arguments(backend, monkeypatch, tmp_path):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "inp").write_text("x\n")
+    assert value("COM echo hi 2< inp", backend) == "hi"  # not an argument "2" and a stdin redirect
+    assert value("COM echo 2 < inp", backend) == "2"
+    with pytest.raises(EvalError, match="missing"):
+        value("COM echo hi 2< missing", backend)
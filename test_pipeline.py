@@ -0,0 +1,40 @@
+'''How many processes programs and pipelines start.'''
+import pytest
+from parser import get_ast_parser
+from interp import Command, Pipe, prepare, eval
+from pipeline import Stage, run_pipeline
+from spawn import spawn_stats
+from builtin_commands import command_builtins
+
+@pytest.fixture(autouse=True)
+def processes():
+    '''Every command runs as a process: echo and the other builtins would start none.'''
+    enabled, command_builtins.enabled = command_builtins.enabled, False
+    yield
+    command_builtins.enabled = enabled
+
+def spawned(run) -> int:
+    before = spawn_stats.spawned
+    run()
+    return spawn_stats.spawned - before
+
+@pytest.mark.parametrize("source, cse, expected", [
+    ("(COM echo hi) == (COM echo hi)", False, 2),  # each operand evaluated once
+    ("(COM echo hi) == (COM echo hi)", True, 1),
+    ("((COM echo a) == (COM echo b)) == ((COM echo a) == (COM echo b))", False, 4),
+    ("((COM echo a) == (COM echo b)) == ((COM echo a) == (COM echo b))", True, 2),
+    ("letfun f(x) = (COM echo hi) == (COM echo hi) in f(1) == f(2) end", True, 2),
+])
+def test_spawns_per_program(source, cse, expected):
+    prog = prepare(get_ast_parser().parse(source), cse)
+    assert spawned(lambda: eval(prog)) == expected
+
+@pytest.mark.parametrize("stages", [1, 2, 3, 5])
+def test_one_spawn_per_pipeline_stage(stages):
+    pipeline = [Stage(["echo", "a b c"])] + [Stage(["cat"])] * (stages - 1)
+    assert spawned(lambda: run_pipeline(pipeline)) == stages
+    assert run_pipeline(pipeline).stdout == "a b c\n"
+
+def test_one_spawn_per_command_in_a_pipe():
+    prog = prepare(Pipe(Pipe(Command("echo", (), ("hi",)), Command("cat")), Command("wc", ("-c",))))
+    assert spawned(lambda: eval(prog)) == 3
@@ -0,0 +1,40 @@
+'''Parsed nodes record where they are in the source, and errors are reported at the node that raised them.'''
+import contextlib
+import io
+import pytest
+from parser import get_ast_parser, parse_and_run
+from optimizer import optimize
+from interp import EvalError, Let, evaluate, blame, where
+
+def text(source: str, node) -> str:
+    return source[node.span >> 32:node.span & 0xFFFFFFFF]
+
+def test_nodes_cover_their_operands():
+    source = "let x = 1 + 2 in x * 3 end"
+    let = get_ast_parser().parse(source)
+    assert isinstance(let, Let)
+    assert text(source, let) == "x = 1 + 2 in x * 3"  # keywords are not passed to the callbacks
+    assert text(source, let.defexpr) == "1 + 2"
+    assert text(source, let.bodyexpr) == "x * 3"
+
+def test_spans_are_not_part_of_equality():
+    a, b = get_ast_parser().parse("1 + 2"), get_ast_parser().parse(" 1 +  2")
+    assert a == b and hash(a) == hash(b) and a.span != b.span
+
+def test_error_is_blamed_on_its_node():
+    source = "let x = 0 in\n  5 + (1 / x)\nend"
+    with pytest.raises(EvalError) as err:
+        evaluate(get_ast_parser().parse(source))
+    assert where(source, blame(err.value)) == "line 2, column 8: 1 / x"
+
+def test_optimizer_errors_are_blamed_too():
+    source = "let y = 2 * 3 in y / (y - 6) end"
+    with pytest.raises(EvalError, match="Division by zero") as err:
+        optimize(get_ast_parser().parse(source), 2)
+    assert where(source, blame(err.value)) == "line 1, column 18: y / (y - 6"  # brackets are not in spans
+
+def test_run_prints_where():
+    out = io.StringIO()
+    with contextlib.redirect_stdout(out):
+        parse_and_run("let x = true in\nx + 1 end")
+    assert "(at line 2, column 1: x + 1)" in out.getvalue()
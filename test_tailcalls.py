@@ -0,0 +1,31 @@
+'''Tail calls run in constant stack on every backend: in if branches, let bodies and the right operands of && and ||.'''
+import pytest
+from parser import get_ast_parser
+from interp import EvalError, evaluate
+
+BACKENDS = ["tree", "compiled", "vm"]
+DEPTH = 20000  # twenty times Python's default recursion limit
+
+COUNTDOWNS = [  # (program, value)
+    (f"letfun c(n) = if n == 0 then 0 else c(n - 1) in c({DEPTH}) end", 0),
+    (f"letfun c(n) = if n == 0 then 7 else let m = n - 1 in c(m) end in c({DEPTH}) end", 7),
+    (f"letfun c(n) = n == 0 || c(n - 1) in c({DEPTH}) end", True),
+    (f"letfun c(n) = n < 1 || (true && c(n - 1)) in c({DEPTH}) end", True),
+    (f"letfun c(n) = if n == 0 then false else (n == n && c(n - 1)) in c({DEPTH}) end", False),
+]
+
+@pytest.mark.parametrize("backend", BACKENDS)
+@pytest.mark.parametrize("source, expected", COUNTDOWNS)
+def test_countdown(source, expected, backend):
+    assert evaluate(get_ast_parser().parse(source), backend) == expected
+
+@pytest.mark.parametrize("backend", BACKENDS)
+@pytest.mark.parametrize("source, error", [
+    ("true && 5", "Right operand is not a bool!"),
+    ("false || 5", "One of the operands is not a bool!"),
+    ("true && (false || 5)", "One of the operands is not a bool!"),  # the innermost operator reports it
+    ("letfun c(n) = if n == 0 then 5 else (false || (true && c(n - 1))) in c(10) end", "Right operand is not a bool!"),
+])
+def test_right_operand_must_be_a_bool(source, error, backend):
+    with pytest.raises(EvalError, match=error.replace("!", "")):
+        evaluate(get_ast_parser().parse(source), backend)
@@ -0,0 +1,85 @@
+'''The type checker: which programs it accepts and at what type, which it rejects, and that typing changes no result.'''
+import pytest
+from parser import get_ast_parser
+from interp import EvalError, Expr, resolve, evaluate
+from typecheck import INT, check
+
+BACKENDS = ["tree", "compiled", "vm"]
+
+def typed(source: str) -> tuple[Expr, str]:
+    prog = resolve(get_ast_parser().parse(source))
+    return prog, str(check(prog).of(prog))
+
+ACCEPTED = [  # (program, type)
+    ("1 + 2 * 3", "int"),
+    ("-4 / 2", "int"),
+    ("1 < 2 && !(true == false) || false", "bool"),
+    ("let x = 3 in if x == 3 then x else 0 end", "int"),
+    ("letfun f(n) = if n == 0 then 1 else n * f(n - 1) in f(5) end", "int"),
+    ("letfun id(x) = x in if id(true) then id(1) else 2 end", "int"),  # generic in x
+    ("letfun add(a) = letfun g(b) = a + b in g end in add(1) end", "(int -> int)"),
+    ("letfun not(b) = !b in not end", "(bool -> bool)"),
+    ("[1, 2] * 3", "int[]"),
+    ("sum([1, 2] < 2) + max([4, 5]) + count([1])", "int"),
+    ("COM echo hi", "str"),
+    ("COM echo hi &", "int"),
+    ("wait(COM echo hi &)", "str"),
+    ("take(2, lines(COM seq 1 9))", "stream of dyn"),
+]
+
+REJECTED = [  # (program, message)
+    ("1 + true", "expected int, got bool"),
+    ("true * true", "expected int, got bool"),
+    ("if 1 then 2 else 3", "expected bool, got int"),
+    ("if true then 1 else false", "expected int, got bool"),
+    ("1 && true", "expected bool, got int"),
+    ("!3", "expected bool, got int"),
+    ("(COM echo a) == (COM echo b)", "compare ints or bools"),
+    ("letfun f(x) = x(x) in f end", "can't take itself"),
+    ("letfun f(x) = x + 1 in f(true) end", "expected int, got bool"),
+    ("3(4)", "expected int"),
+    ("wait(true)", "expected int, got bool"),
+    ("sum(1)", "type error"),
+]
+
+@pytest.mark.parametrize("source, expected", ACCEPTED)
+def test_accepted(source, expected):
+    assert typed(source)[1] == expected
+
+@pytest.mark.parametrize("source, message", REJECTED)
+def test_rejected(source, message):
+    with pytest.raises(EvalError, match=message):
+        typed(source)
+
+@pytest.mark.parametrize("backend", BACKENDS)
+def test_rejected_before_running(backend, monkeypatch, tmp_path):
+    monkeypatch.chdir(tmp_path)
+    with pytest.raises(EvalError, match="type error"):
+        evaluate(get_ast_parser().parse("if true then COM touch ran else 1 + true"), backend, typed=True)
+    assert not (tmp_path / "ran").exists()
+
+# closures and arrays have no equality, and every job gets a new number
+SAME = [p for p, t in ACCEPTED if t in ("int", "bool", "str") and "&" not in p] + [
+    "letfun fib(n) = if n < 2 then n else fib(n - 1) + fib(n - 2) in fib(15) end",
+    "let x = 7 in if (x < 8) == (x == 7) then x / 2 + -x * 3 else 0 end",
+    "letfun c(n) = n == 0 || c(n - 1) in c(2000) end",
+    "sum([1, 2, 3, 4] < 3) + count([1, 2])",
+]
+
+@pytest.mark.parametrize("backend", BACKENDS)
+@pytest.mark.parametrize("source", SAME)
+def test_typed_and_untyped_agree(source, backend):
+    ast = get_ast_parser().parse(source)
+    assert evaluate(ast, backend, typed=True) == evaluate(ast, backend)
+
+def test_unchecked_only_when_static():
+    '''The compiled backend leaves out the runtime checks of nodes the checker proved, unless some type is dynamic.'''
+    for source, static in [("1 + 2", True), ("let s = take(1, lines(COM seq 1 3)) in 1 + 2 end", False)]:
+        prog = resolve(get_ast_parser().parse(source))
+        typing = check(prog)
+        assert typing.unchecked(INT, prog.body) is static
+
+def test_any_depth():
+    terms = 20000  # twenty times Python's default recursion limit
+    ast = get_ast_parser().parse(" + ".join(["1"] * terms))
+    assert evaluate(ast, "vm", typed=True) == terms
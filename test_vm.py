@@ -0,0 +1,15 @@
+'''The bytecode VM compiles and runs expressions of any depth, parsed from source text.'''
+import pytest
+from parser import get_ast_parser
+from interp import evaluate
+
+TERMS = 20000  # twenty times Python's default recursion limit
+
+@pytest.mark.parametrize("source, expected", [
+    (" + ".join(["1"] * TERMS), TERMS),  # left-nested
+    ("(1 + " * TERMS + "0" + ")" * TERMS, TERMS),  # right-nested
+    ("let x = 2 in " + " * ".join(["x"] * 64) + " end", 2 ** 64),
+    ("if " + " && ".join(["true"] * TERMS) + " then 1 else 0", 1),
+], ids=["sum", "nested sum", "product", "conjunction"])
+def test_deep_expressions(source, expected):
+    assert evaluate(get_ast_parser().parse(source), "vm") == expected
@@ -0,0 +1,358 @@
+'''
+Static types for resolved programs, turned on with run(e, typed=True). check() infers a type for every node,
+Hindley-Milner style: a letfun's parameter and result start as type variables that its body and its uses pin
+down, and a letfun is generic in whatever is left open (letfun id(x) = x can be applied to an int and to a
+bool). Ill-typed programs are rejected with an EvalError before anything runs, so no process is spawned.
+
+The checker is stricter than eval() where eval() is loose: + - * / and unary - take ints (or int arrays),
+== and < compare two ints or two bools (element-wise for arrays), and && || ! and if conditions take bools.
+So true * true, a string times a string and comparing command outputs with == are type errors here.
+Command output, redirects and job output are strings; background jobs are ints.
+
+The values of lines(...) are only known when they are read (a line is an int when it looks like one), so they
+get the dynamic type, which fits anywhere. Such programs are still checked, but keep their runtime checks.
+For the rest, Typing.unchecked tells the closure compiler which nodes can skip them (see compiler.compile).
+'''
+from typing import Any, Callable
+from dataclasses import dataclass, field
+from itertools import count
+from interp import (Add, Sub, Mul, Div, Neg, Lit, And, Or, Not, Local, Let, Eq, Lt, If, Letfun, App, Block, Memo, Fork,
+                    Command, Pipe, RedirectOut, RedirectIn, RedirectErrorOut, RedirectErrorIn, Append, Bg, Wait, Jobs,
+                    Sequence, Lines, Map, Filter, Take, Fold, ArrayLit, ToArray, Sum, Max, Count, EvalError, Expr)
+
+#TYPES
+@dataclass(frozen=True)
+class Base():
+    name: str
+    def __str__(self) -> str:
+        return self.name
+
+INT, BOOL, STR, DYN = Base("int"), Base("bool"), Base("str"), Base("dyn")
+
+numbering = count()
+
+@dataclass(eq=False)  # each variable is its own type; unification binds it by setting ref
+class Var():
+    ref: "Type | None" = None
+    comparable: bool = False  # compared with == or <, so it may only become int or bool
+    number: int = field(default_factory=lambda: next(numbering))
+    def __str__(self) -> str:
+        return f"'t{self.number}"
+
+@dataclass(frozen=True)
+class Fun():
+    param: "Type"
+    result: "Type"
+    def __str__(self) -> str:
+        return f"({self.param} -> {self.result})"
+
+@dataclass(frozen=True)
+class Arr():
+    elem: "Type"
+    def __str__(self) -> str:
+        return f"{self.elem}[]"
+
+@dataclass(frozen=True)
+class Strm():
+    elem: "Type"
+    def __str__(self) -> str:
+        return f"stream of {self.elem}"
+
+@dataclass(frozen=True)
+class Scheme():
+    '''The type of a generic letfun: vars are instantiated afresh at every use.'''
+    vars: tuple[Var, ...]
+    type: "Type"
+
+type Type = Base | Var | Fun | Arr | Strm
+
+def prune(t: Type) -> Type:
+    while type(t) is Var and t.ref is not None:
+        t = t.ref
+    return t
+
+def zonk(t: Type) -> Type:
+    '''t with every bound variable replaced by what it is bound to.'''
+    match prune(t):
+        case Fun(p, r):
+            return Fun(zonk(p), zonk(r))
+        case Arr(x):
+            return Arr(zonk(x))
+        case Strm(x):
+            return Strm(zonk(x))
+        case t:
+            return t
+
+def occurs(v: Var, t: Type) -> bool:
+    match prune(t):
+        case Fun(p, r):
+            return occurs(v, p) or occurs(v, r)
+        case Arr(x) | Strm(x):
+            return occurs(v, x)
+        case t:
+            return t is v
+
+def variables(t: Type, found: dict[int, Var]) -> dict[int, Var]:
+    match prune(t):
+        case Var() as v:
+            found[id(v)] = v
+        case Fun(p, r):
+            variables(p, found)
+            variables(r, found)
+        case Arr(x) | Strm(x):
+            variables(x, found)
+    return found
+
+#INFERENCE
+class Typing:
+    '''The inferred type of every node of one program.'''
+    def __init__(self):
+        self.known: dict[int, tuple[Expr, Type]] = {}  # id(node) -> (node, type); holding node keeps the id valid
+        self.dynamic = False  # some value's type is only known at run time
+        self.frames: list[dict[int, Type | Scheme]] = []  # slot -> type, innermost frame last
+
+    def of(self, e: Expr) -> Type:
+        return zonk(self.known[id(e)][1])
+
+    def unchecked(self, t: Type, *nodes: Expr) -> bool:
+        '''Whether nodes are all statically of type t, so code that uses their values needs no runtime check.'''
+        return not self.dynamic and all(self.of(n) == t for n in nodes)
+
+    def unify(self, expected: Type, actual: Type, e: Expr) -> None:
+        a, b = prune(expected), prune(actual)
+        if a is b:
+            return
+        if a is DYN or b is DYN:
+            for t in (a, b):
+                if type(t) is Var:
+                    t.ref = DYN
+            return
+        if type(a) is Var:
+            return self.bind(a, b, e)
+        if type(b) is Var:
+            return self.bind(b, a, e)
+        match (a, b):
+            case (Fun(p1, r1), Fun(p2, r2)):
+                self.unify(p1, p2, e)
+                self.unify(r1, r2, e)
+                return
+            case (Arr(x1), Arr(x2)) | (Strm(x1), Strm(x2)):
+                return self.unify(x1, x2, e)
+        raise EvalError(f"type error in {e}: expected {zonk(a)}, got {zonk(b)}")
+
+    def bind(self, v: Var, t: Type, e: Expr) -> None:
+        if occurs(v, t):
+            raise EvalError(f"type error in {e}: a function can't take itself as an argument")
+        if v.comparable:
+            if type(t) is Var:
+                t.comparable = True
+            elif t not in (INT, BOOL):
+                raise EvalError(f"type error in {e}: == and < compare ints or bools, not {zonk(t)}")
+        v.ref = t
+
+    def generalize(self, t: Type) -> Scheme:
+        free: dict[int, Var] = {}
+        for frame in self.frames:
+            for s in frame.values():
+                if type(s) is Scheme:
+                    bound = {id(v) for v in s.vars}
+                    free.update((k, v) for k, v in variables(s.type, {}).items() if k not in bound)
+                else:
+                    variables(s, free)
+        return Scheme(tuple(v for k, v in variables(t, {}).items() if k not in free), t)
+
+    def instantiate(self, s: Scheme) -> Type:
+        fresh = {id(v): Var(comparable=v.comparable) for v in s.vars}
+        def copy(t: Type) -> Type:
+            match prune(t):
+                case Var() as v:
+                    return fresh.get(id(v), v)
+                case Fun(p, r):
+                    return Fun(copy(p), copy(r))
+                case Arr(x):
+                    return Arr(copy(x))
+                case Strm(x):
+                    return Strm(copy(x))
+                case t:
+                    return t
+        return copy(s.type)
+
+    def ints(self, e: Expr, *ts: Type) -> Type:
+        '''+ - * / and unary -, given their operands' types: ints, or int arrays (an int applies to every element).'''
+        ts = [prune(t) for t in ts]
+        if not any(type(t) is Arr for t in ts):
+            for t in ts:
+                self.unify(INT, t, e)
+            return INT
+        for t in ts:
+            self.unify(INT, t.elem if type(t) is Arr else t, e)
+        return Arr(INT)
+
+    def compare(self, e: Expr, tl: Type, tr: Type) -> Type:
+        tl, tr = prune(tl), prune(tr)
+        elem = Var(comparable=True)
+        if type(tl) is Arr or type(tr) is Arr:
+            for t in (tl, tr):
+                self.unify(elem, t.elem if type(t) is Arr else t, e)
+            if type(e) is Lt:
+                self.unify(INT, elem, e)
+            return Arr(BOOL)
+        self.unify(elem, tl, e)
+        self.unify(elem, tr, e)
+        return BOOL
+
+    def infer(self, e: Expr) -> Type:
+        '''Types e and every node in it, with a work stack rather than recursion, so any depth can be checked.'''
+        # the work stack holds nodes still to type and callables that finish a node once its children are typed;
+        # children are pushed in reverse, so they are typed in source order and their types come off `types` in it
+        work: list[Any] = [e]
+        types: list[Type] = []
+        while work:
+            item = work.pop()
+            if callable(item):
+                item()
+            else:
+                self.visit(item, work, types)
+        return types.pop()
+
+    def visit(self, e: Expr, work: list[Any], types: list[Type]) -> None:
+        def typed(t: Type) -> None:
+            self.known[id(e)] = (e, t)
+            types.append(t)
+
+        def then(n: int, rule):
+            '''Finishes e with rule applied to the types of its last n children.'''
+            def finish():
+                ts = types[len(types) - n:]
+                del types[len(types) - n:]
+                typed(rule(*ts))
+            return finish
+
+        def expect(t: Type):
+            '''Unifies t with the type of the child just typed, before the next one is.'''
+            return lambda: self.unify(t, types[-1], e)
+
+        def last(*ts: Type) -> Type:
+            return ts[-1]
+
+        match e:
+            case Lit(bool()):
+                typed(BOOL)
+            case Lit(int()):
+                typed(INT)
+            case Lit(_):
+                typed(STR)
+            case Local(_, depth, slot):
+                t = self.frames[-1 - depth][slot]
+                typed(self.instantiate(t) if type(t) is Scheme else t)
+            case Add(l, r) | Sub(l, r) | Mul(l, r) | Div(l, r):
+                work += [then(2, lambda tl, tr: self.ints(e, tl, tr)), r, l]
+            case Neg(s):
+                work += [then(1, lambda ts: self.ints(e, ts)), s]
+            case Eq(l, r) | Lt(l, r):
+                work += [then(2, lambda tl, tr: self.compare(e, tl, tr)), r, l]
+            case And(l, r) | Or(l, r):
+                work += [then(2, lambda tl, tr: BOOL), expect(BOOL), r, expect(BOOL), l]
+            case Not(s):
+                work += [then(1, lambda ts: BOOL), expect(BOOL), s]
+            case If(c, t, f):
+                def branches(tc: Type, tt: Type, tf: Type) -> Type:
+                    self.unify(tt, tf, e)
+                    return tt
+                work += [then(3, branches), f, t, expect(BOOL), c]
+            case Let(_, d, b, slot):
+                def bind():
+                    self.frames[-1][slot] = types[-1]
+                work += [then(2, last), b, bind, d]
+            case Letfun(_, _, b, i, slot, _, _):
+                param, result = Var(), Var()
+                self.frames[-1][slot] = Fun(param, result)  # not generic inside its own body
+                self.frames.append({0: param})
+                def generic():
+                    self.unify(result, types[-1], e)
+                    self.frames.pop()
+                    del self.frames[-1][slot]  # else its own variables would count as bound outside it
+                    self.frames[-1][slot] = self.generalize(Fun(param, result))
+                work += [then(2, last), i, generic, b]
+            case App(f, a):
+                def app(tf: Type, ta: Type) -> Type:
+                    result = Var()
+                    self.unify(tf, Fun(ta, result), e)  # so a bad argument reads "expected <param type>"
+                    return result
+                work += [then(2, app), a, f]
+            case Block(_, b):
+                self.frames.append({})
+                def block(t: Type) -> Type:
+                    self.frames.pop()
+                    return t
+                work += [then(1, block), b]
+            case Memo(_, m):
+                work += [then(1, last), m]
+            case Fork(memos, b):
+                work += [then(len(memos) + 1, last), b, *reversed(memos)]
+            case Command() | Pipe() | RedirectErrorOut() | RedirectErrorIn() | Sequence() | Jobs():
+                typed(STR)
+            case RedirectOut(Command() | Pipe(), _) | Append(Command() | Pipe(), _) | RedirectIn(Command(), _):
+                typed(STR)
+            case RedirectOut(x, _) | Append(x, _):
+                work += [then(1, lambda t: STR), x]  # written out whatever it is
+            case RedirectIn(x, _):
+                work += [then(1, last), x]
+            case Bg(_):
+                typed(INT)
+            case Wait(j):
+                work += [then(1, lambda t: STR), expect(INT), j]
+            case Lines(x):
+                self.dynamic = True
+                if isinstance(x, (Command, Pipe, RedirectIn, RedirectErrorIn, RedirectErrorOut)):
+                    typed(Strm(DYN))
+                    return
+                def lines(t: Type) -> Type:
+                    t = prune(t)
+                    if type(t) is Strm:
+                        return t
+                    self.unify(STR, t, e)
+                    return Strm(DYN)
+                work += [then(1, lines), x]
+            case Map(f, s):
+                a, b = Var(), Var()
+                work += [then(2, lambda tf, ts: Strm(b)), expect(Strm(a)), s, expect(Fun(a, b)), f]
+            case Filter(f, s):
+                a = Var()
+                work += [then(2, lambda tf, ts: Strm(a)), expect(Strm(a)), s, expect(Fun(a, BOOL)), f]
+            case Take(n, s):
+                a = Var()
+                work += [then(2, lambda tn, ts: Strm(a)), expect(Strm(a)), s, expect(INT), n]
+            case Fold(f, z, s):
+                a = Var()
+                def step():  # the accumulator's type is known first, then the function's
+                    self.unify(Fun(types[-2], Fun(a, types[-2])), types[-1], e)
+                work += [then(3, lambda tz, tf, ts: tz), expect(Strm(a)), s, step, f, z]
+            case ArrayLit(_):
+                typed(Arr(INT))
+            case ToArray(x):
+                def to_array(t: Type) -> Type:
+                    match prune(t):
+                        case Arr() as t:
+                            return t
+                        case Strm(a):
+                            self.unify(INT, a, e)
+                        case t:
+                            self.unify(STR, t, e)
+                    return Arr(INT)
+                work += [then(1, to_array), x]
+            case Sum(x) | Count(x):
+                work += [then(1, lambda t: INT), expect(Arr(Var())), x]
+            case Max(x):
+                elem = Var()
+                work += [then(1, lambda t: elem), expect(Arr(elem)), x]
+            case _:
+                raise EvalError(f"type error: no type for {e}")
+
+def check(e: Expr) -> Typing:
+    '''Types a program from resolve() (or prepare()); raises EvalError when it is ill-typed.'''
+    if not isinstance(e, Block):
+        raise ValueError("check() needs a resolved program, run resolve() first")
+    typing = Typing()
+    typing.infer(e)
+    return typing
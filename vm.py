@@ -0,0 +1,355 @@
+'''
+Bytecode backend. compile() flattens an AST into a compact array of opcodes and operands, and execute()
+runs it with an explicit operand stack and call stack, so neither compiling nor running recurses in Python:
+a `1 + 1 + ... + 1` chain of any length only grows the two stacks. Names are resolved to (depth, slot)
+addresses while compiling, exactly like interp.resolve() does. Nodes that run processes become EVAL
+instructions that hand the node back to interp.eval.
+'''
+from typing import List, Any
+from dataclasses import dataclass, field
+from array import array
+from functools import partial
+from interp import (Add, Sub, Mul, Div, Neg, Lit, And, Or, Not, Name, Let, Eq, Lt, If, Letfun, App, Wait, Lines, Map,
+                    Filter, Take, Fold, ArrayLit, ToArray, Sum, Max, Count, Array, Closure, EvalError, Expr, Value, Scope,
+                    eval, newFrame, builtin, wait_job, array_of, to_array, vector, reduce_array)
+
+#OPCODES (operands follow the opcode in the code array)
+CONST = 0         # k: push consts[k]
+LOAD = 1          # depth slot: push the binding
+STORE = 2         # slot: pop into the current frame
+ADD = 3
+SUB = 4
+MUL = 5
+DIV = 6
+NEG = 7
+LT = 8
+EQ = 9
+NOT = 10
+JUMP = 11         # target
+JUMP_IF_NOT = 12  # target: pop the If condition, jump when false
+AND_LEFT = 13     # target: pop the left operand, short-circuit to target with False
+AND_RIGHT = 14    # check the right operand left on the stack
+OR_LEFT = 15      # target: pop the left operand, short-circuit to target with True
+OR_RIGHT = 16
+CLOSURE = 17      # entry size slot k: store a closure over the current frame, consts[k] = (param, body)
+CALL = 18         # pop argument and function, enter the function (a tail call when a RET follows)
+RET = 19          # leave the function, its result stays on the stack
+EVAL = 20         # k: push interp.eval(consts[k]), for commands and other process nodes
+HALT = 21
+WAIT = 22         # replace the job number on the stack by the job's output
+BUILTIN = 23      # k: replace the value on the stack by consts[k](value), for array() and the reductions
+
+NAMES = ["CONST", "LOAD", "STORE", "ADD", "SUB", "MUL", "DIV", "NEG", "LT", "EQ", "NOT", "JUMP", "JUMP_IF_NOT",
+         "AND_LEFT", "AND_RIGHT", "OR_LEFT", "OR_RIGHT", "CLOSURE", "CALL", "RET", "EVAL", "HALT", "WAIT",
+         "BUILTIN"]
+OPERANDS = {CONST: 1, LOAD: 2, STORE: 1, JUMP: 1, JUMP_IF_NOT: 1, AND_LEFT: 1, OR_LEFT: 1, CLOSURE: 4, EVAL: 1, BUILTIN: 1}
+
+@dataclass
+class Code():
+    code: array = field(default_factory=lambda: array("i"))
+    consts: List[Any] = field(default_factory=list)
+    size: int = 0  # frame size of the top level
+
+    def __str__(self) -> str:
+        return dis(self)
+
+def dis(prog: Code) -> str:
+    lines = []
+    pc = 0
+    while pc < len(prog.code):
+        op = prog.code[pc]
+        n = OPERANDS.get(op, 0)
+        args = list(prog.code[pc + 1:pc + 1 + n])
+        note = f"  ; {prog.consts[args[0]]}" if op in (CONST, EVAL, BUILTIN) else ""
+        lines.append(f"{pc:5} {NAMES[op]:<12} {' '.join(map(str, args))}{note}")
+        pc += 1 + n
+    return "\n".join(lines)
+
+#COMPILER
+class Compiler:
+    def __init__(self):
+        self.prog = Code()
+        self.labels: List[int] = []
+        self.fixups: List[int] = []  # positions in code that hold a label number to patch
+
+    def emit(self, *words: int) -> None:
+        self.prog.code.extend(words)
+
+    def const(self, v: Any) -> int:
+        self.prog.consts.append(v)
+        return len(self.prog.consts) - 1
+
+    def label(self) -> int:
+        self.labels.append(-1)
+        return len(self.labels) - 1
+
+    def jump(self, op: int, label: int) -> None:
+        self.emit(op, label)
+        self.fixups.append(len(self.prog.code) - 1)
+
+    def compile(self, e: Expr) -> Code:
+        top = Scope()
+        # the work stack holds ("node", expr, scope) items still to compile and callables that emit code;
+        # children are pushed in reverse so they come off the stack in source order
+        work: List[Any] = [lambda: self.emit(HALT), ("node", e, top)]
+        while work:
+            item = work.pop()
+            if callable(item):
+                item()
+            else:
+                self.node(item[1], item[2], work)
+
+        for pos in self.fixups:
+            self.prog.code[pos] = self.labels[self.prog.code[pos]]
+        self.prog.size = top.size
+        return self.prog
+
+    def node(self, e: Expr, scope: Scope, work: List[Any]) -> None:
+        def op(*words: int):
+            return lambda: self.emit(*words)
+
+        def place(label: int):
+            def mark():
+                self.labels[label] = len(self.prog.code)
+            return mark
+
+        def jump(opcode: int, label: int):
+            return lambda: self.jump(opcode, label)
+
+        match e:
+            case Lit(bool(v)) | Lit(int(v)):
+                self.emit(CONST, self.const(v))
+            case Name(_) | App(_, _) if (call := builtin(e, scope)) is not None:
+                work.append(("node", call, scope))
+            case Name(n):
+                found = scope.find(n)
+                if found is None:
+                    raise EvalError(f"unbound name {n}")
+                self.emit(LOAD, *found)
+
+            case Add(l, r) | Sub(l, r) | Mul(l, r) | Div(l, r) | Lt(l, r) | Eq(l, r):
+                opcode = {Add: ADD, Sub: SUB, Mul: MUL, Div: DIV, Lt: LT, Eq: EQ}[type(e)]
+                work += [op(opcode), ("node", r, scope), ("node", l, scope)]
+            case Neg(s):
+                work += [op(NEG), ("node", s, scope)]
+            case Not(s):
+                work += [op(NOT), ("node", s, scope)]
+
+            case And(l, r):
+                end = self.label()
+                work += [place(end), op(AND_RIGHT), ("node", r, scope), jump(AND_LEFT, end), ("node", l, scope)]
+            case Or(l, r):
+                end = self.label()
+                work += [place(end), op(OR_RIGHT), ("node", r, scope), jump(OR_LEFT, end), ("node", l, scope)]
+            case If(c, t, f):
+                other, end = self.label(), self.label()
+                work += [place(end), ("node", f, scope), place(other), jump(JUMP, end),
+                         ("node", t, scope), jump(JUMP_IF_NOT, other), ("node", c, scope)]
+
+            case Let(n, d, b):
+                def bind():
+                    slot, shadowed = scope.bind(n)
+                    self.emit(STORE, slot)
+                    work.append(lambda: scope.unbind(n, shadowed))
+                    work.append(("node", b, scope))
+                work += [bind, ("node", d, scope)]
+            case Letfun(n, p, b, i):
+                # the body is laid out inline and jumped over; CLOSURE points at its entry.
+                # The name is bound first so the body can call itself.
+                slot, shadowed = scope.bind(n)
+                inner = Scope(scope)
+                inner.bind(p.name)
+                entry, skip = self.label(), self.label()
+                def closure():
+                    self.jump(CLOSURE, entry)
+                    self.emit(inner.size, slot, self.const((p.name, b)))
+                work += [lambda: scope.unbind(n, shadowed), ("node", i, scope), closure, place(skip), op(RET),
+                         ("node", b, inner), place(entry), jump(JUMP, skip)]
+            case App(f, a):
+                work += [op(CALL), ("node", a, scope), ("node", f, scope)]
+            case Wait(j):
+                work += [op(WAIT), ("node", j, scope)]
+            case Lines(_) | Map(_, _) | Filter(_, _) | Take(_, _) | Fold(_, _, _):
+                raise EvalError("Streams are not supported by the vm backend")  # closures would have to re-enter the vm
+            case ArrayLit(values):
+                self.emit(CONST, self.const(array_of(values)))
+            case ToArray(s):
+                work += [lambda: self.emit(BUILTIN, self.const(to_array)), ("node", s, scope)]
+            case Sum(s) | Max(s) | Count(s):
+                f = partial(reduce_array, {Sum: "sum", Max: "max", Count: "count"}[type(e)])
+                work += [lambda: self.emit(BUILTIN, self.const(f)), ("node", s, scope)]
+
+            case _:
+                self.emit(EVAL, self.const(e))
+
+def compile(e: Expr) -> Code:
+    return Compiler().compile(e)
+
+#VIRTUAL MACHINE
+def execute(prog: Code) -> Value:
+    code, consts = prog.code, prog.consts
+    stack: List[Value] = []
+    calls: List[tuple] = []  # (return pc, caller frame)
+    frame = newFrame(prog.size)
+    pc = 0
+    while True:
+        op = code[pc]
+        if op == LOAD:
+            f = frame
+            for _ in range(code[pc + 1]):
+                f = f.parent
+            stack.append(f.slots[code[pc + 2]])
+            pc += 3
+        elif op == CONST:
+            stack.append(consts[code[pc + 1]])
+            pc += 2
+        elif op == ADD:
+            rv = stack.pop()
+            lv = stack[-1]
+            if type(lv) is int and type(rv) is int:
+                stack[-1] = lv + rv
+            elif isinstance(lv, bool) or isinstance(rv, bool):
+                raise EvalError("One of the operands is a bool")
+            elif type(lv) is Array or type(rv) is Array:
+                stack[-1] = vector("+", lv, rv)
+            else:
+                raise EvalError("addition of non-integers")
+            pc += 1
+        elif op == SUB:
+            rv = stack.pop()
+            lv = stack[-1]
+            if type(lv) is Array or type(rv) is Array:
+                stack[-1] = vector("-", lv, rv)
+            elif (type(lv) != int) or (type(rv) != int):
+                raise EvalError("subtraction of non integers!")
+            else:
+                stack[-1] = lv - rv
+            pc += 1
+        elif op == MUL:
+            rv = stack.pop()
+            lv = stack[-1]
+            if type(lv) is Array or type(rv) is Array:
+                stack[-1] = vector("*", lv, rv)
+            elif type(lv) != type(rv):
+                raise EvalError("Less than operation on two variables that arent the same type@!")
+            else:
+                stack[-1] = lv * rv
+            pc += 1
+        elif op == DIV:
+            rv = stack.pop()
+            lv = stack[-1]
+            if isinstance(lv, bool) or isinstance(rv, bool):
+                raise EvalError("One of the operands is a bool")
+            if type(lv) is Array or type(rv) is Array:
+                stack[-1] = vector("/", lv, rv)
+            elif isinstance(lv, int) and rv == 0:
+                raise EvalError("Division by zero!")
+            else:
+                stack[-1] = lv // rv
+            pc += 1
+        elif op == NEG:
+            if type(stack[-1]) is Array:
+                stack[-1] = vector("-", 0, stack[-1])
+            elif type(stack[-1]) is not int:
+                raise EvalError
+            else:
+                stack[-1] = -1 * stack[-1]
+            pc += 1
+        elif op == LT:
+            rv = stack.pop()
+            lv = stack[-1]
+            if type(lv) is Array or type(rv) is Array:
+                stack[-1] = vector("<", lv, rv)
+            elif type(lv) != type(rv):
+                raise EvalError("Less than operation on two variables that arent the same type@!")
+            else:
+                stack[-1] = lv < rv
+            pc += 1
+        elif op == EQ:
+            rv = stack.pop()
+            lv = stack[-1]
+            if type(lv) is Array or type(rv) is Array:
+                stack[-1] = vector("==", lv, rv)
+            elif type(rv) != type(lv):
+                stack[-1] = False
+            elif isinstance(lv, (bool, int)):
+                stack[-1] = lv == rv
+            elif isinstance(lv, str):
+                stack[-1] = "The strings are equal!" if lv == rv else "The strings are not the same!"
+            else:
+                raise EvalError("Type is not bool, nor int, nor command!")
+            pc += 1
+        elif op == NOT:
+            if not isinstance(stack[-1], bool):
+                raise EvalError("Not expects a boolean")
+            stack[-1] = not stack[-1]
+            pc += 1
+        elif op == JUMP:
+            pc = code[pc + 1]
+        elif op == JUMP_IF_NOT:
+            bv = stack.pop()
+            if not isinstance(bv, bool):
+                raise EvalError("First operand in If statement is not a bool!")
+            pc = pc + 2 if bv else code[pc + 1]
+        elif op == AND_LEFT:
+            lv = stack.pop()
+            if not isinstance(lv, bool):
+                raise EvalError("Left operand is not a bool")
+            if lv:
+                pc += 2
+            else:
+                stack.append(False)
+                pc = code[pc + 1]
+        elif op == AND_RIGHT:
+            if not isinstance(stack[-1], bool):
+                raise EvalError("Right operand is not a bool!")
+            pc += 1
+        elif op == OR_LEFT:
+            lv = stack.pop()
+            if type(lv) != bool:
+                raise EvalError("LHS isnt bool!")
+            if lv:
+                stack.append(True)
+                pc = code[pc + 1]
+            else:
+                pc += 2
+        elif op == OR_RIGHT:
+            if not isinstance(stack[-1], bool):
+                raise EvalError("One of the operands is not a bool!")
+            pc += 1
+        elif op == STORE:
+            frame.slots[code[pc + 1]] = stack.pop()
+            pc += 2
+        elif op == CLOSURE:
+            param, body = consts[code[pc + 4]]
+            frame.slots[code[pc + 3]] = Closure(param, body, frame, code[pc + 2], code[pc + 1])
+            pc += 5
+        elif op == CALL:
+            arg = stack.pop()
+            fun = stack.pop()
+            if not isinstance(fun, Closure):
+                raise EvalError("Application of a non-function!")
+            # a call whose result is returned straight away reuses the caller's return record
+            nxt = pc + 1
+            while code[nxt] == JUMP:
+                nxt = code[nxt + 1]
+            if code[nxt] != RET:
+                calls.append((pc + 1, frame))
+            frame = newFrame(fun.size, fun.env)
+            frame.slots[0] = arg
+            pc = fun.code
+        elif op == RET:
+            pc, frame = calls.pop()
+        elif op == EVAL:
+            stack.append(eval(consts[code[pc + 1]], frame))
+            pc += 2
+        elif op == HALT:
+            return stack.pop()
+        elif op == WAIT:
+            stack[-1] = wait_job(stack[-1])
+            pc += 1
+        elif op == BUILTIN:
+            stack[-1] = consts[code[pc + 1]](stack[-1])
+            pc += 2
+        else:
+            raise EvalError(f"bad opcode {op} at {pc}")
@@ -0,0 +1,70 @@
+'''
+Bounded thread pool that Fork nodes (see parallel.py) run their operands on.
+
+A task only goes to the pool when a worker is free right now; otherwise it runs in the calling thread.
+Nothing ever waits in the pool's queue, so a worker that forks again cannot deadlock waiting for tasks
+that have no worker to run them.
+'''
+import os
+import threading
+import contextvars
+from typing import Any, Callable, List
+from concurrent.futures import Future, ThreadPoolExecutor
+
+class WorkerPool:
+    def __init__(self, workers: int = min(8, (os.cpu_count() or 1) + 4)):
+        self.workers = workers
+        self.sequential = os.environ.get("EXPR_SEQUENTIAL", "") not in ("", "0")  # for debugging: run every task in order
+        self.executor: ThreadPoolExecutor | None = None
+        self.free = threading.Semaphore(workers)
+
+    def submit(self, task: Callable[[], Any]) -> Future | None:
+        if not self.free.acquire(blocking=False):
+            return None
+        if self.executor is None:
+            self.executor = ThreadPoolExecutor(self.workers, thread_name_prefix="expr-worker")
+
+        def release() -> Any:
+            try:
+                return task()
+            finally:
+                self.free.release()
+        return self.executor.submit(contextvars.copy_context().run, release)  # e.g. the evaluation's memo table
+
+    def run_all(self, tasks: List[Callable[[], Any]]) -> List[Any]:
+        '''
+        Runs the tasks concurrently and returns their results in order. Tasks that get no worker run here, in order,
+        while the others run on the pool. Once every started task has finished, the exception of the first task
+        (in order) that failed is raised; tasks after a failed one that had not started yet are not run.
+        '''
+        if self.sequential or len(tasks) < 2:
+            return [task() for task in tasks]
+        futures = [self.submit(task) for task in tasks[:-1]] + [None]  # the last one always runs here
+        outcomes: List[tuple[bool, Any] | None] = [None] * len(tasks)
+        for i, (task, future) in enumerate(zip(tasks, futures)):
+            if future is None:
+                try:
+                    outcomes[i] = (True, task())
+                except Exception as err:
+                    outcomes[i] = (False, err)
+                    break
+        for i, future in enumerate(futures):
+            if future is not None:
+                err = future.exception()
+                outcomes[i] = (True, future.result()) if err is None else (False, err)
+        results: List[Any] = []
+        for outcome in outcomes:
+            if outcome is None:
+                break  # never started, after a failure
+            ok, value = outcome
+            if not ok:
+                raise value
+            results.append(value)
+        return results
+
+    def shutdown(self) -> None:
+        if self.executor is not None:
+            self.executor.shutdown()
+            self.executor = None
+
+worker_pool = WorkerPool()